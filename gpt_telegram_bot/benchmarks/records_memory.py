@@ -0,0 +1,75 @@
+"""Память кэша настроек пользователей: словари строк против записей UserSettings.
+
+Словарь повторяет прежний формат DatabaseService.get_user_settings
+(все колонки, включая id, created_at и updated_at).
+
+Запуск: python benchmarks/records_memory.py
+"""
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.records import HistoryTurn, UserSettings
+
+SIZES = (100_000, 1_000_000)
+TIMESTAMP = "2024-01-01 00:00:00"
+
+
+def settings_dict(user_id: int) -> dict:
+    return {
+        'id': user_id,
+        'user_id': user_id,
+        'model': "gpt-3.5-turbo",
+        'temperature': 0.7,
+        'max_tokens': 1000,
+        'openai_base_url': "https://api.openai.com/v1",
+        'use_ai_assistant': False,
+        'ai_assistant_url': None,
+        # Строки из sqlite3 — отдельные объекты для каждой строки
+        'created_at': "".join(TIMESTAMP),
+        'updated_at': "".join(TIMESTAMP)
+    }
+
+
+def settings_record(user_id: int) -> UserSettings:
+    return UserSettings.from_row(
+        (user_id, "gpt-3.5-turbo", 0.7, 1000, "https://api.openai.com/v1", 0, None)
+    )
+
+
+def measure(factory, count: int) -> int:
+    """Байты, занятые кэшем user_id -> настройки"""
+    gc.collect()
+    tracemalloc.start()
+    cache = {user_id: factory(user_id) for user_id in range(count)}
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del cache
+    return size
+
+
+def main():
+    for count in SIZES:
+        as_dicts = measure(settings_dict, count)
+        as_records = measure(settings_record, count)
+        print(
+            f"{count:>9} пользователей: dict {as_dicts / 2**20:8.1f} МБ, "
+            f"UserSettings {as_records / 2**20:8.1f} МБ "
+            f"(-{100 * (1 - as_records / as_dicts):.0f}%)"
+        )
+
+    turns = 1_000_000
+    as_dicts = measure(lambda i: {'role': 'user', 'content': 'hello'}, turns)
+    as_records = measure(lambda i: HistoryTurn('user', 'hello'), turns)
+    print(
+        f"{turns:>9} реплик истории: dict {as_dicts / 2**20:8.1f} МБ, "
+        f"HistoryTurn {as_records / 2**20:8.1f} МБ "
+        f"(-{100 * (1 - as_records / as_dicts):.0f}%)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Цена полнотекстового индекса сообщений на пути записи и скорость /search.
+
+Две базы с одинаковой схемой: в одной есть индекс messages_fts, во второй
+индекс удален. Обе заполняются ROWS сообщениями, затем на уже заполненной
+базе замеряется DatabaseService.save_message (открытие соединения, INSERT,
+COMMIT), пакетная индексация новых сообщений (index_new_messages, как ее
+делает фоновая задача) и поиск с листанием по снимку результатов.
+
+Запуск: python benchmarks/search_index.py [число_сообщений]
+"""
+import asyncio
+import itertools
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import get_settings
+from services.database_service import DatabaseService
+from services.search_service import SearchService
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+BATCH = 50_000
+WRITES = 2000
+CHATS = 10_000
+VOCABULARY = 50_000
+
+random.seed(1)
+SYLLABLES = [consonant + vowel for consonant in "бвгдзклмнпрстфхц" for vowel in "аеиоуыя"]
+# Псевдослова из слогов: у них, как в живом языке, есть общие префиксы
+WORDS = list(dict.fromkeys(
+    "".join(random.choices(SYLLABLES, k=random.randint(2, 5))) for _ in range(VOCABULARY * 2)
+))[:VOCABULARY]
+# Запросы из частых, средних и редких слов (ранги по частоте)
+QUERIES = (WORDS[3], WORDS[300], WORDS[10_000], f"{WORDS[30]} {WORDS[3000]}")
+# Распределение слов, близкое к естественному (Ципф)
+CUM_WEIGHTS = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(WORDS))))
+
+
+def random_text() -> str:
+    return " ".join(random.choices(WORDS, cum_weights=CUM_WEIGHTS, k=random.randint(5, 40)))
+
+
+def open_database(path: str, with_index: bool) -> DatabaseService:
+    get_settings().database_url = f"sqlite:///{path}"
+    db = DatabaseService()
+    if not with_index:
+        conn = sqlite3.connect(db.db_path)
+        conn.executescript('''
+            DROP TRIGGER messages_fts_delete;
+            DROP TABLE messages_fts;
+        ''')
+        conn.close()
+    return db
+
+
+def fill(db: DatabaseService) -> float:
+    """Массовая загрузка ROWS сообщений, сообщений в секунду"""
+    conn = sqlite3.connect(db.db_path)
+    started = time.perf_counter()
+    for offset in range(0, ROWS, BATCH):
+        conn.executemany(
+            'INSERT INTO messages (user_id, chat_id, role, content) VALUES (?, ?, ?, ?)',
+            [
+                (chat_id, chat_id, random.choice(("user", "assistant")), random_text())
+                for chat_id in (random.randrange(CHATS) for _ in range(min(BATCH, ROWS - offset)))
+            ]
+        )
+        conn.commit()
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return ROWS / elapsed
+
+
+def percentile(samples, fraction: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+async def measure_writes(db: DatabaseService):
+    """Задержка save_message на заполненной базе, мс"""
+    samples = []
+    for _ in range(WRITES):
+        chat_id = random.randrange(CHATS)
+        started = time.perf_counter()
+        await db.save_message(chat_id, chat_id, "user", random_text())
+        samples.append((time.perf_counter() - started) * 1000)
+    return percentile(samples, 0.5), percentile(samples, 0.99)
+
+
+async def measure_search(search: SearchService):
+    """Задержка первой и третьей страницы результатов, мс"""
+    first, deep = [], []
+    chats = [random.randrange(CHATS) for _ in range(50)]
+    for text in QUERIES:
+        for chat_id in chats:
+            session = search.new_session(chat_id, text)
+            started = time.perf_counter()
+            _, has_next = await search.fetch_page(session)
+            first.append((time.perf_counter() - started) * 1000)
+            while has_next and session.page < 2:
+                session.page += 1
+                started = time.perf_counter()
+                _, has_next = await search.fetch_page(session)
+                if session.page == 2:
+                    deep.append((time.perf_counter() - started) * 1000)
+    return percentile(first, 0.5), percentile(first, 0.99), (percentile(deep, 0.5) if deep else 0.0)
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        results = {}
+        for with_index in (False, True):
+            path = os.path.join(directory, f"bench_{int(with_index)}.db")
+            db = open_database(path, with_index)
+            rate = fill(db)
+            if with_index:
+                started = time.perf_counter()
+                await db.index_new_messages(batch_size=BATCH)
+                index_rate = ROWS / (time.perf_counter() - started)
+            p50, p99 = await measure_writes(db)
+            size = os.path.getsize(path) / 2**20
+            results[with_index] = p50
+            label = "с FTS5" if with_index else "без индекса"
+            print(
+                f"{label:>12}: загрузка {rate:9,.0f} сообщ./с, "
+                f"save_message p50 {p50:6.2f} мс, p99 {p99:6.2f} мс, база {size:7.1f} МБ"
+            )
+
+            if with_index:
+                started = time.perf_counter()
+                await db.index_new_messages()
+                per_message = (time.perf_counter() - started) * 1000 / WRITES
+                print(
+                    f"{'':>12}  индексация: начальная {index_rate:9,.0f} сообщ./с, "
+                    f"фоновая {per_message:.3f} мс на сообщение"
+                )
+                search = SearchService()
+                search.db_service = db
+                first_p50, first_p99, deep_p50 = await measure_search(search)
+                print(
+                    f"{'':>12}  /search: первая страница p50 {first_p50:.2f} мс, "
+                    f"p99 {first_p99:.2f} мс, третья страница p50 {deep_p50:.2f} мс"
+                )
+
+        print(f"{ROWS:,} сообщений: индекс добавляет "
+              f"{results[True] - results[False]:+.2f} мс к медиане save_message")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,288 @@
+"""Пропускная способность: long polling против webhook-сервера.
+
+Оба режима работают на настоящем Application из python-telegram-bot с тем
+же процессором обновлений, что и бот (ChatOrderedUpdateProcessor: чат — по
+порядку, чаты — параллельно). Bot API подменен FakeBotApi без сети.
+
+Polling: Updater запрашивает getUpdates, ответ которого приходит через
+POLL_RTT секунд и содержит до 100 обновлений. Webhook: сервер запускается
+отдельным процессом на uvicorn, как в run_webhook; генератор нагрузки держит
+CONNECTIONS keep-alive соединений (столько же, сколько max_connections у
+setWebhook) и, как Telegram, отправляет по соединению следующее обновление
+только после ответа на предыдущее; на 503 повторяет доставку через
+retry-after. Обработчик имитирует потоковый ответ: REPLY_SECONDS ожидания
+I/O с правкой сообщения каждые EDIT_INTERVAL секунд.
+
+Замеряются время до обработки всех обновлений, наибольшее число
+одновременно выполнявшихся обработчиков и (для webhook) задержка
+HTTP-ответа, которую видит Telegram.
+
+Запуск: python benchmarks/webhook_throughput.py [обновлений] [секунд_на_ответ] [UPDATE_CONCURRENCY ...]
+"""
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.ext import Application, MessageHandler, filters
+from telegram.request import BaseRequest
+
+from services.update_processor import ChatOrderedUpdateProcessor
+from services.webhook_server import WebhookServer, install_event_loop, json_dumps
+from utils.metrics import metrics
+
+# Процесс сервера запускается с теми же аргументами: --serve <concurrency> ...
+ARGS = sys.argv[1:]
+SERVE = ARGS[:1] == ["--serve"]
+if SERVE:
+    ARGS = ARGS[2:] + ARGS[1:2]
+
+UPDATES = int(ARGS[0]) if len(ARGS) > 0 else 2000
+REPLY_SECONDS = float(ARGS[1]) if len(ARGS) > 1 else 5.0
+CONCURRENCY = [int(value) for value in ARGS[2:]] or [256, 1024]
+EDIT_INTERVAL = 0.5
+POLL_RTT = 0.05
+CONNECTIONS = 100
+CHATS = 1000
+HOST = "127.0.0.1"
+PORT = 8099
+SECRET = "benchmark-secret"
+TOKEN = "123456:BENCHMARK"
+
+
+class FakeBotApi(BaseRequest):
+    """Bot API без сети; getUpdates отдает заранее подготовленные обновления"""
+
+    def __init__(self, updates=()):
+        self.updates = list(updates)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        endpoint = url.rsplit("/", 1)[-1]
+        parameters = request_data.parameters if request_data else {}
+        if endpoint == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        elif endpoint == "getUpdates":
+            await asyncio.sleep(POLL_RTT)
+            offset = int(parameters.get("offset") or 0)
+            result = [update for update in self.updates if update["update_id"] >= offset]
+            result = result[:int(parameters.get("limit") or 100)]
+            if not result:
+                # Long polling без новых обновлений
+                await asyncio.sleep(1)
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+class Stats:
+    in_flight = 0
+    peak = 0
+    processed = 0
+
+
+stats = Stats()
+metrics.gauge("bench_handlers_peak", lambda: stats.peak)
+
+
+async def streaming_reply(update, context):
+    """Обработчик: потоковый ответ с периодической правкой сообщения"""
+    stats.in_flight += 1
+    stats.peak = max(stats.peak, stats.in_flight)
+    try:
+        elapsed = 0.0
+        while elapsed < REPLY_SECONDS:
+            await asyncio.sleep(EDIT_INTERVAL)
+            elapsed += EDIT_INTERVAL
+    finally:
+        stats.in_flight -= 1
+        stats.processed += 1
+
+
+def build_application(concurrency: int, updates=()) -> Application:
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .request(FakeBotApi())
+        .get_updates_request(FakeBotApi(updates))
+        .concurrent_updates(ChatOrderedUpdateProcessor(concurrency, UPDATES))
+        .build()
+    )
+    application.add_handler(MessageHandler(filters.TEXT, streaming_reply))
+    return application
+
+
+def serve(concurrency: int):
+    """Процесс сервера: WebhookServer на uvicorn"""
+    import uvicorn
+
+    async def run():
+        application = build_application(concurrency)
+        server = WebhookServer(application, SECRET, queue_size=UPDATES)
+        config = uvicorn.Config(server, host=HOST, port=PORT, loop="none",
+                                lifespan="on", access_log=False, log_level="warning")
+        async with application:
+            await uvicorn.Server(config).serve()
+
+    asyncio.run(run())
+
+
+def make_update(update_id: int) -> bytes:
+    return json_dumps({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": update_id % CHATS, "type": "private"},
+            "text": "Расскажи подробнее"
+        }
+    })
+
+
+class Connection:
+    """Keep-alive HTTP/1.1 соединение с сервером"""
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(HOST, PORT)
+        return self
+
+    async def request(self, method: str, path: str, body: bytes = b""):
+        self.writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: {HOST}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            f"X-Telegram-Bot-Api-Secret-Token: {SECRET}\r\n\r\n".encode() + body
+        )
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode().partition(":")
+            headers[name.strip().lower()] = value.strip()
+        payload = await self.reader.readexactly(int(headers.get("content-length", 0)))
+        return status, headers, payload
+
+    def close(self):
+        self.writer.close()
+
+
+async def wait_ready() -> Connection:
+    for _ in range(100):
+        try:
+            connection = await Connection().open()
+            await connection.request("GET", "/healthz")
+            return connection
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("сервер не запустился")
+
+
+async def read_metric(connection: Connection, name: str) -> float:
+    _, _, payload = await connection.request("GET", "/metrics")
+    match = re.search(rf"^{name} (\S+)$", payload.decode(), re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def percentile(samples, fraction: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+async def bench_polling(concurrency: int):
+    """Long polling в этом же процессе: Updater + Application.start, как run_polling"""
+    stats.in_flight = stats.peak = stats.processed = 0
+    updates = [json.loads(make_update(update_id)) for update_id in range(1, UPDATES + 1)]
+    application = build_application(concurrency, updates)
+    async with application:
+        started = time.perf_counter()
+        await application.updater.start_polling(poll_interval=0, timeout=1)
+        await application.start()
+        while stats.processed < UPDATES:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        await application.updater.stop()
+        await application.stop()
+
+    print(
+        f"polling UPDATE_CONCURRENCY={concurrency:<5}: обработаны за {elapsed:6.2f} с "
+        f"({UPDATES / elapsed:7.1f} upd/s), одновременно до {stats.peak} обработчиков"
+    )
+
+
+async def bench_webhook(concurrency: int):
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", str(concurrency),
+                                str(UPDATES), str(REPLY_SECONDS)])
+    try:
+        control = await wait_ready()
+        bodies = iter([make_update(update_id) for update_id in range(1, UPDATES + 1)])
+        latencies = []
+        retries = 0
+
+        async def sender():
+            nonlocal retries
+            connection = await Connection().open()
+            for body in bodies:
+                while True:
+                    started = time.perf_counter()
+                    status, headers, _ = await connection.request("POST", "/webhook", body)
+                    latencies.append(time.perf_counter() - started)
+                    if status != 503:
+                        break
+                    retries += 1
+                    await asyncio.sleep(float(headers.get("retry-after", 1)))
+            connection.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(sender() for _ in range(CONNECTIONS)))
+        accepted = time.perf_counter() - started
+        while await read_metric(control, "webhook_updates_processed_total") < UPDATES:
+            await asyncio.sleep(0.1)
+        elapsed = time.perf_counter() - started
+        peak = await read_metric(control, "bench_handlers_peak")
+        control.close()
+    finally:
+        process.terminate()
+        process.wait()
+
+    print(
+        f"webhook UPDATE_CONCURRENCY={concurrency:<5}: обработаны за {elapsed:6.2f} с "
+        f"({UPDATES / elapsed:7.1f} upd/s), все приняты за {accepted:6.2f} с, "
+        f"одновременно до {peak:.0f} обработчиков; HTTP p50 {percentile(latencies, 0.5) * 1000:.1f} мс, "
+        f"p99 {percentile(latencies, 0.99) * 1000:.1f} мс, повторов 503: {retries}"
+    )
+
+
+async def main():
+    print(f"{UPDATES} обновлений от {CHATS} чатов, ответ {REPLY_SECONDS:g} с "
+          f"(правка каждые {EDIT_INTERVAL:g} с); getUpdates {POLL_RTT * 1000:g} мс, "
+          f"webhook — {CONNECTIONS} соединений")
+    lower_bound = REPLY_SECONDS * -(-UPDATES // CHATS)
+    print(f"нижняя граница из-за порядка внутри чата: {lower_bound:g} с; "
+          f"polling без concurrent_updates: {UPDATES * REPLY_SECONDS:g} с")
+    for concurrency in CONCURRENCY:
+        await bench_polling(concurrency)
+        await bench_webhook(concurrency)
+
+
+if __name__ == "__main__":
+    if SERVE:
+        print("uvloop:", "да" if install_event_loop() else "нет")
+        serve(CONCURRENCY[0])
+    else:
+        asyncio.run(main())
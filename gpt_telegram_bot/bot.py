@@ -1,110 +1,221 @@
-import asyncio
-import logging
-from telegram.ext import Application, MessageHandler, CallbackQueryHandler, filters, CommandHandler
-from config.settings import get_settings
-from handlers.text_handler import TextHandler
-from handlers.settings_handler import SettingsHandler
-from handlers.group_handler import GroupHandler
-
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
-
-async def start_command(update, context):
-    """Обработка команды /start"""
-    welcome_text = """
-🤖 Добро пожаловать в GPT Telegram Bot!
-
-Я поддерживаю:
-• Потоковую генерацию ответов
-• Работу в группах (упомяните меня)
-• Настройку параметров модели
-• Использование AI-ассистентов
-
-Команды:
-/start - Начать работу
-/settings - Настройки
-/help - Помощь
-
-Просто отправьте мне сообщение!
-    """
-    await update.message.reply_text(welcome_text.strip())
-
-async def help_command(update, context):
-    """Обработка команды /help"""
-    help_text = """
-📖 Справка по использованию бота
-
-🔹 <b>Личные сообщения:</b>
-Просто отправьте текст, и я отвечу с помощью GPT
-
-🔹 <b>Групповые чаты:</b>
-Упомяните меня в сообщении: @your_bot_name
-
-🔹 <b>Настройки (/settings):</b>
-• Выбор модели GPT
-• Настройка температуры (креативность)
-• Максимальное количество токенов
-• Base URL для API
-• Настройка AI-ассистента
-
-🔹 <b>AI-ассистент:</b>
-Можно настроить собственный AI-ассистент через API эндпоинт
-
-🔹 <b>Потоковый режим:</b>
-Ответы генерируются по частям для быстрого отображения
-    """
-    await update.message.reply_text(help_text.strip(), parse_mode='HTML')
-
-async def main():
-    """Основная функция"""
-    settings = get_settings()
-    
-    # Инициализация бота
-    application = Application.builder().token(settings.telegram_token).build()
-    
-    # Инициализация обработчиков
-    text_handler = TextHandler()
-    settings_handler = SettingsHandler()
-    group_handler = GroupHandler()
-    
-    # Регистрация обработчиков
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("settings", settings_handler.handle_settings_command))
-    
-    # Обработчик callback-ов для настроек
-    application.add_handler(CallbackQueryHandler(settings_handler.handle_settings_callback))
-    
-    # Обработчик текстовых сообщений в личных чатах
-    application.add_handler(
-        MessageHandler(
-            filters.ChatType.PRIVATE & filters.TEXT & ~filters.COMMAND,
-            text_handler.handle_text_message
-        )
-    )
-    
-    # Обработчик текстовых сообщений в группах
-    application.add_handler(
-        MessageHandler(
-            filters.ChatType.GROUPS & filters.TEXT & ~filters.COMMAND,
-            group_handler.handle_group_message
-        )
-    )
-    
-    # Обработчик текстового ввода для настроек
-    application.add_handler(
-        MessageHandler(
-            filters.ChatType.PRIVATE & filters.TEXT & ~filters.COMMAND,
-            settings_handler.handle_text_input
-        )
-    )
-    
-    # Запуск бота
-    print("🤖 Бот запущен...")
-    await application.run_polling()
-
-if __name__ == "__main__":
+import asyncio
+import logging
+from telegram.ext import Application, MessageHandler, CallbackQueryHandler, filters, CommandHandler
+from config.settings import get_settings
+from handlers.text_handler import TextHandler
+from handlers.settings_handler import SettingsHandler
+from handlers.group_handler import GroupHandler
+from handlers.image_handler import ImageHandler
+from handlers.document_handler import DocumentHandler
+from handlers.summary_handler import SummaryHandler
+from handlers.admin_handler import AdminHandler
+from handlers.broadcast_handler import BroadcastHandler
+from handlers.search_handler import SearchHandler
+from services.update_processor import ChatOrderedUpdateProcessor
+from services.webhook_server import run_webhook, install_event_loop
+from utils.profiler import LoopBlockDetector, SamplingProfiler
+
+# Настройка логирования
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+
+async def start_command(update, context):
+    """Обработка команды /start"""
+    welcome_text = """
+🤖 Добро пожаловать в GPT Telegram Bot!
+
+Я поддерживаю:
+• Потоковую генерацию ответов
+• Работу в группах (упомяните меня)
+• Настройку параметров модели
+• Использование AI-ассистентов
+• Анализ изображений
+• Вопросы по загруженным документам
+
+Команды:
+/start - Начать работу
+/settings - Настройки
+/summarize - Сводка переписки
+/search - Поиск по истории
+/help - Помощь
+
+Просто отправьте мне сообщение!
+    """
+    await update.message.reply_text(welcome_text.strip())
+
+async def help_command(update, context):
+    """Обработка команды /help"""
+    help_text = """
+📖 Справка по использованию бота
+
+🔹 <b>Личные сообщения:</b>
+Просто отправьте текст, и я отвечу с помощью GPT
+
+🔹 <b>Изображения:</b>
+Отправьте фото или картинку файлом, вопрос можно указать в подписи
+
+🔹 <b>Документы:</b>
+Загрузите текстовый файл или вставьте длинный текст — я проиндексирую его и буду отвечать по нужным фрагментам
+
+🔹 <b>Групповые чаты:</b>
+Упомяните меня в сообщении: @your_bot_name
+Команда /summarize кратко перескажет, что обсуждалось в чате
+
+🔹 <b>Поиск:</b>
+/search &lt;слова&gt; найдет сообщения этого чата, самые релевантные — первыми
+
+🔹 <b>Настройки (/settings):</b>
+• Выбор модели GPT
+• Настройка температуры (креативность)
+• Максимальное количество токенов
+• Base URL для API
+• Настройка AI-ассистента
+
+🔹 <b>AI-ассистент:</b>
+Можно настроить собственный AI-ассистент через API эндпоинт
+
+🔹 <b>Потоковый режим:</b>
+Ответы генерируются по частям для быстрого отображения
+    """
+    await update.message.reply_text(help_text.strip(), parse_mode='HTML')
+
+def build_application(settings) -> Application:
+    """Создание приложения и регистрация обработчиков"""
+    # Инициализация обработчиков
+    text_handler = TextHandler()
+    settings_handler = SettingsHandler()
+    group_handler = GroupHandler(text_handler)
+    image_handler = ImageHandler(text_handler)
+    document_handler = DocumentHandler()
+    summary_handler = SummaryHandler()
+    admin_handler = AdminHandler()
+    broadcast_handler = BroadcastHandler()
+    search_handler = SearchHandler()
+    
+    async def post_init(application: Application):
+        """Фоновые задачи после старта бота"""
+        search_handler.search_service.start_indexer()
+        # Продолжаем рассылки, прерванные перезапуском
+        await broadcast_handler.resume_unfinished(application)
+    
+    async def post_shutdown(application: Application):
+        """Освобождение ресурсов обработчиков при остановке бота"""
+        await search_handler.search_service.stop_indexer()
+        # Отложенные изменения настроек иначе пропали бы вместе с процессом
+        await settings_handler.coordinator.flush_all()
+        await image_handler.image_service.close()
+        await document_handler.document_service.close()
+        await text_handler.document_service.close()
+    
+    # Инициализация бота.
+    # Обновления одного чата обрабатываются по порядку, разные чаты — параллельно
+    application = (
+        Application.builder()
+        .token(settings.telegram_token)
+        .concurrent_updates(
+            ChatOrderedUpdateProcessor(
+                settings.update_concurrency,
+                settings.update_queue_size,
+                on_queued=text_handler.supersede_queued
+            )
+        )
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+    
+    # Регистрация обработчиков
+    application.add_handler(CommandHandler("start", start_command))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("settings", settings_handler.handle_settings_command))
+    application.add_handler(CommandHandler("summarize", summary_handler.handle_summarize_command))
+    application.add_handler(CommandHandler("search", search_handler.handle_search_command))
+    application.add_handler(CommandHandler("profile", admin_handler.handle_profile_command))
+    application.add_handler(CommandHandler("broadcast", broadcast_handler.handle_broadcast_command))
+    application.add_handler(
+        CommandHandler("broadcast_cancel", broadcast_handler.handle_broadcast_cancel_command)
+    )
+    
+    # Кнопка «Стоп» под генерируемым ответом (доходит до бота во время
+    # генерации: нажатия кнопок идут вне очереди чата)
+    application.add_handler(
+        CallbackQueryHandler(text_handler.handle_stop_callback, pattern="^generation_stop$")
+    )
+    
+    # Листание результатов поиска
+    application.add_handler(
+        CallbackQueryHandler(search_handler.handle_search_callback, pattern="^search_(prev|next)$")
+    )
+    
+    # Обработчик callback-ов для настроек
+    application.add_handler(CallbackQueryHandler(settings_handler.handle_settings_callback))
+    
+    # Обработчик текстовых сообщений в личных чатах
+    application.add_handler(
+        MessageHandler(
+            filters.ChatType.PRIVATE & filters.TEXT & ~filters.COMMAND,
+            text_handler.handle_text_message
+        )
+    )
+    
+    # Обработчик изображений в личных чатах (фото и картинки-документы)
+    application.add_handler(
+        MessageHandler(
+            filters.ChatType.PRIVATE & (filters.PHOTO | filters.Document.IMAGE),
+            image_handler.handle_image_message
+        )
+    )
+    
+    # Обработчик текстовых документов в личных чатах
+    application.add_handler(
+        MessageHandler(
+            filters.ChatType.PRIVATE & filters.Document.TEXT,
+            document_handler.handle_document_message
+        )
+    )
+    
+    # Обработчик текстовых сообщений в группах
+    application.add_handler(
+        MessageHandler(
+            filters.ChatType.GROUPS & filters.TEXT & ~filters.COMMAND,
+            group_handler.handle_group_message
+        )
+    )
+    
+    # Обработчик текстового ввода для настроек
+    application.add_handler(
+        MessageHandler(
+            filters.ChatType.PRIVATE & filters.TEXT & ~filters.COMMAND,
+            settings_handler.handle_text_input
+        )
+    )
+    
+    return application
+
+async def main():
+    """Основная функция"""
+    settings = get_settings()
+    application = build_application(settings)
+    
+    # Диагностика: поиск блокирующих вызовов и профилирование при старте
+    if settings.slow_callback_ms > 0:
+        LoopBlockDetector(settings.slow_callback_ms / 1000).start()
+    if settings.profile_seconds > 0:
+        profiler = SamplingProfiler(settings.profile_dir, interval=settings.profile_interval_ms / 1000)
+        profiler.start_background(settings.profile_seconds)
+    
+    # Webhook-режим со встроенным ASGI-сервером (для self-hosting)
+    if settings.bot_mode == "webhook":
+        await run_webhook(application, settings)
+        return
+    
+    # Запуск бота
+    print("🤖 Бот запущен...")
+    await application.run_polling()
+
+if __name__ == "__main__":
+    if get_settings().bot_mode == "webhook":
+        install_event_loop()
     asyncio.run(main()) 
\ No newline at end of file
@@ -1,30 +1,109 @@
-import os
-from dotenv import load_dotenv
-from pydantic import BaseSettings
-
-load_dotenv()
-
-class Settings(BaseSettings):
-    # Telegram
-    telegram_token: str = os.getenv("TELEGRAM_TOKEN")
-    
-    # OpenAI
-    openai_api_key: str = os.getenv("OPENAI_API_KEY")
-    openai_base_url: str = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
-    
-    # Database
-    database_url: str = os.getenv("DATABASE_URL", "sqlite:///bot.db")
-    
-    # Redis
-    redis_url: str = os.getenv("REDIS_URL", "redis://localhost:6379")
-    
-    class Config:
-        env_file = ".env"
-
-_settings = None
-
-def get_settings() -> Settings:
-    global _settings
-    if _settings is None:
-        _settings = Settings()
+import os
+from dotenv import load_dotenv
+from pydantic import BaseSettings
+
+load_dotenv()
+
+class Settings(BaseSettings):
+    # Telegram
+    telegram_token: str = os.getenv("TELEGRAM_TOKEN")
+    
+    # Режим работы: polling или webhook
+    bot_mode: str = os.getenv("BOT_MODE", "polling")
+    
+    # Обработка обновлений (оба режима): чаты параллельно, внутри чата по порядку
+    update_concurrency: int = int(os.getenv("UPDATE_CONCURRENCY", "256"))
+    update_queue_size: int = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+    
+    # Webhook
+    webhook_url: str = os.getenv("WEBHOOK_URL", "")
+    webhook_path: str = os.getenv("WEBHOOK_PATH", "/webhook")
+    webhook_secret: str = os.getenv("WEBHOOK_SECRET", "")
+    webhook_host: str = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    webhook_port: int = int(os.getenv("WEBHOOK_PORT", "8080"))
+    
+    # Администраторы (user_id через запятую)
+    admin_user_ids: str = os.getenv("ADMIN_USER_IDS", "")
+    
+    # Диагностика
+    profile_seconds: int = int(os.getenv("PROFILE_SECONDS", "0"))
+    profile_interval_ms: int = int(os.getenv("PROFILE_INTERVAL_MS", "10"))
+    profile_dir: str = os.getenv("PROFILE_DIR", "profiles")
+    slow_update_ms: int = int(os.getenv("SLOW_UPDATE_MS", "3000"))
+    slow_callback_ms: int = int(os.getenv("SLOW_CALLBACK_MS", "100"))
+    
+    # OpenAI
+    openai_api_key: str = os.getenv("OPENAI_API_KEY")
+    openai_base_url: str = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    # Пул ключей: "ключ" или "ключ@base_url" через запятую (вместо OPENAI_API_KEY)
+    openai_api_keys: str = os.getenv("OPENAI_API_KEYS", "")
+    openai_key_cooldown: int = int(os.getenv("OPENAI_KEY_COOLDOWN", "60"))
+    openai_auth_cooldown: int = int(os.getenv("OPENAI_AUTH_COOLDOWN", "600"))
+    
+    # Режим model=auto: модели от быстрой к сильной (через запятую)
+    auto_model_tiers: str = os.getenv("AUTO_MODEL_TIERS", "gpt-3.5-turbo,gpt-4-turbo-preview,gpt-4")
+    auto_vision_model: str = os.getenv("AUTO_VISION_MODEL", "gpt-4-turbo")
+    auto_ttft_ms: int = int(os.getenv("AUTO_TTFT_MS", "2500"))
+    auto_error_cooldown: int = int(os.getenv("AUTO_ERROR_COOLDOWN", "30"))
+    
+    # Database
+    database_url: str = os.getenv("DATABASE_URL", "sqlite:///bot.db")
+    
+    # Redis
+    redis_url: str = os.getenv("REDIS_URL", "redis://localhost:6379")
+    
+    # Идемпотентность обновлений: memory, db или redis
+    dedup_backend: str = os.getenv("DEDUP_BACKEND", "db")
+    dedup_ttl_seconds: int = int(os.getenv("DEDUP_TTL_SECONDS", "86400"))
+    dedup_memory_size: int = int(os.getenv("DEDUP_MEMORY_SIZE", "100000"))
+    
+    # Новое сообщение прерывает незавершенную генерацию в чате
+    supersede_generations: bool = os.getenv("SUPERSEDE_GENERATIONS", "false").lower() in ("1", "true", "yes")
+    
+    # Рассылки
+    broadcast_rate: float = float(os.getenv("BROADCAST_RATE", "25"))
+    broadcast_batch_size: int = int(os.getenv("BROADCAST_BATCH_SIZE", "100"))
+    broadcast_progress_interval: int = int(os.getenv("BROADCAST_PROGRESS_INTERVAL", "10"))
+    
+    # Vision
+    vision_detail: str = os.getenv("VISION_DETAIL", "auto")
+    image_max_bytes: int = int(os.getenv("IMAGE_MAX_BYTES", str(20 * 1024 * 1024)))
+    image_cache_size: int = int(os.getenv("IMAGE_CACHE_SIZE", "256"))
+    
+    # Documents
+    document_max_bytes: int = int(os.getenv("DOCUMENT_MAX_BYTES", str(20 * 1024 * 1024)))
+    document_chunk_size: int = int(os.getenv("DOCUMENT_CHUNK_SIZE", "1200"))
+    document_chunk_overlap: int = int(os.getenv("DOCUMENT_CHUNK_OVERLAP", "200"))
+    document_top_k: int = int(os.getenv("DOCUMENT_TOP_K", "4"))
+    document_paste_threshold: int = int(os.getenv("DOCUMENT_PASTE_THRESHOLD", "2000"))
+    
+    # Поиск по истории
+    search_page_size: int = int(os.getenv("SEARCH_PAGE_SIZE", "5"))
+    # Как часто новые сообщения добавляются в поисковый индекс, секунды
+    search_index_interval: float = float(os.getenv("SEARCH_INDEX_INTERVAL", "5"))
+    
+    # Пауза после нажатия кнопки настроек, после которой изменения пишутся в БД
+    settings_debounce_ms: int = int(os.getenv("SETTINGS_DEBOUNCE_MS", "700"))
+    
+    # Summaries
+    summary_page_size: int = int(os.getenv("SUMMARY_PAGE_SIZE", "200"))
+    summary_chunk_chars: int = int(os.getenv("SUMMARY_CHUNK_CHARS", "12000"))
+    summary_concurrency: int = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+    summary_fan_in: int = int(os.getenv("SUMMARY_FAN_IN", "8"))
+    summary_max_tokens: int = int(os.getenv("SUMMARY_MAX_TOKENS", "500"))
+    
+    class Config:
+        env_file = ".env"
+
+_settings = None
+
+def is_admin(user_id: int) -> bool:
+    """Проверяет, входит ли пользователь в ADMIN_USER_IDS"""
+    admin_ids = get_settings().admin_user_ids
+    return str(user_id) in {item.strip() for item in admin_ids.split(",") if item.strip()}
+
+def get_settings() -> Settings:
+    global _settings
+    if _settings is None:
+        _settings = Settings()
     return _settings 
\ No newline at end of file
@@ -0,0 +1,47 @@
+from telegram import Update
+from telegram.ext import ContextTypes
+from config.settings import get_settings, is_admin
+from utils.profiler import SamplingProfiler
+
+DEFAULT_PROFILE_SECONDS = 10
+MAX_PROFILE_SECONDS = 300
+
+class AdminHandler:
+    def __init__(self, profiler: SamplingProfiler = None):
+        settings = get_settings()
+        self.profiler = profiler or SamplingProfiler(
+            settings.profile_dir, interval=settings.profile_interval_ms / 1000
+        )
+
+    async def handle_profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка команды /profile [секунды] (только для администраторов)"""
+        if not is_admin(update.effective_user.id):
+            return
+
+        try:
+            seconds = int(context.args[0]) if context.args else DEFAULT_PROFILE_SECONDS
+        except ValueError:
+            await update.message.reply_text("❌ Укажите длительность в секундах")
+            return
+        seconds = max(1, min(seconds, MAX_PROFILE_SECONDS))
+
+        if self.profiler.running:
+            await update.message.reply_text("⏳ Профилирование уже идет")
+            return
+
+        await update.message.reply_text(f"🔬 Профилирую {seconds} с...")
+        # Профиль снимается в фоне: обработчик не задерживает другие обновления,
+        # и в профиль попадает реальная работа бота, а не ожидание этой команды
+        context.application.create_task(self._send_profile(update, seconds), update=update)
+
+    async def _send_profile(self, update: Update, seconds: int):
+        """Профилирование и отправка результата администратору"""
+        path = await self.profiler.profile(seconds)
+        if path is None:
+            await update.message.reply_text("⏳ Профилирование уже идет")
+            return
+
+        with open(path, "rb") as f:
+            await update.message.reply_document(
+                f, caption="Профиль в свернутом формате (flamegraph.pl, speedscope)"
+            )
@@ -0,0 +1,55 @@
+from telegram import Update
+from telegram.ext import ContextTypes
+from config.settings import is_admin
+from services.broadcast_service import BroadcastService
+
+class BroadcastHandler:
+    def __init__(self):
+        self.broadcast_service = BroadcastService()
+
+    async def handle_broadcast_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка команды /broadcast <текст> или ответа /broadcast на сообщение"""
+        if not is_admin(update.effective_user.id):
+            return
+
+        message = update.message
+        text = " ".join(context.args) if context.args else None
+        source = message.reply_to_message
+
+        if not text and source is None:
+            await message.reply_text(
+                "✏️ Использование: /broadcast <текст> или ответьте /broadcast на сообщение для рассылки"
+            )
+            return
+
+        # Рассылка идет в фоне и не мешает обработке обычных сообщений
+        broadcast_id = await self.broadcast_service.start(
+            context.bot,
+            admin_chat_id=message.chat_id,
+            text=None if source else text,
+            source_chat_id=source.chat_id if source else None,
+            source_message_id=source.message_id if source else None
+        )
+        await message.reply_text(
+            f"📣 Рассылка #{broadcast_id} запущена. Отменить: /broadcast_cancel {broadcast_id}"
+        )
+
+    async def handle_broadcast_cancel_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка команды /broadcast_cancel <id>"""
+        if not is_admin(update.effective_user.id):
+            return
+
+        try:
+            broadcast_id = int(context.args[0])
+        except (IndexError, ValueError):
+            await update.message.reply_text("✏️ Использование: /broadcast_cancel <id>")
+            return
+
+        if self.broadcast_service.cancel(broadcast_id):
+            await update.message.reply_text(f"⏹ Рассылка #{broadcast_id} отменяется")
+        else:
+            await update.message.reply_text(f"Рассылка #{broadcast_id} не выполняется")
+
+    async def resume_unfinished(self, application):
+        """post_init: продолжение рассылок, прерванных перезапуском"""
+        await self.broadcast_service.resume_unfinished(application.bot)
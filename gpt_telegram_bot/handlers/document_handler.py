@@ -0,0 +1,47 @@
+from telegram import Update
+from telegram.ext import ContextTypes
+from services.database_service import DatabaseService
+from services.document_service import DocumentService
+
+class DocumentHandler:
+    def __init__(self):
+        self.db_service = DatabaseService()
+        self.document_service = DocumentService()
+
+    async def handle_document_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка загруженных текстовых документов"""
+        user_id = update.effective_user.id
+        chat_id = update.effective_chat.id
+        document = update.message.document
+
+        # Получаем или создаем пользователя
+        await self.db_service.get_or_create_user(
+            user_id=user_id,
+            username=update.effective_user.username,
+            first_name=update.effective_user.first_name,
+            last_name=update.effective_user.last_name
+        )
+
+        status_message = await update.message.reply_text("📄 Индексирую документ...")
+
+        try:
+            chunk_count = await self.document_service.ingest_file(
+                context.bot,
+                chat_id=chat_id,
+                user_id=user_id,
+                file_id=document.file_id,
+                file_name=document.file_name,
+                file_size=document.file_size
+            )
+        except Exception as e:
+            await status_message.edit_text(f"Ошибка при обработке документа: {str(e)}")
+            return
+
+        # В историю попадает только отметка о документе, а не его содержимое
+        await self.db_service.save_message(
+            user_id, chat_id, "user", f"[Документ: {document.file_name}, {chunk_count} фрагм.]"
+        )
+        await status_message.edit_text(
+            f"✅ Документ «{document.file_name}» проиндексирован ({chunk_count} фрагм.). "
+            "Задавайте вопросы — я буду использовать подходящие фрагменты."
+        )
@@ -0,0 +1,73 @@
+from telegram import Update
+from telegram.ext import ContextTypes
+from services.database_service import DatabaseService
+from services.image_service import ImageService
+from services.openai_service import OpenAIService
+from services.settings_coordinator import get_settings_coordinator
+from handlers.text_handler import TextHandler
+
+DEFAULT_IMAGE_PROMPT = "Опиши это изображение"
+
+class ImageHandler:
+    def __init__(self, text_handler: TextHandler = None):
+        self.db_service = DatabaseService()
+        self.image_service = ImageService()
+        self.openai_service = OpenAIService()
+        self.text_handler = text_handler or TextHandler()
+
+    async def handle_image_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка фото и изображений, отправленных документом"""
+        user_id = update.effective_user.id
+        chat_id = update.effective_chat.id
+        message = update.message
+        prompt = message.caption or DEFAULT_IMAGE_PROMPT
+
+        # Новое сообщение может прервать незавершенный ответ в этом чате
+        await self.text_handler.supersede_generation(chat_id)
+
+        # Для фото берем наименьший размер, достаточный для модели
+        if message.photo:
+            image_file = self.image_service.select_photo_size(message.photo)
+        else:
+            image_file = message.document
+
+        # Получаем или создаем пользователя
+        await self.db_service.get_or_create_user(
+            user_id=user_id,
+            username=update.effective_user.username,
+            first_name=update.effective_user.first_name,
+            last_name=update.effective_user.last_name
+        )
+
+        user_settings = await get_settings_coordinator().get_settings(user_id)
+
+        # История без текущего сообщения: изображение добавит OpenAIService
+        conversation_history = await self.db_service.get_conversation_history(user_id, limit=10)
+
+        # Кнопка «Стоп» появится, когда начнется генерация
+        bot_message = await message.reply_text("Обрабатываю изображение...")
+
+        try:
+            image_url = await self.image_service.get_image_data_url(
+                context.bot,
+                file_id=image_file.file_id,
+                file_unique_id=image_file.file_unique_id,
+                file_size=image_file.file_size
+            )
+        except Exception as e:
+            await bot_message.edit_text(f"Ошибка при обработке изображения: {str(e)}")
+            return
+
+        # В историю сохраняем только текст, чтобы не раздувать последующие промпты
+        await self.db_service.save_message(user_id, chat_id, "user", f"[Изображение] {prompt}")
+
+        chunks = self.openai_service.stream_image_completion(
+            messages=conversation_history,
+            text=prompt,
+            image_url=image_url,
+            model=user_settings.model,
+            temperature=user_settings.temperature,
+            max_tokens=user_settings.max_tokens,
+            detail=self.image_service.detail
+        )
+        await self.text_handler.stream_reply(bot_message, chunks, user_settings)
@@ -0,0 +1,54 @@
+from telegram import Update
+from telegram.ext import ContextTypes
+from services.search_service import SearchService
+from utils.keyboard import SearchKeyboard
+from utils.tracing import trace_update
+
+class SearchHandler:
+    def __init__(self):
+        self.search_service = SearchService()
+
+    @trace_update("search.command")
+    async def handle_search_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка команды /search <запрос>"""
+        text = " ".join(context.args) if context.args else ""
+        session = self.search_service.new_session(update.effective_chat.id, text)
+
+        if session is None:
+            await update.message.reply_text("✏️ Использование: /search <слова для поиска>")
+            return
+
+        page_text, has_next = await self.search_service.fetch_page(session)
+        results_message = await update.message.reply_text(
+            page_text,
+            reply_markup=SearchKeyboard.get_pagination_keyboard(False, has_next),
+            parse_mode='HTML'
+        )
+        self.search_service.remember(results_message.message_id, session)
+
+    @trace_update("search.callback")
+    async def handle_search_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Листание результатов поиска"""
+        query = update.callback_query
+        session = self.search_service.get_session(query.message.chat_id, query.message.message_id)
+
+        if session is None:
+            await query.answer("Результаты устарели, повторите /search")
+            return
+
+        page_size = self.search_service.settings.search_page_size
+        if query.data == "search_next" and session.has_page(session.page + 1, page_size):
+            session.page += 1
+        elif query.data == "search_prev" and session.page > 0:
+            session.page -= 1
+        else:
+            await query.answer()
+            return
+
+        await query.answer()
+        page_text, has_next = await self.search_service.fetch_page(session)
+        await query.edit_message_text(
+            page_text,
+            reply_markup=SearchKeyboard.get_pagination_keyboard(session.page > 0, has_next),
+            parse_mode='HTML'
+        )
@@ -0,0 +1,29 @@
+from telegram import Update
+from telegram.ext import ContextTypes
+from services.summary_service import SummaryService, SummaryError
+from services.settings_coordinator import get_settings_coordinator
+
+class SummaryHandler:
+    def __init__(self):
+        self.summary_service = SummaryService()
+
+    async def handle_summarize_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка команды /summarize"""
+        user_id = update.effective_user.id
+        chat_id = update.effective_chat.id
+
+        user_settings = await get_settings_coordinator().get_settings(user_id)
+
+        status_message = await update.message.reply_text("📝 Собираю сводку переписки...")
+
+        try:
+            summary = await self.summary_service.summarize_chat(chat_id, user_settings.model)
+        except SummaryError as e:
+            await status_message.edit_text(f"Ошибка при создании сводки: {str(e)}")
+            return
+
+        if not summary:
+            await status_message.edit_text("В этом чате пока нечего пересказывать")
+            return
+
+        await status_message.edit_text(f"📝 Сводка переписки:\n\n{summary}")
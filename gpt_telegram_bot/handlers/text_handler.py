@@ -1,98 +1,320 @@
-from telegram import Update
-from telegram.ext import ContextTypes
-from services.openai_service import OpenAIService
-from services.database_service import DatabaseService
-from services.ai_assistant import AIAssistantService
-import asyncio
-
-class TextHandler:
-    def __init__(self):
-        self.openai_service = OpenAIService()
-        self.db_service = DatabaseService()
-        self.ai_assistant_service = AIAssistantService()
-    
-    async def handle_text_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработка текстовых сообщений с поддержкой стриминга"""
-        user_id = update.effective_user.id
-        chat_id = update.effective_chat.id
-        message_text = update.message.text
-        
-        # Получаем или создаем пользователя
-        await self.db_service.get_or_create_user(
-            user_id=user_id,
-            username=update.effective_user.username,
-            first_name=update.effective_user.first_name,
-            last_name=update.effective_user.last_name
-        )
-        
-        # Получаем настройки пользователя
-        user_settings = await self.db_service.get_user_settings(user_id)
-        
-        # Сохраняем сообщение пользователя
-        await self.db_service.save_message(user_id, chat_id, "user", message_text)
-        
-        # Получаем историю диалога
-        conversation_history = await self.db_service.get_conversation_history(user_id, limit=10)
-        
-        # Отправляем начальное сообщение
-        bot_message = await update.message.reply_text("Генерирую ответ...")
-        
-        # Проверяем, используется ли AI-ассистент
-        if user_settings['use_ai_assistant'] and user_settings['ai_assistant_url']:
-            response_text = await self._handle_ai_assistant(
-                message_text, user_settings['ai_assistant_url']
-            )
-            await bot_message.edit_text(response_text)
-        else:
-            # Используем OpenAI с потоковым режимом
-            await self._stream_openai_response(
-                bot_message, 
-                conversation_history, 
-                user_settings
-            )
-    
-    async def _stream_openai_response(
-        self, 
-        bot_message, 
-        conversation_history: list, 
-        user_settings: dict
-    ):
-        """Потоковая генерация ответа от OpenAI"""
-        response_text = ""
-        
-        async for chunk in self.openai_service.stream_chat_completion(
-            messages=conversation_history,
-            model=user_settings['model'],
-            temperature=user_settings['temperature'],
-            max_tokens=user_settings['max_tokens']
-        ):
-            response_text += chunk
-            
-            # Обновляем сообщение каждые 50 символов для плавности
-            if len(response_text) % 50 == 0:
-                try:
-                    await bot_message.edit_text(response_text)
-                except Exception:
-                    pass
-        
-        # Финальное обновление сообщения
-        await bot_message.edit_text(response_text)
-        
-        # Сохраняем ответ бота
-        await self.db_service.save_message(
-            user_settings['user_id'], 
-            bot_message.chat_id, 
-            "assistant", 
-            response_text
-        )
-    
-    async def _handle_ai_assistant(self, message_text: str, ai_assistant_url: str) -> str:
-        """Обработка сообщения через AI-ассистент"""
-        try:
-            response = await self.ai_assistant_service.send_message(
-                url=ai_assistant_url,
-                message=message_text
-            )
-            return response
-        except Exception as e:
+from telegram import Update
+from telegram.ext import ContextTypes
+from services.openai_service import OpenAIService
+from services.database_service import DatabaseService
+from services.ai_assistant import AIAssistantService
+from services.document_service import DocumentService
+from services.dedup_service import idempotent
+from services.generation_registry import get_generation_registry, STOPPED_BY_USER, SUPERSEDED
+from services.settings_coordinator import get_settings_coordinator
+from models.records import UserSettings, HistoryTurn
+from config.settings import get_settings
+from utils.keyboard import GenerationKeyboard
+from utils.tracing import trace_update, span, mark
+import asyncio
+from typing import Awaitable, Optional
+
+# Пометки в конце ответа, если генерация была прервана
+CANCEL_NOTES = {
+    STOPPED_BY_USER: "\n\n⏹ Генерация остановлена",
+    SUPERSEDED: "\n\n⏭ Ответ прерван новым сообщением"
+}
+
+class TextHandler:
+    def __init__(self):
+        self.openai_service = OpenAIService()
+        self.db_service = DatabaseService()
+        self.ai_assistant_service = AIAssistantService()
+        self.document_service = DocumentService()
+        self.generations = get_generation_registry()
+    
+    @trace_update("text")
+    @idempotent
+    async def handle_text_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                                  message_text: str = None):
+        """Обработка текстовых сообщений с поддержкой стриминга
+        
+        message_text — текст вместо update.message.text (например, сообщение
+        группы без упоминания бота).
+        """
+        user_id = update.effective_user.id
+        chat_id = update.effective_chat.id
+        message_text = message_text or update.message.text
+        
+        # Длинный вставленный текст индексируем как документ, а не кладем в историю;
+        # на вопрос к нему отвечаем по найденным фрагментам, как на обычное сообщение
+        if len(message_text) >= self.document_service.settings.document_paste_threshold:
+            await self.supersede_generation(chat_id)
+            await self._upsert_user(update)
+            message_text = await self._ingest_pasted_document(update, user_id, chat_id, message_text)
+            if message_text is None:
+                return
+        
+        # Конвейер первого ответа: заглушка уходит сразу, пока в пуле потоков
+        # читаются БД и открывается поток модели; запись вопроса в историю —
+        # вне критического пути (до сохранения ответа)
+        placeholder = asyncio.create_task(self._send_placeholder(update))
+        # Даем запросу к Telegram уйти первым
+        await asyncio.sleep(0)
+        
+        try:
+            # Новое сообщение может прервать незавершенный ответ в этом чате
+            # (до чтения истории, чтобы в нее попал частичный ответ)
+            await self.supersede_generation(chat_id)
+            
+            user_settings, conversation_history, dialog_turns, document_context = await asyncio.gather(
+                self._upsert_user_settings(update),
+                self.db_service.get_conversation_history(user_id, limit=9),
+                # В запрос уходит только хвост истории, а выбору модели нужна вся глубина
+                self.db_service.count_dialog_turns(user_id),
+                self.document_service.build_context_message(chat_id, message_text)
+            )
+        except BaseException:
+            placeholder.cancel()
+            raise
+        
+        # Текущее сообщение добавляем в историю в памяти, не дожидаясь записи
+        conversation_history = conversation_history + [HistoryTurn("user", message_text)]
+        
+        # Добавляем только релевантные фрагменты документов чата
+        if document_context:
+            conversation_history = [document_context] + conversation_history
+        
+        # Проверяем, используется ли AI-ассистент
+        if user_settings.use_ai_assistant and user_settings.ai_assistant_url:
+            user_message_saved = asyncio.create_task(
+                self.db_service.save_message(user_id, chat_id, "user", message_text)
+            )
+            with span("ai_assistant.request"):
+                response_text, bot_message = await asyncio.gather(
+                    self._handle_ai_assistant(message_text, user_settings.ai_assistant_url),
+                    placeholder
+                )
+            await bot_message.edit_text(response_text)
+            await user_message_saved
+        else:
+            # Используем OpenAI с потоковым режимом
+            await self._stream_openai_response(
+                placeholder, 
+                conversation_history, 
+                user_settings,
+                chat_id=chat_id,
+                user_message=message_text,
+                dialog_turns=dialog_turns + 1
+            )
+    
+    async def _send_placeholder(self, update: Update):
+        """Начальное сообщение, которое заменяется ответом
+        
+        Кнопка «Стоп» появляется позже, когда генерация зарегистрирована
+        и ее действительно можно отменить.
+        """
+        with span("telegram.reply_placeholder"):
+            return await update.message.reply_text("Генерирую ответ...")
+    
+    async def _upsert_user(self, update: Update):
+        """Получаем или создаем пользователя"""
+        await self.db_service.get_or_create_user(
+            user_id=update.effective_user.id,
+            username=update.effective_user.username,
+            first_name=update.effective_user.first_name,
+            last_name=update.effective_user.last_name
+        )
+    
+    async def _upsert_user_settings(self, update: Update) -> UserSettings:
+        """Создает пользователя при необходимости и возвращает его настройки"""
+        await self._upsert_user(update)
+        # Через координатор: только что нажатые кнопки настроек уже учтены
+        return await get_settings_coordinator().get_settings(update.effective_user.id)
+    
+    async def _ingest_pasted_document(self, update: Update, user_id: int, chat_id: int,
+                                      text: str) -> Optional[str]:
+        """Индексация длинного текста, вставленного в сообщение
+        
+        Возвращает вопрос к тексту, если он есть в начале или в конце сообщения.
+        """
+        chunk_count = await self.document_service.ingest_text(chat_id, user_id, text)
+        await self.db_service.save_message(
+            user_id, chat_id, "user", f"[Документ: {chunk_count} фрагм., {len(text)} символов]"
+        )
+        question = self.document_service.extract_question(text)
+        if question is None:
+            await update.message.reply_text(
+                "📄 Текст сохранен как документ. Задавайте вопросы — "
+                "я буду использовать подходящие фрагменты."
+            )
+        return question
+    
+    async def _stream_openai_response(
+        self, 
+        placeholder: asyncio.Task, 
+        conversation_history: list, 
+        user_settings: UserSettings,
+        chat_id: int,
+        user_message: str,
+        dialog_turns: int = None
+    ):
+        """Потоковая генерация ответа от OpenAI
+        
+        Запрос к модели открывается сразу, параллельно с отправкой заглушки
+        и записью вопроса пользователя в историю.
+        """
+        chunks = self.openai_service.stream_chat_completion(
+            messages=conversation_history,
+            model=user_settings.model,
+            temperature=user_settings.temperature,
+            max_tokens=user_settings.max_tokens,
+            depth=dialog_turns
+        )
+        first_chunk = asyncio.create_task(chunks.__anext__())
+        user_message_saved = asyncio.create_task(self.db_service.save_message(
+            user_settings.user_id, chat_id, "user", user_message
+        ))
+        
+        try:
+            bot_message = await placeholder
+        except BaseException:
+            await self._cancel_first_chunk(first_chunk)
+            await chunks.aclose()
+            raise
+        
+        await self.stream_reply(
+            bot_message,
+            self._prefetched(chunks, first_chunk),
+            user_settings,
+            before_save=user_message_saved
+        )
+    
+    async def _prefetched(self, chunks, first_chunk: asyncio.Task):
+        """Продолжение потока, первый фрагмент которого запрошен заранее"""
+        try:
+            try:
+                yield await first_chunk
+            except StopAsyncIteration:
+                return
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await self._cancel_first_chunk(first_chunk)
+            await chunks.aclose()
+    
+    @staticmethod
+    async def _cancel_first_chunk(first_chunk: asyncio.Task):
+        """Отменяет ожидание первого фрагмента; поток закрывается после его выхода"""
+        if not first_chunk.done():
+            first_chunk.cancel()
+            await asyncio.wait([first_chunk])
+    
+    async def stream_reply(self, bot_message, chunks, user_settings: UserSettings,
+                           before_save: Optional[Awaitable] = None):
+        """Выводит потоковый ответ в сообщение и сохраняет его в историю
+        
+        before_save — запись, которая должна попасть в историю раньше ответа
+        (вопрос пользователя, сохраняемый вне критического пути).
+        """
+        parts = []
+        
+        # Поток читается в отдельной задаче, чтобы его можно было отменить кнопкой
+        # «Стоп» или новым сообщением; отмена сразу закрывает HTTP-поток модели
+        task = asyncio.create_task(self._consume_stream(bot_message, chunks, parts))
+        generation = self.generations.register(
+            bot_message.chat_id, bot_message.message_id, user_settings.user_id, task
+        )
+        try:
+            with span("llm.stream"):
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    # Отменена не генерация, а сам обработчик
+                    if generation.cancel_reason is None:
+                        raise
+            response_text = "".join(parts)
+            
+            # Финальное обновление сообщения (уже без кнопки «Стоп»)
+            with span("telegram.final_edit"):
+                await bot_message.edit_text(
+                    (response_text + CANCEL_NOTES.get(generation.cancel_reason, "")).strip()
+                )
+            
+            if before_save is not None:
+                await before_save
+            
+            # Сохраняем ответ бота (при отмене — то, что успело сгенерироваться)
+            if response_text:
+                await self.db_service.save_message(
+                    user_settings.user_id, 
+                    bot_message.chat_id, 
+                    "assistant", 
+                    response_text
+                )
+        finally:
+            self.generations.finish(generation)
+    
+    async def _consume_stream(self, bot_message, chunks, parts: list):
+        """Читает поток ответа в parts, периодически обновляя сообщение"""
+        stop_keyboard = GenerationKeyboard.get_stop_keyboard()
+        length = 0
+        try:
+            # Генерация уже в реестре — теперь кнопка «Стоп» работает
+            try:
+                await bot_message.edit_reply_markup(reply_markup=stop_keyboard)
+            except Exception:
+                pass
+            
+            async for chunk in chunks:
+                if not parts:
+                    mark("llm.first_token")
+                parts.append(chunk)
+                length += len(chunk)
+                
+                # Обновляем сообщение каждые 50 символов для плавности
+                if length % 50 == 0:
+                    try:
+                        await bot_message.edit_text("".join(parts), reply_markup=stop_keyboard)
+                    except Exception:
+                        pass
+        finally:
+            # Если отмена пришла во время редактирования, поток тоже нужно закрыть
+            await chunks.aclose()
+    
+    async def supersede_generation(self, chat_id: int):
+        """Прерывает текущую генерацию в чате, если включена политика вытеснения"""
+        if get_settings().supersede_generations:
+            await self.generations.cancel_chat(chat_id, SUPERSEDED)
+    
+    def supersede_queued(self, chat_id: int, update: Update):
+        """Новое сообщение ждет в очереди чата, пока идет генерация
+        
+        Обновления чата обрабатываются по порядку, поэтому без этого сообщение
+        дождалось бы конца ответа, который должно прервать.
+        """
+        if get_settings().supersede_generations and update.message is not None:
+            for generation in self.generations.in_chat(chat_id):
+                generation.cancel(SUPERSEDED)
+    
+    async def handle_stop_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка кнопки «Стоп» под генерируемым ответом"""
+        query = update.callback_query
+        generation = self.generations.get(query.message.chat_id, query.message.message_id)
+        
+        if generation is None:
+            await query.answer("Ответ уже сгенерирован")
+            return
+        
+        if generation.user_id != query.from_user.id:
+            await query.answer("Остановить ответ может только автор запроса")
+            return
+        
+        generation.cancel(STOPPED_BY_USER)
+        await query.answer("Генерация остановлена")
+    
+    async def _handle_ai_assistant(self, message_text: str, ai_assistant_url: str) -> str:
+        """Обработка сообщения через AI-ассистент"""
+        try:
+            response = await self.ai_assistant_service.send_message(
+                url=ai_assistant_url,
+                message=message_text
+            )
+            return response
+        except Exception as e:
             return f"Ошибка при обращении к AI-ассистенту: {str(e)}" 
\ No newline at end of file
@@ -0,0 +1,83 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+DEFAULT_MODEL = "gpt-3.5-turbo"
+DEFAULT_TEMPERATURE = 0.7
+DEFAULT_MAX_TOKENS = 1000
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+
+# Записи неизменяемые и без __dict__: в кэшах на сотни тысяч пользователей
+# это в несколько раз меньше памяти, чем словарь на каждую строку.
+# dataclass(slots=True) появился только в Python 3.10, поэтому __slots__ задан явно.
+
+@dataclass(frozen=True)
+class UserRecord:
+    """Пользователь бота"""
+    __slots__ = ("user_id", "username", "first_name", "last_name")
+
+    user_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    last_name: Optional[str]
+
+
+@dataclass(frozen=True)
+class UserSettings:
+    """Настройки пользователя"""
+    __slots__ = (
+        "user_id", "model", "temperature", "max_tokens",
+        "openai_base_url", "use_ai_assistant", "ai_assistant_url"
+    )
+
+    user_id: int
+    model: str
+    temperature: float
+    max_tokens: int
+    openai_base_url: str
+    use_ai_assistant: bool
+    ai_assistant_url: Optional[str]
+
+    # Порядок колонок, которые ожидает from_row
+    COLUMNS = (
+        "user_id, model, temperature, max_tokens, "
+        "openai_base_url, use_ai_assistant, ai_assistant_url"
+    )
+
+    @classmethod
+    def from_row(cls, row: Tuple) -> "UserSettings":
+        """Создание из строки SELECT COLUMNS FROM user_settings"""
+        user_id, model, temperature, max_tokens, base_url, use_ai_assistant, ai_url = row
+        return cls(
+            user_id,
+            model or DEFAULT_MODEL,
+            DEFAULT_TEMPERATURE if temperature is None else temperature,
+            max_tokens or DEFAULT_MAX_TOKENS,
+            base_url or DEFAULT_BASE_URL,
+            bool(use_ai_assistant),
+            ai_url
+        )
+
+
+@dataclass(frozen=True)
+class HistoryTurn:
+    """Одна реплика истории диалога"""
+    __slots__ = ("role", "content")
+
+    role: str
+    content: str
+
+    def to_openai(self) -> Dict[str, str]:
+        """Сообщение в формате OpenAI Chat Completions"""
+        return {'role': self.role, 'content': self.content}
+
+
+Message = Union[HistoryTurn, Dict[str, Any]]
+
+
+def to_openai_messages(messages: Iterable[Message]) -> List[Dict[str, Any]]:
+    """Переводит историю в формат OpenAI только перед отправкой запроса"""
+    return [
+        message.to_openai() if isinstance(message, HistoryTurn) else message
+        for message in messages
+    ]
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Set
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from config.settings import get_settings
+from services.database_service import DatabaseService
+from utils.metrics import metrics
+from utils.rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+MAX_SEND_ATTEMPTS = 3
+
+# Ошибки BadRequest, после которых писать пользователю бессмысленно
+UNREACHABLE_ERRORS = ("chat not found", "user is deactivated", "peer_id_invalid")
+
+
+class BroadcastService:
+    """Рассылка всем пользователям с учетом лимитов Telegram
+
+    Получатели читаются из БД пачками (keyset-пагинация), отправка идет
+    через общий token bucket. После каждой пачки сохраняется контрольная
+    точка, поэтому после падения рассылка продолжается с места остановки
+    (повторно может уйти не более одной пачки).
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.db_service = DatabaseService()
+        self.bucket = TokenBucket(self.settings.broadcast_rate)
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._cancelled: Set[int] = set()
+
+    async def start(self, bot, admin_chat_id: int, text: str = None,
+                    source_chat_id: int = None, source_message_id: int = None) -> int:
+        """Создает рассылку и запускает ее в фоне"""
+        broadcast_id = await self.db_service.create_broadcast(
+            admin_chat_id, text=text,
+            source_chat_id=source_chat_id, source_message_id=source_message_id
+        )
+        broadcast = await self.db_service.get_broadcast(broadcast_id)
+        self._launch(bot, broadcast)
+        return broadcast_id
+
+    async def resume_unfinished(self, bot):
+        """Продолжает рассылки, прерванные перезапуском процесса"""
+        for broadcast in await self.db_service.get_unfinished_broadcasts():
+            if broadcast['id'] not in self._tasks:
+                logger.info("Продолжаем рассылку %s с user_id > %s",
+                            broadcast['id'], broadcast['last_user_id'])
+                self._launch(bot, broadcast)
+
+    def cancel(self, broadcast_id: int) -> bool:
+        task = self._tasks.get(broadcast_id)
+        if task is None:
+            return False
+        self._cancelled.add(broadcast_id)
+        task.cancel()
+        return True
+
+    def _launch(self, bot, broadcast: Dict[str, Any]):
+        task = asyncio.create_task(self._run(bot, broadcast))
+        self._tasks[broadcast['id']] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast['id'], None))
+
+    async def _run(self, bot, broadcast: Dict[str, Any]):
+        """Основной цикл рассылки"""
+        counters = {
+            'sent': broadcast['sent'],
+            'failed': broadcast['failed'],
+            'blocked': broadcast['blocked']
+        }
+        last_user_id = broadcast['last_user_id']
+        status = 'running'
+
+        status_message = await self._report(bot, broadcast, counters, None, "начата")
+        last_report = time.monotonic()
+
+        try:
+            while True:
+                recipients = await self.db_service.get_broadcast_recipients(
+                    last_user_id, self.settings.broadcast_batch_size
+                )
+                if not recipients:
+                    break
+
+                results = await asyncio.gather(*(
+                    self._send(bot, broadcast, user_id) for user_id in recipients
+                ))
+                for result in results:
+                    counters[result] += 1
+                last_user_id = recipients[-1]
+
+                await self.db_service.save_broadcast_checkpoint(
+                    broadcast['id'], last_user_id, **counters
+                )
+
+                if time.monotonic() - last_report >= self.settings.broadcast_progress_interval:
+                    status_message = await self._report(
+                        bot, broadcast, counters, status_message, "идет"
+                    )
+                    last_report = time.monotonic()
+
+            status = 'done'
+        except asyncio.CancelledError:
+            # Остановка процесса не отменяет рассылку: после запуска она продолжится
+            status = 'cancelled' if broadcast['id'] in self._cancelled else 'running'
+            raise
+        except Exception:
+            status = 'failed'
+            logger.exception("Рассылка %s прервана ошибкой", broadcast['id'])
+        finally:
+            # При падении процесса статус тоже останется running — рассылку продолжит resume
+            await self.db_service.save_broadcast_checkpoint(
+                broadcast['id'], last_user_id, status=status, **counters
+            )
+            titles = {
+                'done': "завершена",
+                'cancelled': "отменена",
+                'failed': "прервана ошибкой",
+                'running': "приостановлена до перезапуска"
+            }
+            await self._report(bot, broadcast, counters, status_message, titles[status])
+
+    async def _send(self, bot, broadcast: Dict[str, Any], user_id: int) -> str:
+        """Отправка одному получателю: sent, blocked или failed"""
+        for _ in range(MAX_SEND_ATTEMPTS):
+            await self.bucket.acquire()
+            try:
+                if broadcast['source_message_id']:
+                    await bot.copy_message(
+                        chat_id=user_id,
+                        from_chat_id=broadcast['source_chat_id'],
+                        message_id=broadcast['source_message_id']
+                    )
+                else:
+                    await bot.send_message(chat_id=user_id, text=broadcast['text'])
+                metrics.inc("broadcast_messages_total", result="sent")
+                return 'sent'
+            except RetryAfter as e:
+                # Флуд-контроль Telegram: притормаживаем всю рассылку
+                delay = e.retry_after
+                if hasattr(delay, "total_seconds"):
+                    delay = delay.total_seconds()
+                metrics.inc("broadcast_retry_after_total")
+                self.bucket.pause(float(delay) + 0.5)
+            except Forbidden:
+                await self.db_service.mark_user_blocked(user_id)
+                metrics.inc("broadcast_messages_total", result="blocked")
+                return 'blocked'
+            except BadRequest as e:
+                if any(error in str(e).lower() for error in UNREACHABLE_ERRORS):
+                    await self.db_service.mark_user_blocked(user_id)
+                    metrics.inc("broadcast_messages_total", result="blocked")
+                    return 'blocked'
+                break
+            except TelegramError:
+                logger.warning("Ошибка отправки рассылки пользователю %s", user_id, exc_info=True)
+
+        metrics.inc("broadcast_messages_total", result="failed")
+        return 'failed'
+
+    async def _report(self, bot, broadcast: Dict[str, Any], counters: Dict[str, int],
+                      status_message, title: str):
+        """Сообщение администратору о ходе рассылки (ошибки отчета не мешают рассылке)"""
+        text = (
+            f"📣 Рассылка #{broadcast['id']} {title}\n"
+            f"✅ Доставлено: {counters['sent']}\n"
+            f"🚫 Заблокировали бота: {counters['blocked']}\n"
+            f"❌ Ошибки: {counters['failed']}"
+        )
+        try:
+            if status_message is None:
+                return await bot.send_message(chat_id=broadcast['admin_chat_id'], text=text)
+            await status_message.edit_text(text)
+        except TelegramError:
+            logger.warning("Не удалось обновить прогресс рассылки", exc_info=True)
+        return status_message
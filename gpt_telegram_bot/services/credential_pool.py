@@ -0,0 +1,200 @@
+import logging
+import openai
+import re
+import time
+from typing import Callable, List, Optional, Tuple
+
+from config.settings import get_settings
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Длительности в заголовках x-ratelimit-reset-*: "1s", "6m0s", "20ms", "1h2m3.5s"
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+class NoCredentialsError(Exception):
+    """Все ключи временно исключены из пула"""
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Секунды из значения заголовка x-ratelimit-reset-* или retry-after"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _int_header(headers, name: str) -> Optional[int]:
+    value = headers.get(name)
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class Credential:
+    """Ключ API с эндпоинтом, клиентом и текущей нагрузкой"""
+
+    __slots__ = ("name", "endpoint", "client", "outstanding_tokens", "in_flight",
+                 "remaining_requests", "remaining_tokens", "quota_reset_at", "ejected_until")
+
+    def __init__(self, name: str, endpoint: str, client):
+        self.name = name
+        self.endpoint = endpoint
+        self.client = client
+        # Токены запросов, которые выполняются прямо сейчас (оценка)
+        self.outstanding_tokens = 0
+        self.in_flight = 0
+        # Остаток лимитов по последним заголовкам ответа (None — неизвестно)
+        self.remaining_requests: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+        self.quota_reset_at = 0.0
+        self.ejected_until = 0.0
+
+    def has_quota(self, tokens: int, now: float) -> bool:
+        """Хватает ли известного остатка лимитов на запрос"""
+        if now >= self.quota_reset_at:
+            return True
+        if self.remaining_requests is not None and self.remaining_requests <= self.in_flight:
+            return False
+        return self.remaining_tokens is None or self.remaining_tokens - self.outstanding_tokens >= tokens
+
+
+class CredentialPool:
+    """Пул ключей API с балансировкой по наименьшему числу токенов в работе
+
+    Остаток лимитов каждого ключа берется из заголовков x-ratelimit-*;
+    ключи, получившие 429 или ошибку авторизации, исключаются из выбора
+    на время и возвращаются автоматически.
+    """
+
+    def __init__(self, entries: List[Tuple[str, str]], client_factory: Callable[[str, str], object],
+                 rate_limit_cooldown: float = 60, auth_cooldown: float = 600):
+        if not entries:
+            raise ValueError("Не задан ни один ключ API")
+        self.rate_limit_cooldown = rate_limit_cooldown
+        self.auth_cooldown = auth_cooldown
+        self.credentials: List[Credential] = []
+        for api_key, endpoint in entries:
+            credential = Credential(f"…{api_key[-4:]}", endpoint, client_factory(api_key, endpoint))
+            self.credentials.append(credential)
+            metrics.gauge("openai_key_outstanding_tokens", lambda c=credential: c.outstanding_tokens,
+                          key=credential.name)
+            metrics.gauge("openai_key_ejected", lambda c=credential: float(c.ejected_until > time.monotonic()),
+                          key=credential.name)
+
+    @staticmethod
+    def parse_entries(keys: str, default_endpoint: str) -> List[Tuple[str, str]]:
+        """Разбор OPENAI_API_KEYS: "ключ" или "ключ@https://эндпоинт/v1" через запятую"""
+        entries = []
+        for item in keys.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            api_key, _, endpoint = item.partition("@")
+            entries.append((api_key, endpoint or default_endpoint))
+        return entries
+
+    def __len__(self) -> int:
+        return len(self.credentials)
+
+    def pick(self, tokens: int = 0) -> Credential:
+        """Выбор ключа без захвата (наименьшая нагрузка среди доступных)"""
+        now = time.monotonic()
+        available = [c for c in self.credentials if c.ejected_until <= now]
+        if not available:
+            wait = min(c.ejected_until for c in self.credentials) - now
+            raise NoCredentialsError(f"все ключи API временно недоступны, повторите через {wait:.0f} с")
+
+        # Ключи с исчерпанным остатком — только если других нет
+        with_quota = [c for c in available if c.has_quota(tokens, now)] or available
+        return min(
+            with_quota,
+            key=lambda c: (c.outstanding_tokens, -(c.remaining_tokens if c.remaining_tokens is not None
+                                                   and now < c.quota_reset_at else float('inf')))
+        )
+
+    def acquire(self, tokens: int) -> Credential:
+        credential = self.pick(tokens)
+        credential.outstanding_tokens += tokens
+        credential.in_flight += 1
+        return credential
+
+    def release(self, credential: Credential, tokens: int):
+        credential.outstanding_tokens -= tokens
+        credential.in_flight -= 1
+
+    def update_quota(self, credential: Credential, headers):
+        """Обновляет остаток лимитов по заголовкам ответа"""
+        remaining_requests = _int_header(headers, "x-ratelimit-remaining-requests")
+        remaining_tokens = _int_header(headers, "x-ratelimit-remaining-tokens")
+        if remaining_requests is None and remaining_tokens is None:
+            return
+
+        resets = [
+            parse_duration(headers.get("x-ratelimit-reset-requests")),
+            parse_duration(headers.get("x-ratelimit-reset-tokens"))
+        ]
+        reset = max((value for value in resets if value is not None), default=60.0)
+        credential.remaining_requests = remaining_requests
+        credential.remaining_tokens = remaining_tokens
+        credential.quota_reset_at = time.monotonic() + reset
+
+    def eject(self, credential: Credential, seconds: float, reason: str):
+        """Временно исключает ключ из выбора"""
+        credential.ejected_until = max(credential.ejected_until, time.monotonic() + seconds)
+        metrics.inc("openai_key_ejections_total", key=credential.name, reason=reason)
+        logger.warning("Ключ %s (%s) исключен из пула на %.0f с: %s",
+                       credential.name, credential.endpoint, seconds, reason)
+
+    def eject_rate_limited(self, credential: Credential, headers, insufficient_quota: bool = False):
+        """429: ждем столько, сколько просит сервер, а при исчерпанной квоте — дольше"""
+        if insufficient_quota:
+            self.eject(credential, self.auth_cooldown, "insufficient_quota")
+            return
+        seconds = (
+            parse_duration(headers.get("retry-after"))
+            or parse_duration(headers.get("x-ratelimit-reset-requests"))
+            or parse_duration(headers.get("x-ratelimit-reset-tokens"))
+            or self.rate_limit_cooldown
+        )
+        self.eject(credential, seconds, "rate_limit")
+
+    def eject_unauthorized(self, credential: Credential):
+        self.eject(credential, self.auth_cooldown, "auth")
+
+
+def create_client(api_key: str, endpoint: str, **kwargs) -> openai.AsyncOpenAI:
+    """Клиент одного ключа пула
+
+    Без повторов внутри SDK: на 429 он ждал бы retry-after на том же ключе,
+    а пул сразу переключается на другой.
+    """
+    return openai.AsyncOpenAI(api_key=api_key, base_url=endpoint, max_retries=0, **kwargs)
+
+
+_pool: Optional[CredentialPool] = None
+
+def get_credential_pool() -> CredentialPool:
+    """Общий пул ключей процесса (нагрузка учитывается по всем сервисам)"""
+    global _pool
+    if _pool is None:
+        settings = get_settings()
+        entries = CredentialPool.parse_entries(
+            settings.openai_api_keys or settings.openai_api_key or "", settings.openai_base_url
+        )
+        _pool = CredentialPool(
+            entries,
+            create_client,
+            rate_limit_cooldown=settings.openai_key_cooldown,
+            auth_cooldown=settings.openai_auth_cooldown
+        )
+    return _pool
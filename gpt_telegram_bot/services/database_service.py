@@ -1,190 +1,769 @@
-import sqlite3
-import json
-from typing import List, Dict, Any, Optional
-from datetime import datetime
-import asyncio
-from config.settings import get_settings
-
-class DatabaseService:
-    def __init__(self):
-        self.settings = get_settings()
-        self.db_path = self.settings.database_url.replace("sqlite:///", "")
-        self._init_database()
-    
-    def _init_database(self):
-        """Инициализация базы данных"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Создание таблицы пользователей
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY,
-                user_id INTEGER UNIQUE NOT NULL,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Создание таблицы настроек пользователей
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_settings (
-                id INTEGER PRIMARY KEY,
-                user_id INTEGER UNIQUE NOT NULL,
-                model TEXT DEFAULT 'gpt-3.5-turbo',
-                temperature REAL DEFAULT 0.7,
-                max_tokens INTEGER DEFAULT 1000,
-                openai_base_url TEXT DEFAULT 'https://api.openai.com/v1',
-                use_ai_assistant BOOLEAN DEFAULT 0,
-                ai_assistant_url TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-        
-        # Создание таблицы сообщений
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                chat_id INTEGER NOT NULL,
-                role TEXT NOT NULL,
-                content TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
-    
-    async def get_or_create_user(self, user_id: int, username: str = None, 
-                                first_name: str = None, last_name: str = None) -> Dict[str, Any]:
-        """Получение или создание пользователя"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Проверяем, существует ли пользователь
-        cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-        user = cursor.fetchone()
-        
-        if user is None:
-            # Создаем нового пользователя
-            cursor.execute('''
-                INSERT INTO users (user_id, username, first_name, last_name)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, username, first_name, last_name))
-            
-            # Создаем настройки по умолчанию
-            cursor.execute('''
-                INSERT INTO user_settings (user_id)
-                VALUES (?)
-            ''', (user_id,))
-            
-            conn.commit()
-            
-            # Получаем созданного пользователя
-            cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-            user = cursor.fetchone()
-        
-        conn.close()
-        
-        return {
-            'id': user[0],
-            'user_id': user[1],
-            'username': user[2],
-            'first_name': user[3],
-            'last_name': user[4],
-            'created_at': user[5]
-        }
-    
-    async def get_user_settings(self, user_id: int) -> Dict[str, Any]:
-        """Получение настроек пользователя"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM user_settings WHERE user_id = ?
-        ''', (user_id,))
-        
-        settings = cursor.fetchone()
-        conn.close()
-        
-        if settings is None:
-            # Создаем настройки по умолчанию
-            await self.get_or_create_user(user_id)
-            return await self.get_user_settings(user_id)
-        
-        return {
-            'id': settings[0],
-            'user_id': settings[1],
-            'model': settings[2],
-            'temperature': settings[3],
-            'max_tokens': settings[4],
-            'openai_base_url': settings[5],
-            'use_ai_assistant': bool(settings[6]),
-            'ai_assistant_url': settings[7],
-            'created_at': settings[8],
-            'updated_at': settings[9]
-        }
-    
-    async def update_user_setting(self, user_id: int, setting_name: str, value: Any):
-        """Обновление настройки пользователя"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Проверяем, что настройки существуют
-        cursor.execute('SELECT id FROM user_settings WHERE user_id = ?', (user_id,))
-        if not cursor.fetchone():
-            await self.get_or_create_user(user_id)
-        
-        # Обновляем настройку
-        cursor.execute(f'''
-            UPDATE user_settings 
-            SET {setting_name} = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE user_id = ?
-        ''', (value, user_id))
-        
-        conn.commit()
-        conn.close()
-    
-    async def save_message(self, user_id: int, chat_id: int, role: str, content: str):
-        """Сохранение сообщения"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO messages (user_id, chat_id, role, content)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, chat_id, role, content))
-        
-        conn.commit()
-        conn.close()
-    
-    async def get_conversation_history(self, user_id: int, limit: int = 10) -> List[Dict[str, str]]:
-        """Получение истории диалога"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT role, content FROM messages 
-            WHERE user_id = ? 
-            ORDER BY created_at DESC 
-            LIMIT ?
-        ''', (user_id, limit * 2))  # Получаем больше сообщений для правильного порядка
-        
-        messages = cursor.fetchall()
-        conn.close()
-        
-        # Преобразуем в формат для OpenAI API
-        conversation = []
-        for role, content in reversed(messages):  # Разворачиваем порядок
-            conversation.append({
-                'role': role,
-                'content': content
-            })
-        
-        return conversation[-limit:]  # Возвращаем последние limit сообщений 
\ No newline at end of file
+import sqlite3
+import json
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime
+import asyncio
+import functools
+import time
+from config.settings import get_settings
+from models.records import UserRecord, UserSettings, HistoryTurn
+from utils.tracing import traced
+
+USER_SELECT = 'SELECT user_id, username, first_name, last_name FROM users WHERE user_id = ?'
+SETTINGS_SELECT = f'SELECT {UserSettings.COLUMNS} FROM user_settings WHERE user_id = ?'
+
+# Колонки user_settings, которые можно менять (имена подставляются в SQL)
+EDITABLE_SETTINGS = (
+    "model", "temperature", "max_tokens", "openai_base_url", "use_ai_assistant", "ai_assistant_url"
+)
+
+# Токен чата в полнотекстовых индексах (минус в id групп не является частью слова)
+CHAT_KEY_SQL = "'chat' || replace({chat_id}, '-', 'm')"
+
+def chat_token(chat_id: int) -> str:
+    """Значение CHAT_KEY_SQL для chat_id"""
+    return 'chat' + str(chat_id).replace('-', 'm')
+
+def in_thread(func):
+    """Синхронный метод с запросами к SQLite -> корутина, выполняемая в пуле потоков
+
+    Так запросы не блокируют event loop и действительно идут параллельно
+    с другим вводом-выводом (каждый вызов открывает свое соединение).
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return wrapper
+
+class DatabaseService:
+    def __init__(self):
+        self.settings = get_settings()
+        self.db_path = self.settings.database_url.replace("sqlite:///", "")
+        self._init_database()
+    
+    def _init_database(self):
+        """Инициализация базы данных"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        # Создание таблицы пользователей
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER UNIQUE NOT NULL,
+                username TEXT,
+                first_name TEXT,
+                last_name TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Создание таблицы настроек пользователей
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_settings (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER UNIQUE NOT NULL,
+                model TEXT DEFAULT 'gpt-3.5-turbo',
+                temperature REAL DEFAULT 0.7,
+                max_tokens INTEGER DEFAULT 1000,
+                openai_base_url TEXT DEFAULT 'https://api.openai.com/v1',
+                use_ai_assistant BOOLEAN DEFAULT 0,
+                ai_assistant_url TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+        ''')
+        
+        # Создание таблицы сообщений
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                chat_id INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+        ''')
+        
+        # Создание таблицы документов
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                chat_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                file_name TEXT,
+                chunk_count INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Полнотекстовый индекс фрагментов документов. Как и в messages_fts,
+        # чат индексируется токеном (chat_key): MATCH сразу сужает поиск до
+        # фрагментов чата, а не ранжирует совпадения из всех чатов
+        cursor.execute("PRAGMA table_info(document_chunks)")
+        chunk_columns = [row[1] for row in cursor.fetchall()]
+        migrate_chunks = bool(chunk_columns) and 'chat_key' not in chunk_columns
+        if migrate_chunks:
+            cursor.execute('ALTER TABLE document_chunks RENAME TO document_chunks_old')
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS document_chunks USING fts5(
+                content,
+                chat_key,
+                document_id UNINDEXED,
+                chat_id UNINDEXED,
+                chunk_index UNINDEXED,
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+        ''')
+        if migrate_chunks:
+            # Индекс прежнего формата (без токена чата) переносим целиком
+            cursor.execute(f'''
+                INSERT INTO document_chunks (content, chat_key, document_id, chat_id, chunk_index)
+                SELECT content, {CHAT_KEY_SQL.format(chat_id='chat_id')}, document_id, chat_id, chunk_index
+                FROM document_chunks_old
+            ''')
+            cursor.execute('DROP TABLE document_chunks_old')
+        
+        # Кэш сводок по диапазонам сообщений чата
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chat_summaries (
+                id INTEGER PRIMARY KEY,
+                chat_id INTEGER NOT NULL,
+                first_message_id INTEGER NOT NULL,
+                last_message_id INTEGER NOT NULL,
+                summary TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_chat_summaries_chat
+            ON chat_summaries (chat_id, last_message_id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_messages_chat
+            ON messages (chat_id, id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_messages_user
+            ON messages (user_id, id)
+        ''')
+        
+        # Полнотекстовый индекс сообщений для /search. Таблица с внешним
+        # содержимым хранит только индекс, текст берется из messages через
+        # представление. Чат индексируется отдельным токеном (chat_key), чтобы
+        # MATCH сразу сужал поиск до чата, а не ранжировал совпадения всей базы.
+        # Новые сообщения индексируются не триггером в транзакции save_message,
+        # а пачками (index_new_messages): до какого id индекс готов, хранит
+        # search_index_state.
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'")
+        fts_exists = cursor.fetchone() is not None
+        cursor.execute(f'''
+            CREATE VIEW IF NOT EXISTS messages_search AS
+            SELECT id, content, {CHAT_KEY_SQL.format(chat_id='chat_id')} AS chat_key FROM messages
+        ''')
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                content,
+                chat_key,
+                content = 'messages_search',
+                content_rowid = 'id',
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '3 4'
+            )
+        ''')
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'search_index_state'")
+        if cursor.fetchone() is None:
+            cursor.execute('CREATE TABLE search_index_state (last_id INTEGER NOT NULL)')
+            # Индекс, который вел триггер вставки, уже полон; новый (и уже
+            # сохраненные до появления поиска сообщения) заполнит index_new_messages
+            cursor.execute('''
+                INSERT INTO search_index_state (last_id)
+                SELECT CASE WHEN ? THEN IFNULL(MAX(id), 0) ELSE 0 END FROM messages
+            ''', (fts_exists,))
+            cursor.execute('DROP TRIGGER IF EXISTS messages_fts_insert')
+            cursor.execute('DROP TRIGGER IF EXISTS messages_fts_delete')
+        # Из индекса удаляем только то, что в него уже попало
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages
+            WHEN old.id <= (SELECT last_id FROM search_index_state) BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, content, chat_key)
+                VALUES ('delete', old.id, old.content, {CHAT_KEY_SQL.format(chat_id='old.chat_id')});
+            END
+        ''')
+        
+        # Ключи уже обработанных обновлений Telegram (идемпотентность)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS processed_updates (
+                key TEXT PRIMARY KEY,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_processed_updates_expires
+            ON processed_updates (expires_at)
+        ''')
+        
+        # Рассылки и их контрольные точки
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                id INTEGER PRIMARY KEY,
+                text TEXT,
+                source_chat_id INTEGER,
+                source_message_id INTEGER,
+                admin_chat_id INTEGER NOT NULL,
+                status TEXT DEFAULT 'running',
+                last_user_id INTEGER DEFAULT 0,
+                sent INTEGER DEFAULT 0,
+                failed INTEGER DEFAULT 0,
+                blocked INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Пользователи, заблокировавшие бота (исключаются из рассылок)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS blocked_users (
+                user_id INTEGER PRIMARY KEY,
+                blocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        conn.commit()
+        conn.close()
+    
+    @traced("db.get_or_create_user")
+    @in_thread
+    def get_or_create_user(self, user_id: int, username: str = None, 
+                                first_name: str = None, last_name: str = None) -> UserRecord:
+        """Получение или создание пользователя"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        # Проверяем, существует ли пользователь
+        cursor.execute(USER_SELECT, (user_id,))
+        user = cursor.fetchone()
+        
+        if user is None:
+            # Создаем нового пользователя (OR IGNORE: его мог создать параллельный запрос)
+            cursor.execute('''
+                INSERT OR IGNORE INTO users (user_id, username, first_name, last_name)
+                VALUES (?, ?, ?, ?)
+            ''', (user_id, username, first_name, last_name))
+            
+            # Создаем настройки по умолчанию
+            cursor.execute('''
+                INSERT OR IGNORE INTO user_settings (user_id)
+                VALUES (?)
+            ''', (user_id,))
+            
+            conn.commit()
+            
+            # Получаем созданного пользователя
+            cursor.execute(USER_SELECT, (user_id,))
+            user = cursor.fetchone()
+        
+        conn.close()
+        
+        return UserRecord(*user)
+    
+    @traced("db.get_user_settings")
+    @in_thread
+    def get_user_settings(self, user_id: int) -> UserSettings:
+        """Получение настроек пользователя"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute(SETTINGS_SELECT, (user_id,))
+        
+        settings = cursor.fetchone()
+        
+        if settings is None:
+            # Создаем пользователя с настройками по умолчанию
+            cursor.execute('INSERT OR IGNORE INTO users (user_id) VALUES (?)', (user_id,))
+            cursor.execute('INSERT OR IGNORE INTO user_settings (user_id) VALUES (?)', (user_id,))
+            conn.commit()
+            cursor.execute(SETTINGS_SELECT, (user_id,))
+            settings = cursor.fetchone()
+        
+        conn.close()
+        
+        return UserSettings.from_row(settings)
+    
+    @traced("db.update_user_setting")
+    async def update_user_setting(self, user_id: int, setting_name: str, value: Any):
+        """Обновление настройки пользователя"""
+        if setting_name not in EDITABLE_SETTINGS:
+            raise ValueError(f"Неизвестная настройка: {setting_name}")
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        # Проверяем, что настройки существуют
+        cursor.execute('SELECT id FROM user_settings WHERE user_id = ?', (user_id,))
+        if not cursor.fetchone():
+            await self.get_or_create_user(user_id)
+        
+        # Обновляем настройку
+        cursor.execute(f'''
+            UPDATE user_settings 
+            SET {setting_name} = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE user_id = ?
+        ''', (value, user_id))
+        
+        conn.commit()
+        conn.close()
+
+    @traced("db.update_user_settings")
+    @in_thread
+    def update_user_settings(self, user_id: int, values: Dict[str, Any]):
+        """Обновление нескольких настроек пользователя одним UPDATE"""
+        unknown = set(values) - set(EDITABLE_SETTINGS)
+        if unknown:
+            raise ValueError(f"Неизвестные настройки: {', '.join(sorted(unknown))}")
+
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('INSERT OR IGNORE INTO users (user_id) VALUES (?)', (user_id,))
+        cursor.execute('INSERT OR IGNORE INTO user_settings (user_id) VALUES (?)', (user_id,))
+
+        assignments = ", ".join(f"{name} = ?" for name in values)
+        cursor.execute(f'''
+            UPDATE user_settings
+            SET {assignments}, updated_at = CURRENT_TIMESTAMP
+            WHERE user_id = ?
+        ''', (*values.values(), user_id))
+
+        conn.commit()
+        conn.close()
+
+    @traced("db.save_message")
+    @in_thread
+    def save_message(self, user_id: int, chat_id: int, role: str, content: str):
+        """Сохранение сообщения"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            INSERT INTO messages (user_id, chat_id, role, content)
+            VALUES (?, ?, ?, ?)
+        ''', (user_id, chat_id, role, content))
+        
+        conn.commit()
+        conn.close()
+    
+    @traced("db.get_conversation_history")
+    @in_thread
+    def get_conversation_history(self, user_id: int, limit: int = 10) -> List[HistoryTurn]:
+        """Получение истории диалога (в формат OpenAI переводится при отправке)"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        # id растет монотонно, в отличие от created_at с точностью до секунды
+        cursor.execute('''
+            SELECT role, content FROM messages 
+            WHERE user_id = ? 
+            ORDER BY id DESC 
+            LIMIT ?
+        ''', (user_id, limit))
+        
+        messages = cursor.fetchall()
+        conn.close()
+        
+        # Возвращаем последние limit сообщений в хронологическом порядке
+        return [HistoryTurn(role, content) for role, content in reversed(messages)]
+    
+    @traced("db.count_dialog_turns")
+    @in_thread
+    def count_dialog_turns(self, user_id: int, window_minutes: int = 30, limit: int = 200) -> int:
+        """Число реплик пользователя в текущем диалоге
+        
+        Диалогом считаются сообщения за последние window_minutes; смотрим
+        не дальше limit последних сообщений, чтобы запрос оставался дешевым.
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT COUNT(*) FROM (
+                SELECT role, created_at FROM messages
+                WHERE user_id = ?
+                ORDER BY id DESC
+                LIMIT ?
+            )
+            WHERE role = 'user' AND created_at >= datetime('now', ?)
+        ''', (user_id, limit, f'-{window_minutes} minutes'))
+        
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
+    
+    @traced("db.create_document")
+    @in_thread
+    def create_document(self, chat_id: int, user_id: int, file_name: str = None) -> int:
+        """Создание записи о документе"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            INSERT INTO documents (chat_id, user_id, file_name)
+            VALUES (?, ?, ?)
+        ''', (chat_id, user_id, file_name))
+        document_id = cursor.lastrowid
+        
+        conn.commit()
+        conn.close()
+        
+        return document_id
+    
+    @traced("db.add_document_chunks")
+    @in_thread
+    def add_document_chunks(self, document_id: int, chat_id: int, 
+                            start_index: int, chunks: List[str]):
+        """Добавление пачки фрагментов документа в индекс"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        chat_key = chat_token(chat_id)
+        cursor.executemany('''
+            INSERT INTO document_chunks (content, chat_key, document_id, chat_id, chunk_index)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [
+            (chunk, chat_key, document_id, chat_id, start_index + offset)
+            for offset, chunk in enumerate(chunks)
+        ])
+        cursor.execute('''
+            UPDATE documents SET chunk_count = ? WHERE id = ?
+        ''', (start_index + len(chunks), document_id))
+        
+        conn.commit()
+        conn.close()
+    
+    @traced("db.search_document_chunks")
+    @in_thread
+    def search_document_chunks(self, chat_id: int, query: str, limit: int = 4) -> List[str]:
+        """Поиск наиболее релевантных фрагментов документов чата"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        try:
+            # Токен чата не влияет на ранг: у колонки chat_key нулевой вес
+            cursor.execute('''
+                SELECT content FROM document_chunks
+                WHERE document_chunks MATCH ?
+                ORDER BY bm25(document_chunks, 1.0, 0.0)
+                LIMIT ?
+            ''', (f'chat_key : {chat_token(chat_id)} AND content : ({query})', limit))
+            chunks = [row[0] for row in cursor.fetchall()]
+        except sqlite3.OperationalError:
+            # Некорректный поисковый запрос FTS5
+            chunks = []
+        finally:
+            conn.close()
+        
+        return chunks
+    
+    @traced("db.index_new_messages")
+    @in_thread
+    def index_new_messages(self, batch_size: int = 1000) -> int:
+        """Добавляет в поисковый индекс сообщения, сохраненные после прошлого вызова
+        
+        Работает пачками по batch_size в отдельных транзакциях, чтобы не
+        держать блокировку записи долго. Возвращает число новых сообщений.
+        """
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        cursor = conn.cursor()
+        
+        indexed = 0
+        try:
+            while True:
+                # BEGIN IMMEDIATE: параллельный вызов не проиндексирует те же строки дважды
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.execute('SELECT last_id FROM search_index_state')
+                last_id = cursor.fetchone()[0]
+                cursor.execute('''
+                    SELECT MAX(id) FROM (
+                        SELECT id FROM messages WHERE id > ? ORDER BY id LIMIT ?
+                    )
+                ''', (last_id, batch_size))
+                up_to = cursor.fetchone()[0]
+                if up_to is None:
+                    cursor.execute('COMMIT')
+                    break
+                
+                cursor.execute('''
+                    INSERT INTO messages_fts (rowid, content, chat_key)
+                    SELECT id, content, chat_key FROM messages_search
+                    WHERE id > ? AND id <= ?
+                ''', (last_id, up_to))
+                indexed += cursor.rowcount
+                cursor.execute('UPDATE search_index_state SET last_id = ?', (up_to,))
+                cursor.execute('COMMIT')
+        finally:
+            if conn.in_transaction:
+                cursor.execute('ROLLBACK')
+            conn.close()
+        
+        return indexed
+    
+    @traced("db.search_message_ids")
+    @in_thread
+    def search_message_ids(self, chat_id: int, query: str, limit: int = 500) -> List[int]:
+        """id сообщений чата, подходящих под запрос, по убыванию релевантности (bm25)"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        try:
+            # Токен чата не влияет на ранг: у колонки chat_key нулевой вес
+            cursor.execute('''
+                SELECT rowid FROM messages_fts
+                WHERE messages_fts MATCH ?
+                ORDER BY bm25(messages_fts, 1.0, 0.0), rowid
+                LIMIT ?
+            ''', (f'chat_key : {chat_token(chat_id)} AND content : ({query})', limit))
+            ids = [row[0] for row in cursor.fetchall()]
+        except sqlite3.OperationalError:
+            # Некорректный поисковый запрос FTS5
+            ids = []
+        finally:
+            conn.close()
+        
+        return ids
+    
+    @traced("db.get_search_snippets")
+    @in_thread
+    def get_search_snippets(self, chat_id: int, query: str, ids: List[int]) -> List[Tuple]:
+        """Фрагменты найденных сообщений ids в том же порядке
+        
+        Возвращает строки (id, role, snippet, created_at).
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        placeholders = ','.join('?' * len(ids))
+        cursor.execute(f'''
+            SELECT m.id, m.role, snippet(messages_fts, 0, char(2), char(3), '…', 16), m.created_at
+            FROM messages_fts
+            JOIN messages m ON m.id = messages_fts.rowid
+            WHERE messages_fts MATCH ? AND messages_fts.rowid IN ({placeholders})
+        ''', (f'chat_key : {chat_token(chat_id)} AND content : ({query})', *ids))
+        rows = {row[0]: row for row in cursor.fetchall()}
+        conn.close()
+        
+        return [rows[message_id] for message_id in ids if message_id in rows]
+    
+    @traced("db.get_chat_messages_page")
+    async def get_chat_messages_page(self, chat_id: int, after_id: int = 0, 
+                                     limit: int = 200) -> List[Tuple[int, str, str]]:
+        """Страница сообщений чата после after_id (keyset-пагинация)"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT id, role, content FROM messages
+            WHERE chat_id = ? AND id > ?
+            ORDER BY id
+            LIMIT ?
+        ''', (chat_id, after_id, limit))
+        
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return rows
+    
+    @traced("db.get_latest_chat_summary")
+    async def get_latest_chat_summary(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        """Получение последней сохраненной сводки чата"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT first_message_id, last_message_id, summary FROM chat_summaries
+            WHERE chat_id = ?
+            ORDER BY last_message_id DESC
+            LIMIT 1
+        ''', (chat_id,))
+        
+        row = cursor.fetchone()
+        conn.close()
+        
+        if row is None:
+            return None
+        
+        return {
+            'first_message_id': row[0],
+            'last_message_id': row[1],
+            'summary': row[2]
+        }
+    
+    @traced("db.save_chat_summary")
+    async def save_chat_summary(self, chat_id: int, first_message_id: int, 
+                                last_message_id: int, summary: str):
+        """Сохранение сводки по диапазону сообщений"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            INSERT INTO chat_summaries (chat_id, first_message_id, last_message_id, summary)
+            VALUES (?, ?, ?, ?)
+        ''', (chat_id, first_message_id, last_message_id, summary))
+        
+        conn.commit()
+        conn.close()
+    
+    @traced("db.claim_update_keys")
+    @in_thread
+    def claim_update_keys(self, keys: List[str], ttl: int) -> bool:
+        """Атомарно отмечает ключи обновления; False, если хотя бы один уже был"""
+        now = time.time()
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            placeholders = ','.join('?' * len(keys))
+            cursor.execute(f'''
+                SELECT COUNT(*) FROM processed_updates
+                WHERE key IN ({placeholders}) AND expires_at > ?
+            ''', (*keys, now))
+            if cursor.fetchone()[0]:
+                cursor.execute('ROLLBACK')
+                return False
+            
+            cursor.executemany('''
+                INSERT OR REPLACE INTO processed_updates (key, expires_at)
+                VALUES (?, ?)
+            ''', [(key, now + ttl) for key in keys])
+            # Попутно чистим просроченные ключи небольшими порциями
+            cursor.execute('''
+                DELETE FROM processed_updates WHERE key IN (
+                    SELECT key FROM processed_updates WHERE expires_at <= ? LIMIT 100
+                )
+            ''', (now,))
+            cursor.execute('COMMIT')
+            return True
+        finally:
+            conn.close()
+    
+    @traced("db.release_update_keys")
+    @in_thread
+    def release_update_keys(self, keys: List[str]):
+        """Снимает отметку с ключей обновления, обработка которого не удалась"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        placeholders = ','.join('?' * len(keys))
+        cursor.execute(f'DELETE FROM processed_updates WHERE key IN ({placeholders})', keys)
+        
+        conn.commit()
+        conn.close()
+    
+    @traced("db.create_broadcast")
+    async def create_broadcast(self, admin_chat_id: int, text: str = None, 
+                               source_chat_id: int = None, source_message_id: int = None) -> int:
+        """Создание рассылки"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            INSERT INTO broadcasts (text, source_chat_id, source_message_id, admin_chat_id)
+            VALUES (?, ?, ?, ?)
+        ''', (text, source_chat_id, source_message_id, admin_chat_id))
+        broadcast_id = cursor.lastrowid
+        
+        conn.commit()
+        conn.close()
+        
+        return broadcast_id
+    
+    @traced("db.get_broadcast")
+    async def get_broadcast(self, broadcast_id: int) -> Optional[Dict[str, Any]]:
+        """Получение рассылки с ее контрольной точкой"""
+        broadcasts = await self._select_broadcasts('WHERE id = ?', (broadcast_id,))
+        return broadcasts[0] if broadcasts else None
+    
+    @traced("db.get_unfinished_broadcasts")
+    async def get_unfinished_broadcasts(self) -> List[Dict[str, Any]]:
+        """Рассылки, прерванные остановкой или падением процесса"""
+        return await self._select_broadcasts("WHERE status = 'running'", ())
+    
+    async def _select_broadcasts(self, where: str, params: tuple) -> List[Dict[str, Any]]:
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute(f'''
+            SELECT id, text, source_chat_id, source_message_id, admin_chat_id,
+                   status, last_user_id, sent, failed, blocked
+            FROM broadcasts {where}
+        ''', params)
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return [
+            {
+                'id': row[0],
+                'text': row[1],
+                'source_chat_id': row[2],
+                'source_message_id': row[3],
+                'admin_chat_id': row[4],
+                'status': row[5],
+                'last_user_id': row[6],
+                'sent': row[7],
+                'failed': row[8],
+                'blocked': row[9]
+            }
+            for row in rows
+        ]
+    
+    @traced("db.save_broadcast_checkpoint")
+    async def save_broadcast_checkpoint(self, broadcast_id: int, last_user_id: int, sent: int, 
+                                        failed: int, blocked: int, status: str = 'running'):
+        """Сохранение контрольной точки рассылки"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            UPDATE broadcasts
+            SET last_user_id = ?, sent = ?, failed = ?, blocked = ?, status = ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (last_user_id, sent, failed, blocked, status, broadcast_id))
+        
+        conn.commit()
+        conn.close()
+    
+    @traced("db.get_broadcast_recipients")
+    async def get_broadcast_recipients(self, after_user_id: int, limit: int) -> List[int]:
+        """Следующая пачка получателей рассылки (keyset-пагинация по user_id)"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT user_id FROM users
+            WHERE user_id > ?
+              AND NOT EXISTS (SELECT 1 FROM blocked_users b WHERE b.user_id = users.user_id)
+            ORDER BY user_id
+            LIMIT ?
+        ''', (after_user_id, limit))
+        
+        user_ids = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        
+        return user_ids
+    
+    @traced("db.mark_user_blocked")
+    async def mark_user_blocked(self, user_id: int):
+        """Исключение пользователя, заблокировавшего бота, из рассылок"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            INSERT OR IGNORE INTO blocked_users (user_id) VALUES (?)
+        ''', (user_id,))
+        
+        conn.commit()
+        conn.close()
\ No newline at end of file
@@ -0,0 +1,160 @@
+import contextvars
+import functools
+import logging
+import time
+from collections import OrderedDict
+from typing import FrozenSet, Optional
+
+from config.settings import get_settings
+from services.database_service import DatabaseService
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Ключи обновления, уже захваченного внешним обработчиком (группа -> текст)
+_claimed_keys: contextvars.ContextVar = contextvars.ContextVar("claimed_update_keys", default=None)
+
+
+def update_keys(update) -> FrozenSet[str]:
+    """Ключи идемпотентности: update_id и пара (chat_id, message_id)"""
+    keys = set()
+    if update.update_id:
+        keys.add(f"u:{update.update_id}")
+    message = update.message or update.edited_message
+    if message is not None:
+        keys.add(f"m:{message.chat_id}:{message.message_id}")
+    return frozenset(keys)
+
+
+class UpdateDeduplicator:
+    """Подавление повторно доставленных обновлений Telegram
+
+    Первый уровень — ограниченный набор в памяти процесса, второй — общее
+    хранилище с TTL (Redis или таблица в БД), переживающее перезапуски и
+    работающее между несколькими экземплярами бота.
+
+    Если обработка обновления завершилась ошибкой, ключи освобождаются
+    (release), и повторная доставка того же обновления будет обработана.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.ttl = self.settings.dedup_ttl_seconds
+        self.max_size = self.settings.dedup_memory_size
+        self.backend = self.settings.dedup_backend
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._redis = None
+        self._db_service = DatabaseService() if self.backend == "db" else None
+
+        metrics.gauge("updates_duplicate_ratio", self.duplicate_ratio)
+
+    def duplicate_ratio(self) -> float:
+        """Доля дубликатов среди всех проверенных обновлений"""
+        duplicates = metrics.get("updates_duplicate_total", layer="memory") \
+            + metrics.get("updates_duplicate_total", layer="store")
+        total = duplicates + metrics.get("updates_claimed_total")
+        return duplicates / total if total else 0.0
+
+    async def claim(self, keys: FrozenSet[str]) -> bool:
+        """True, если обновление новое и захвачено этим вызовом"""
+        if not keys:
+            return True
+
+        now = time.monotonic()
+        if any(self._seen.get(key, 0) > now for key in keys):
+            metrics.inc("updates_duplicate_total", layer="memory")
+            return False
+        # Отмечаем сразу, до await, чтобы параллельный дубликат отсекся здесь же
+        self._remember(keys, now + self.ttl)
+
+        if not await self._claim_in_store(keys):
+            metrics.inc("updates_duplicate_total", layer="store")
+            return False
+
+        metrics.inc("updates_claimed_total")
+        return True
+
+    async def release(self, keys: FrozenSet[str]):
+        """Снимает захват с ключей обновления, которое не удалось обработать"""
+        if not keys:
+            return
+        for key in keys:
+            self._seen.pop(key, None)
+        try:
+            if self.backend == "redis" and self._redis is not None:
+                await self._redis.delete(*(f"tg:update:{key}" for key in keys))
+            elif self.backend == "db":
+                await self._db_service.release_update_keys(list(keys))
+        except Exception:
+            metrics.inc("dedup_store_errors_total")
+            logger.warning("Не удалось освободить ключи обновления", exc_info=True)
+        metrics.inc("updates_released_total")
+
+    def _remember(self, keys: FrozenSet[str], expires_at: float):
+        for key in keys:
+            self._seen[key] = expires_at
+            self._seen.move_to_end(key)
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+
+    async def _claim_in_store(self, keys: FrozenSet[str]) -> bool:
+        """Атомарный захват ключей в общем хранилище (при его сбое — пропускаем)"""
+        try:
+            if self.backend == "redis":
+                return await self._claim_in_redis(keys)
+            if self.backend == "db":
+                return await self._db_service.claim_update_keys(list(keys), self.ttl)
+        except Exception:
+            metrics.inc("dedup_store_errors_total")
+            logger.warning("Хранилище идемпотентности недоступно", exc_info=True)
+        return True
+
+    async def _claim_in_redis(self, keys: FrozenSet[str]) -> bool:
+        if self._redis is None:
+            import redis.asyncio as aioredis
+
+            self._redis = aioredis.from_url(self.settings.redis_url)
+
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.set(f"tg:update:{key}", 1, nx=True, ex=self.ttl)
+            results = await pipe.execute()
+        return all(results)
+
+
+_deduplicator: Optional[UpdateDeduplicator] = None
+
+def get_update_deduplicator() -> UpdateDeduplicator:
+    global _deduplicator
+    if _deduplicator is None:
+        _deduplicator = UpdateDeduplicator()
+    return _deduplicator
+
+
+def idempotent(func):
+    """Декоратор обработчика (self, update, ...): дубликаты обновлений пропускаются
+
+    Если обработчик завершился исключением, захват снимается: иначе
+    повторная доставка упавшего обновления молча отбрасывалась бы до
+    истечения TTL.
+    """
+    @functools.wraps(func)
+    async def wrapper(self, update, *args, **kwargs):
+        keys = update_keys(update)
+        claimed = _claimed_keys.get()
+        # Обновление уже захвачено внешним обработчиком в этой же цепочке вызовов
+        if claimed and keys & claimed:
+            return await func(self, update, *args, **kwargs)
+
+        if not await get_update_deduplicator().claim(keys):
+            return
+
+        token = _claimed_keys.set(keys)
+        try:
+            return await func(self, update, *args, **kwargs)
+        except Exception:
+            await get_update_deduplicator().release(keys)
+            raise
+        finally:
+            _claimed_keys.reset(token)
+    return wrapper
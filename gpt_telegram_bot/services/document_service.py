@@ -0,0 +1,181 @@
+import codecs
+import re
+from typing import Any, AsyncIterable, Dict, List, Optional
+
+import aiohttp
+
+from config.settings import get_settings
+from services.database_service import DatabaseService
+from utils.files import iter_telegram_file
+
+# Сколько фрагментов записывается в индекс за одну транзакцию
+INSERT_BATCH_SIZE = 64
+# Максимум слов из вопроса, попадающих в поисковый запрос
+MAX_QUERY_TERMS = 16
+# Абзац длиннее этого считается частью вставленного текста, а не вопросом к нему
+MAX_QUESTION_LENGTH = 500
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class TextChunker:
+    """Нарезает поток текста на пересекающиеся фрагменты фиксированного размера"""
+
+    def __init__(self, chunk_size: int, overlap: int):
+        self.chunk_size = chunk_size
+        self.overlap = min(overlap, chunk_size // 4)
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        """Добавляет текст и возвращает готовые фрагменты"""
+        self._buffer += text
+        chunks = []
+        while len(self._buffer) >= self.chunk_size:
+            end = self._find_boundary(self._buffer, self.chunk_size)
+            chunk = self._buffer[:end].strip()
+            if chunk:
+                chunks.append(chunk)
+            self._buffer = self._buffer[end - self.overlap:]
+        return chunks
+
+    def flush(self) -> List[str]:
+        """Возвращает остаток текста последним фрагментом"""
+        chunk = self._buffer.strip()
+        self._buffer = ""
+        return [chunk] if chunk else []
+
+    @staticmethod
+    def _find_boundary(text: str, limit: int) -> int:
+        """Ищет естественную границу (абзац, строка, предложение, слово) до limit"""
+        for separator in ("\n\n", "\n", ". ", " "):
+            position = text.rfind(separator, limit // 2, limit)
+            if position != -1:
+                return position + len(separator)
+        return limit
+
+
+class DocumentService:
+    def __init__(self):
+        self.settings = get_settings()
+        self.db_service = DatabaseService()
+        self.session = None
+
+    async def _get_session(self):
+        """Получение HTTP сессии"""
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        return self.session
+
+    async def ingest_file(self, bot, chat_id: int, user_id: int, file_id: str,
+                          file_name: str = None, file_size: int = None) -> int:
+        """Потоковая загрузка текстового файла и индексация по фрагментам"""
+        max_bytes = self.settings.document_max_bytes
+        if file_size and file_size > max_bytes:
+            raise ValueError("Документ слишком большой")
+
+        session = await self._get_session()
+        return await self._ingest(
+            chat_id, user_id, file_name,
+            self._decode(iter_telegram_file(bot, session, file_id, max_bytes))
+        )
+
+    async def ingest_text(self, chat_id: int, user_id: int, text: str,
+                          file_name: str = None) -> int:
+        """Индексация текста, вставленного прямо в сообщение"""
+        async def pieces():
+            yield text
+
+        return await self._ingest(chat_id, user_id, file_name, pieces())
+
+    async def _ingest(self, chat_id: int, user_id: int, file_name: Optional[str],
+                      pieces: AsyncIterable[str]) -> int:
+        """Нарезает поток текста и пишет фрагменты в индекс пачками"""
+        chunker = TextChunker(
+            self.settings.document_chunk_size,
+            self.settings.document_chunk_overlap
+        )
+        document_id = await self.db_service.create_document(chat_id, user_id, file_name)
+
+        chunk_count = 0
+        batch = []
+        async for piece in pieces:
+            batch.extend(chunker.feed(piece))
+            if len(batch) >= INSERT_BATCH_SIZE:
+                await self.db_service.add_document_chunks(document_id, chat_id, chunk_count, batch)
+                chunk_count += len(batch)
+                batch = []
+
+        batch.extend(chunker.flush())
+        if batch:
+            await self.db_service.add_document_chunks(document_id, chat_id, chunk_count, batch)
+            chunk_count += len(batch)
+
+        return chunk_count
+
+    @staticmethod
+    async def _decode(chunks: AsyncIterable[bytes]) -> AsyncIterable[str]:
+        """Инкрементальное декодирование UTF-8 без накопления всего файла"""
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        async for chunk in chunks:
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+    @staticmethod
+    def extract_question(text: str) -> Optional[str]:
+        """Вопрос к вставленному тексту: короткий последний (или первый) абзац с «?»
+
+        None — вопроса нет, текст просто сохраняется для следующих вопросов.
+        """
+        paragraphs = [part.strip() for part in re.split(r"\n\s*\n", text) if part.strip()]
+        if len(paragraphs) < 2:
+            return None
+        for paragraph in (paragraphs[-1], paragraphs[0]):
+            if len(paragraph) <= MAX_QUESTION_LENGTH and paragraph.endswith("?"):
+                return paragraph
+        return None
+
+    @staticmethod
+    def build_search_query(question: str) -> str:
+        """Строит запрос FTS5 из слов вопроса"""
+        terms = []
+        for word in _WORD_RE.findall(question.lower()):
+            if len(word) < 3:
+                continue
+            # Грубое усечение окончаний, чтобы находить другие словоформы
+            term = f'"{word[:-2]}"*' if len(word) > 5 else f'"{word}"'
+            if term not in terms:
+                terms.append(term)
+            if len(terms) >= MAX_QUERY_TERMS:
+                break
+        return " OR ".join(terms)
+
+    async def build_context_message(self, chat_id: int, question: str) -> Optional[Dict[str, Any]]:
+        """Возвращает системное сообщение с релевантными фрагментами документов"""
+        query = self.build_search_query(question)
+        if not query:
+            return None
+
+        chunks = await self.db_service.search_document_chunks(
+            chat_id, query, limit=self.settings.document_top_k
+        )
+        if not chunks:
+            return None
+
+        context = "\n\n---\n\n".join(chunks)
+        return {
+            'role': 'system',
+            'content': (
+                "Фрагменты документов пользователя, относящиеся к вопросу. "
+                "Используй их, если они помогают ответить:\n\n" + context
+            )
+        }
+
+    async def close(self):
+        """Закрытие сессии"""
+        if self.session:
+            await self.session.close()
+            self.session = None
@@ -0,0 +1,75 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+# Причины отмены генерации
+STOPPED_BY_USER = "stopped"
+SUPERSEDED = "superseded"
+
+# Сколько ждать, пока отмененная генерация сохранит частичный ответ
+CANCEL_WAIT_TIMEOUT = 5.0
+
+
+class Generation:
+    """Генерация ответа, выполняющаяся в данный момент"""
+
+    def __init__(self, chat_id: int, message_id: int, user_id: int, task: asyncio.Task):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.user_id = user_id
+        self.task = task
+        self.cancel_reason: Optional[str] = None
+        # Устанавливается, когда частичный ответ выведен и сохранен
+        self.finished = asyncio.Event()
+
+    def cancel(self, reason: str):
+        if self.cancel_reason is None:
+            self.cancel_reason = reason
+            self.task.cancel()
+
+
+class GenerationRegistry:
+    """Реестр генераций в процессе: по сообщению бота и по чату"""
+
+    def __init__(self):
+        self._by_message: Dict[Tuple[int, int], Generation] = {}
+
+    def register(self, chat_id: int, message_id: int, user_id: int,
+                 task: asyncio.Task) -> Generation:
+        generation = Generation(chat_id, message_id, user_id, task)
+        self._by_message[(chat_id, message_id)] = generation
+        return generation
+
+    def finish(self, generation: Generation):
+        self._by_message.pop((generation.chat_id, generation.message_id), None)
+        generation.finished.set()
+
+    def get(self, chat_id: int, message_id: int) -> Optional[Generation]:
+        return self._by_message.get((chat_id, message_id))
+
+    def in_chat(self, chat_id: int) -> List[Generation]:
+        return [
+            generation for (gen_chat_id, _), generation in self._by_message.items()
+            if gen_chat_id == chat_id
+        ]
+
+    async def cancel_chat(self, chat_id: int, reason: str = SUPERSEDED):
+        """Отменяет все генерации чата и ждет сохранения их частичных ответов"""
+        generations = self.in_chat(chat_id)
+        for generation in generations:
+            generation.cancel(reason)
+        if generations:
+            _, pending = await asyncio.wait(
+                [asyncio.create_task(generation.finished.wait()) for generation in generations],
+                timeout=CANCEL_WAIT_TIMEOUT
+            )
+            for waiter in pending:
+                waiter.cancel()
+
+
+_registry: Optional[GenerationRegistry] = None
+
+def get_generation_registry() -> GenerationRegistry:
+    global _registry
+    if _registry is None:
+        _registry = GenerationRegistry()
+    return _registry
@@ -0,0 +1,159 @@
+import asyncio
+import base64
+import io
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Sequence, Tuple
+
+import aiohttp
+from PIL import Image, ImageOps
+
+from config.settings import get_settings
+from utils.files import iter_telegram_file
+
+# Размеры, которые реально использует vision-модель OpenAI:
+# low — картинка сжимается до 512x512, high — вписывается в 2048x2048,
+# а затем короткая сторона уменьшается до 768. Всё, что больше, — лишние байты.
+LOW_DETAIL_SIDE = 512
+HIGH_DETAIL_LONG_SIDE = 2048
+HIGH_DETAIL_SHORT_SIDE = 768
+
+JPEG_QUALITY = 85
+
+# Ресайз выполняется вне event loop; Pillow отпускает GIL на декодировании и ресайзе
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-prepare")
+
+
+def _target_size(width: int, height: int, detail: str) -> Tuple[int, int]:
+    """Вычисляет размер изображения, оптимальный для vision-модели"""
+    if detail == "low":
+        scale = min(1.0, LOW_DETAIL_SIDE / max(width, height))
+    else:
+        scale = min(
+            1.0,
+            HIGH_DETAIL_LONG_SIDE / max(width, height),
+            HIGH_DETAIL_SHORT_SIDE / min(width, height)
+        )
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def _prepare_image(data: bytes, detail: str) -> bytes:
+    """Уменьшает изображение и перекодирует его в JPEG (выполняется в пуле потоков)"""
+    with Image.open(io.BytesIO(data)) as image:
+        target = _target_size(image.width, image.height, detail)
+        # Для JPEG декодируем сразу в уменьшенном масштабе
+        image.draft("RGB", target)
+        image = ImageOps.exif_transpose(image)
+
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        target = _target_size(image.width, image.height, detail)
+        if image.size != target:
+            image = image.resize(target, Image.LANCZOS)
+
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+        return output.getvalue()
+
+
+class ImageService:
+    def __init__(self):
+        self.settings = get_settings()
+        self.detail = self.settings.vision_detail
+        self.max_bytes = self.settings.image_max_bytes
+        self.cache_size = self.settings.image_cache_size
+        self.session = None
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Task] = {}
+
+    async def _get_session(self):
+        """Получение HTTP сессии"""
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        return self.session
+
+    def select_photo_size(self, photo_sizes: Sequence):
+        """Выбирает наименьший вариант фото, которого достаточно для модели"""
+        sizes = sorted(photo_sizes, key=lambda size: size.width * size.height)
+        for size in sizes:
+            if self.detail == "low":
+                if max(size.width, size.height) >= LOW_DETAIL_SIDE:
+                    return size
+            elif (min(size.width, size.height) >= HIGH_DETAIL_SHORT_SIDE
+                  or max(size.width, size.height) >= HIGH_DETAIL_LONG_SIDE):
+                return size
+        return sizes[-1]
+
+    async def get_image_data_url(self, bot, file_id: str, file_unique_id: str,
+                                 file_size: Optional[int] = None) -> str:
+        """Возвращает подготовленное изображение в виде data URL (с кэшированием)"""
+        cache_key = f"{file_unique_id}:{self.detail}"
+
+        if cache_key in self._cache:
+            self._cache.move_to_end(cache_key)
+            return self._cache[cache_key]
+
+        # Одновременные запросы одного и того же файла ждут общую задачу: отмена
+        # одного из них (например, «Стоп») не прерывает загрузку для остальных
+        task = self._pending.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(cache_key, bot, file_id, file_size))
+            self._pending[cache_key] = task
+            task.add_done_callback(lambda done: self._forget(cache_key, done))
+        return await asyncio.shield(task)
+
+    async def _load(self, cache_key: str, bot, file_id: str, file_size: Optional[int]) -> str:
+        data_url = await self._download_and_prepare(bot, file_id, file_size)
+        self._remember(cache_key, data_url)
+        return data_url
+
+    def _forget(self, cache_key: str, task: asyncio.Future):
+        """Загрузка завершена: следующий запрос возьмет результат из кэша"""
+        self._pending.pop(cache_key, None)
+        if not task.cancelled():
+            # Ошибку получают ожидающие; если все они отменены, asyncio не должен о ней предупреждать
+            task.exception()
+
+    async def _download_and_prepare(self, bot, file_id: str, file_size: Optional[int]) -> str:
+        """Скачивает файл потоком и готовит его для модели"""
+        if file_size and file_size > self.max_bytes:
+            raise ValueError("Изображение слишком большое")
+
+        data = await self._download(bot, file_id)
+
+        loop = asyncio.get_running_loop()
+        prepared = await loop.run_in_executor(_executor, _prepare_image, data, self.detail)
+
+        encoded = base64.b64encode(prepared).decode("ascii")
+        return f"data:image/jpeg;base64,{encoded}"
+
+    async def _download(self, bot, file_id: str) -> bytes:
+        """Потоковая загрузка файла из Telegram"""
+        session = await self._get_session()
+        buffer = io.BytesIO()
+        async for chunk in iter_telegram_file(bot, session, file_id, self.max_bytes):
+            buffer.write(chunk)
+        return buffer.getvalue()
+
+    def _remember(self, cache_key: str, data_url: str):
+        """Сохраняет подготовленное изображение в LRU-кэш"""
+        self._cache[cache_key] = data_url
+        self._cache.move_to_end(cache_key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def close(self):
+        """Закрытие сессии (и незавершенных загрузок)"""
+        for task in list(self._pending.values()):
+            task.cancel()
+        if self._pending:
+            await asyncio.gather(*self._pending.values(), return_exceptions=True)
+        if self.session:
+            await self.session.close()
+            self.session = None
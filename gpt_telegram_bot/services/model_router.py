@@ -0,0 +1,181 @@
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import get_settings
+from utils.metrics import metrics
+
+# Значение настройки model, при котором модель выбирается для каждого запроса
+AUTO_MODEL = "auto"
+
+# Вес нового замера в скользящих средних TTFT и доли ошибок
+EWMA_ALPHA = 0.2
+
+# Через сколько секунд без новых замеров медленную модель снова пробуем
+STATS_TTL = 300
+
+# Признаки запросов, которым нужна более сильная модель
+COMPLEX_PATTERNS = re.compile(
+    r"```|\bdef\b|\bclass\b|\bSELECT\b|"
+    r"объясни|почему|докаж|сравни|проанализ|оптимиз|напиши (код|функц|программ|скрипт)|"
+    r"пошагов|рассчитай|вычисли|переведи|"
+    r"explain|why|prove|compare|analy[sz]e|optimi[sz]e|step by step|calculate|translate",
+    re.IGNORECASE
+)
+SIMPLE_PATTERNS = re.compile(
+    r"^\s*(привет|здравствуй|спасибо|ок|окей|да|нет|пока|hi|hello|thanks|ok|yes|no|bye)\b",
+    re.IGNORECASE
+)
+
+
+class ModelStats:
+    """Живая статистика модели на конкретном эндпоинте"""
+
+    __slots__ = ("ttft", "ttft_updated", "error_rate", "requests", "errors", "cooldown_until")
+
+    def __init__(self):
+        self.ttft: Optional[float] = None
+        self.ttft_updated = 0.0
+        self.error_rate = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.cooldown_until = 0.0
+
+    def observe_ttft(self, seconds: float):
+        self.ttft = seconds if self.ttft is None else self.ttft + EWMA_ALPHA * (seconds - self.ttft)
+        self.ttft_updated = time.monotonic()
+
+    def expected_ttft(self, now: float) -> float:
+        """Ожидаемый TTFT; без свежих замеров модель считается быстрой"""
+        if self.ttft is None or now - self.ttft_updated > STATS_TTL:
+            return 0.0
+        return self.ttft
+
+    def observe_result(self, ok: bool):
+        self.requests += 1
+        self.errors += 0 if ok else 1
+        self.error_rate += EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+
+
+class ModelRouter:
+    """Выбор модели для режима auto
+
+    Модели из AUTO_MODEL_TIERS упорядочены от быстрой к сильной. По длине
+    запроса, глубине диалога и простому классификатору определяется
+    минимально достаточный уровень, затем среди моделей этого уровня и выше
+    берется первая здоровая, укладывающаяся в AUTO_TTFT_MS по живой
+    статистике. Для простых запросов это быстрая модель.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.tiers = [model.strip() for model in self.settings.auto_model_tiers.split(",") if model.strip()]
+        self.ttft_target = self.settings.auto_ttft_ms / 1000
+        self._stats: Dict[Tuple[str, str], ModelStats] = {}
+
+    def stats(self, model: str, endpoint: str) -> ModelStats:
+        key = (model, endpoint)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = ModelStats()
+            metrics.gauge("llm_ttft_ewma_seconds", lambda: stats.ttft or 0.0,
+                          model=model, endpoint=endpoint)
+        return stats
+
+    def record_ttft(self, model: str, endpoint: str, seconds: float):
+        """Время до первого токена успешного запроса"""
+        self.stats(model, endpoint).observe_ttft(seconds)
+        metrics.observe("llm_ttft_seconds", seconds, model=model)
+
+    def record_result(self, model: str, endpoint: str, ok: bool):
+        """Итог запроса; ошибка временно исключает модель из выбора"""
+        stats = self.stats(model, endpoint)
+        stats.observe_result(ok)
+        if not ok:
+            # Чем чаще ошибки, тем дольше модель исключена из выбора
+            cooldown = self.settings.auto_error_cooldown * (1 + 4 * stats.error_rate)
+            stats.cooldown_until = time.monotonic() + cooldown
+            metrics.inc("llm_errors_total", model=model)
+
+    def resolve(self, model: str, endpoint: str, messages: List = None, depth: int = None) -> str:
+        """Возвращает модель пользователя или выбирает ее, если задан auto"""
+        if model != AUTO_MODEL:
+            return model
+        return self.choose(endpoint, messages or [], depth)
+
+    def choose(self, endpoint: str, messages: List, depth: int = None) -> str:
+        """Выбор модели для запроса с историей messages (последнее — вопрос)"""
+        if not self.tiers:
+            raise ValueError("AUTO_MODEL_TIERS не задан")
+
+        tier = self.required_tier(messages, depth)
+        candidates = self.tiers[tier:]
+        now = time.monotonic()
+
+        healthy = [
+            model for model in candidates
+            if self.stats(model, endpoint).cooldown_until <= now
+        ]
+        fast = [
+            model for model in healthy
+            if self.stats(model, endpoint).expected_ttft(now) <= self.ttft_target
+        ]
+
+        if fast:
+            model = fast[0]
+        elif healthy:
+            # Никто не укладывается в цель: берем самую быструю из здоровых
+            model = min(healthy, key=lambda name: self.stats(name, endpoint).expected_ttft(now))
+        else:
+            # Все в карантине: ближайшая к выходу из него (с любого уровня)
+            model = min(self.tiers, key=lambda name: self.stats(name, endpoint).cooldown_until)
+
+        metrics.inc("model_route_total", model=model, tier=tier)
+        return model
+
+    def required_tier(self, messages: List, depth: int = None) -> int:
+        """Минимальный достаточный уровень модели по эвристикам
+
+        depth — число реплик пользователя в текущем диалоге. В запрос уходит
+        только хвост истории, поэтому по messages глубина считается, лишь
+        если ее не передали.
+        """
+        text = _content(messages[-1]) if messages else ""
+        if depth is None:
+            depth = sum(1 for message in messages if _role(message) == "user")
+
+        score = 0
+        if len(text) > 300:
+            score += 1
+        if len(text) > 1500:
+            score += 1
+        if depth > 6:
+            score += 1
+        if COMPLEX_PATTERNS.search(text):
+            score += 1
+        if len(text) < 60 and SIMPLE_PATTERNS.search(text):
+            score = 0
+
+        # Документы в контексте (system-сообщение) требуют хотя бы среднего уровня
+        if any(_role(message) == "system" for message in messages):
+            score = max(score, 1)
+
+        return min(score, len(self.tiers) - 1)
+
+
+def _role(message) -> str:
+    return message['role'] if isinstance(message, dict) else message.role
+
+
+def _content(message) -> str:
+    content = message['content'] if isinstance(message, dict) else message.content
+    return content if isinstance(content, str) else ""
+
+
+_router: Optional[ModelRouter] = None
+
+def get_model_router() -> ModelRouter:
+    global _router
+    if _router is None:
+        _router = ModelRouter()
+    return _router
@@ -1,56 +1,204 @@
-import openai
-import asyncio
-from typing import AsyncGenerator, Dict, Any
-from config.settings import get_settings
-
-class OpenAIService:
-    def __init__(self):
-        self.settings = get_settings()
-        self.client = openai.AsyncOpenAI(
-            api_key=self.settings.openai_api_key,
-            base_url=self.settings.openai_base_url
-        )
-    
-    async def stream_chat_completion(
-        self, 
-        messages: list, 
-        model: str, 
-        temperature: float, 
-        max_tokens: int
-    ) -> AsyncGenerator[str, None]:
-        """Потоковая генерация ответа от OpenAI"""
-        try:
-            stream = await self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                stream=True
-            )
-            
-            async for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
-                    
-        except Exception as e:
-            yield f"Ошибка при генерации ответа: {str(e)}"
-    
-    async def generate_text(
-        self, 
-        messages: list, 
-        model: str, 
-        temperature: float, 
-        max_tokens: int
-    ) -> str:
-        """Обычная генерация текста (не потоковая)"""
-        try:
-            response = await self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                stream=False
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            return f"Ошибка при генерации ответа: {str(e)}" 
\ No newline at end of file
+import openai
+import asyncio
+import time
+from typing import AsyncGenerator, Dict, Any, List, Optional, Tuple
+from config.settings import get_settings
+from models.records import to_openai_messages
+from services.model_router import get_model_router, AUTO_MODEL
+from services.credential_pool import get_credential_pool, Credential
+
+# Префикс, с которого начинается текст ошибки вместо ответа модели
+ERROR_PREFIX = "Ошибка при генерации ответа"
+
+# Грубая оценка размера изображения в токенах для балансировки ключей
+IMAGE_TOKENS_ESTIMATE = 800
+
+class OpenAIService:
+    def __init__(self):
+        self.settings = get_settings()
+        self.pool = get_credential_pool()
+        self.router = get_model_router()
+    
+    @staticmethod
+    def estimate_tokens(messages: List[Dict[str, Any]], max_tokens: int) -> int:
+        """Оценка токенов запроса (промпт + ответ) для балансировки ключей"""
+        chars = 0
+        images = 0
+        for message in messages:
+            content = message['content']
+            if isinstance(content, str):
+                chars += len(content)
+                continue
+            for part in content:
+                if part.get('type') == 'text':
+                    chars += len(part['text'])
+                else:
+                    images += 1
+        return chars // 4 + images * IMAGE_TOKENS_ESTIMATE + max_tokens
+    
+    async def _create_completion(self, tokens: int, route_messages: list, depth: Optional[int] = None,
+                                 **params) -> Tuple[Credential, str, Any]:
+        """Запрос к наименее загруженному ключу с переходом на следующий
+        
+        Ключ, получивший 429 или ошибку авторизации, исключается из пула,
+        и запрос повторяется с другим ключом. В режиме auto модель выбирается
+        по статистике эндпоинта того ключа, который выполнит запрос
+        (route_messages и depth — см. ModelRouter.required_tier). Возвращает
+        захваченный ключ (его нужно освободить через pool.release), модель
+        и разобранный ответ. Если запрос так и не удался, ошибка модели
+        учитывается здесь же.
+        """
+        model = params.pop("model")
+        for attempt in range(len(self.pool)):
+            credential = self.pool.acquire(tokens)
+            try:
+                params["model"] = self.router.resolve(model, credential.endpoint, route_messages, depth)
+                raw = await credential.client.chat.completions.with_raw_response.create(**params)
+            except openai.RateLimitError as e:
+                self.pool.release(credential, tokens)
+                self.pool.eject_rate_limited(
+                    credential, e.response.headers, insufficient_quota=e.code == "insufficient_quota"
+                )
+                if attempt == len(self.pool) - 1:
+                    self.router.record_result(params["model"], credential.endpoint, ok=False)
+                    raise
+                continue
+            except (openai.AuthenticationError, openai.PermissionDeniedError):
+                self.pool.release(credential, tokens)
+                self.pool.eject_unauthorized(credential)
+                if attempt == len(self.pool) - 1:
+                    self.router.record_result(params["model"], credential.endpoint, ok=False)
+                    raise
+                continue
+            except openai.OpenAIError:
+                self.pool.release(credential, tokens)
+                self.router.record_result(params["model"], credential.endpoint, ok=False)
+                raise
+            except BaseException:
+                self.pool.release(credential, tokens)
+                raise
+            
+            self.pool.update_quota(credential, raw.headers)
+            return credential, params["model"], raw.parse()
+    
+    async def stream_chat_completion(
+        self, 
+        messages: list, 
+        model: str, 
+        temperature: float, 
+        max_tokens: int,
+        depth: int = None
+    ) -> AsyncGenerator[str, None]:
+        """Потоковая генерация ответа от OpenAI
+        
+        depth — число реплик пользователя в диалоге (для выбора модели
+        в режиме auto; по умолчанию считается по messages).
+        """
+        credential = None
+        stream = None
+        openai_messages = to_openai_messages(messages)
+        # Ключ занят этими токенами, пока поток не закрыт
+        tokens = self.estimate_tokens(openai_messages, max_tokens)
+        started = time.monotonic()
+        first_token = True
+        try:
+            credential, model, stream = await self._create_completion(
+                tokens,
+                messages,
+                depth,
+                model=model,
+                messages=openai_messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True
+            )
+            
+            async for chunk in stream:
+                if chunk.choices[0].delta.content is not None:
+                    if first_token:
+                        # Живая статистика для выбора модели в режиме auto
+                        self.router.record_ttft(model, credential.endpoint, time.monotonic() - started)
+                        first_token = False
+                    yield chunk.choices[0].delta.content
+            
+            self.router.record_result(model, credential.endpoint, ok=True)
+                    
+        except Exception as e:
+            # Ошибку до начала потока уже учел _create_completion
+            if credential is not None:
+                self.router.record_result(model, credential.endpoint, ok=False)
+            yield f"{ERROR_PREFIX}: {str(e)}"
+        finally:
+            # При отмене генерации сразу закрываем HTTP-соединение
+            if stream is not None:
+                await stream.close()
+            if credential is not None:
+                self.pool.release(credential, tokens)
+    
+    @staticmethod
+    def build_image_message(text: str, image_url: str, detail: str = "auto") -> Dict[str, Any]:
+        """Формирует сообщение пользователя с изображением для vision-модели"""
+        return {
+            'role': 'user',
+            'content': [
+                {'type': 'text', 'text': text},
+                {'type': 'image_url', 'image_url': {'url': image_url, 'detail': detail}}
+            ]
+        }
+    
+    async def stream_image_completion(
+        self, 
+        messages: list, 
+        text: str, 
+        image_url: str, 
+        model: str, 
+        temperature: float, 
+        max_tokens: int, 
+        detail: str = "auto"
+    ) -> AsyncGenerator[str, None]:
+        """Потоковая генерация ответа по изображению"""
+        if model == AUTO_MODEL:
+            model = self.settings.auto_vision_model
+        image_message = self.build_image_message(text, image_url, detail)
+        async for chunk in self.stream_chat_completion(
+            messages=messages + [image_message],
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens
+        ):
+            yield chunk
+    
+    async def generate_text(
+        self, 
+        messages: list, 
+        model: str, 
+        temperature: float, 
+        max_tokens: int,
+        route_messages: list = None
+    ) -> str:
+        """Обычная генерация текста (не потоковая)
+        
+        route_messages — по каким сообщениям выбирать модель в режиме auto
+        (по умолчанию по самому запросу).
+        """
+        credential = None
+        openai_messages = to_openai_messages(messages)
+        tokens = self.estimate_tokens(openai_messages, max_tokens)
+        try:
+            credential, model, response = await self._create_completion(
+                tokens,
+                messages if route_messages is None else route_messages,
+                model=model,
+                messages=openai_messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=False
+            )
+            self.router.record_result(model, credential.endpoint, ok=True)
+            return response.choices[0].message.content
+        except Exception as e:
+            return f"{ERROR_PREFIX}: {str(e)}"
+        finally:
+            # Ответ уже получен — ключ больше не занят этими токенами
+            if credential is not None:
+                self.pool.release(credential, tokens) 
\ No newline at end of file
@@ -0,0 +1,135 @@
+import asyncio
+import html
+import logging
+import re
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from config.settings import get_settings
+from services.database_service import DatabaseService
+
+logger = logging.getLogger(__name__)
+
+# Сколько слов запроса передается в FTS5
+MAX_QUERY_TERMS = 8
+
+# Сколько поисковых сессий (сообщений с результатами) помнить для пагинации
+MAX_SESSIONS = 1000
+
+# Сколько лучших результатов запоминается для листания
+MAX_RESULTS = 500
+
+ROLE_ICONS = {'user': "👤", 'assistant': "🤖"}
+
+# Частые окончания: у слова ищется основа, а FTS5 добирает словоформы по префиксу
+ENDINGS = re.compile(
+    r"(ами|ями|ого|его|ому|ему|ыми|ими|иях|ах|ях|ов|ев|ом|ем|ой|ей|ий|ый|ая|яя|ое|ее|ые|ие|ую|юю|"
+    r"ing|ed|es|[аяыиоеуюьsй])$"
+)
+
+
+class SearchSession:
+    """Состояние пагинации одного сообщения с результатами"""
+
+    __slots__ = ("chat_id", "query", "text", "ids", "page")
+
+    def __init__(self, chat_id: int, query: str, text: str):
+        self.chat_id = chat_id
+        self.query = query
+        self.text = text
+        # id результатов в порядке релевантности, фиксируются первым запросом:
+        # новые сообщения чата не сдвигают уже показанные страницы
+        self.ids: Optional[List[int]] = None
+        self.page = 0
+
+    def has_page(self, page: int, page_size: int) -> bool:
+        return page >= 0 and self.ids is not None and page * page_size < len(self.ids)
+
+
+class SearchService:
+    def __init__(self):
+        self.settings = get_settings()
+        self.db_service = DatabaseService()
+        self._sessions: "OrderedDict[Tuple[int, int], SearchSession]" = OrderedDict()
+        self._indexer: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def build_match_query(text: str) -> str:
+        """Запрос FTS5: все слова должны встретиться, с учетом словоформ"""
+        terms = []
+        for word in re.findall(r"\w+", text.lower()):
+            if len(word) < 2:
+                continue
+            stem = ENDINGS.sub("", word)
+            term = f'"{stem if len(stem) >= 3 else word}"*'
+            if term not in terms:
+                terms.append(term)
+            if len(terms) >= MAX_QUERY_TERMS:
+                break
+        return " ".join(terms)
+
+    def new_session(self, chat_id: int, text: str) -> Optional[SearchSession]:
+        query = self.build_match_query(text)
+        if not query:
+            return None
+        return SearchSession(chat_id, query, text)
+
+    def remember(self, message_id: int, session: SearchSession):
+        """Привязывает сессию к сообщению с результатами"""
+        self._sessions[(session.chat_id, message_id)] = session
+        self._sessions.move_to_end((session.chat_id, message_id))
+        while len(self._sessions) > MAX_SESSIONS:
+            self._sessions.popitem(last=False)
+
+    def get_session(self, chat_id: int, message_id: int) -> Optional[SearchSession]:
+        return self._sessions.get((chat_id, message_id))
+
+    def start_indexer(self):
+        """Фоновая индексация новых сообщений раз в SEARCH_INDEX_INTERVAL секунд"""
+        if self._indexer is None:
+            self._indexer = asyncio.create_task(self._index_periodically())
+
+    async def stop_indexer(self):
+        if self._indexer is not None:
+            self._indexer.cancel()
+            await asyncio.gather(self._indexer, return_exceptions=True)
+            self._indexer = None
+
+    async def _index_periodically(self):
+        while True:
+            await asyncio.sleep(self.settings.search_index_interval)
+            try:
+                await self.db_service.index_new_messages()
+            except Exception:
+                logger.warning("Не удалось проиндексировать новые сообщения", exc_info=True)
+
+    async def fetch_page(self, session: SearchSession) -> Tuple[str, bool]:
+        """Текст текущей страницы и признак наличия следующей"""
+        page_size = self.settings.search_page_size
+        if session.ids is None:
+            # Сообщения, которые фоновая индексация еще не добрала
+            await self.db_service.index_new_messages()
+            session.ids = await self.db_service.search_message_ids(
+                session.chat_id, session.query, limit=MAX_RESULTS
+            )
+
+        start = session.page * page_size
+        page_ids = session.ids[start:start + page_size]
+        rows = []
+        if page_ids:
+            rows = await self.db_service.get_search_snippets(session.chat_id, session.query, page_ids)
+
+        return self.format_page(session, rows), session.has_page(session.page + 1, page_size)
+
+    @staticmethod
+    def format_page(session: SearchSession, rows: List[Tuple]) -> str:
+        header = f"🔍 <b>{html.escape(session.text)}</b>"
+        if not rows:
+            return header + ("\n\nНичего не найдено" if session.page == 0 else "\n\nБольше результатов нет")
+
+        lines = [header + f" — стр. {session.page + 1}"]
+        for _, role, snippet, created_at in rows:
+            # Маркеры совпадений ставит snippet() — заменяем их после экранирования
+            snippet = html.escape(snippet).replace("\x02", "<b>").replace("\x03", "</b>")
+            lines.append(f"{ROLE_ICONS.get(role, '💬')} <i>{created_at}</i>\n{snippet}")
+        return "\n\n".join(lines)
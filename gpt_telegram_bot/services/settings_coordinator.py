@@ -0,0 +1,152 @@
+import asyncio
+import dataclasses
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from config.settings import get_settings
+from models.records import UserSettings
+from services.database_service import DatabaseService
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Отрисовка результата серии изменений (например, правка клавиатуры)
+Renderer = Callable[[UserSettings], Awaitable[Any]]
+
+# Пауза перед повторной записью, если БД не приняла изменения
+RETRY_DELAY = 5.0
+
+
+class PendingMutations:
+    """Изменения настроек пользователя, еще не записанные в БД"""
+
+    __slots__ = ("settings", "changes", "renderer", "rendered", "timer")
+
+    def __init__(self, settings: UserSettings):
+        # Настройки с уже примененными изменениями (оптимистично)
+        self.settings = settings
+        self.changes: Dict[str, Any] = {}
+        self.renderer: Optional[Renderer] = None
+        # Значения, показанные пользователю последней отрисовкой
+        self.rendered: Optional[UserSettings] = settings
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class SettingsCoordinator:
+    """Координатор изменений настроек от частых нажатий кнопок
+
+    Нажатия применяются к настройкам в памяти сразу, а запись в БД и правка
+    сообщения выполняются один раз после паузы SETTINGS_DEBOUNCE_MS. Все
+    операции одного пользователя идут под его блокировкой, поэтому записи
+    и правки не обгоняют друг друга и всегда отражают последнее значение.
+
+    Если запись не удалась, изменения остаются в памяти и записываются
+    повторно через RETRY_DELAY. При остановке бота flush_all записывает
+    все, что еще не записано.
+    """
+
+    def __init__(self, db_service: DatabaseService = None):
+        self.db_service = db_service or DatabaseService()
+        self.delay = get_settings().settings_debounce_ms / 1000
+        self._pending: Dict[int, PendingMutations] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        # Ссылки на запущенные таймером сбросы, чтобы задачи не собрал GC
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _lock(self, user_id: int) -> asyncio.Lock:
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = self._locks[user_id] = asyncio.Lock()
+        return lock
+
+    def _schedule(self, user_id: int, pending: PendingMutations, delay: float):
+        if pending.timer is not None:
+            pending.timer.cancel()
+        pending.timer = asyncio.get_running_loop().call_later(delay, self._start_flush, user_id)
+
+    def _start_flush(self, user_id: int):
+        task = asyncio.ensure_future(self.flush(user_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def get_settings(self, user_id: int) -> UserSettings:
+        """Настройки с учетом еще не записанных изменений"""
+        pending = self._pending.get(user_id)
+        if pending is not None:
+            return pending.settings
+        return await self.db_service.get_user_settings(user_id)
+
+    async def mutate(self, user_id: int, name: str, update: Callable[[Any], Any],
+                     renderer: Renderer = None) -> UserSettings:
+        """Применяет update к настройке name и откладывает запись и отрисовку"""
+        async with self._lock(user_id):
+            pending = self._pending.get(user_id)
+            if pending is None:
+                settings = await self.db_service.get_user_settings(user_id)
+                pending = self._pending[user_id] = PendingMutations(settings)
+
+            value = update(getattr(pending.settings, name))
+            pending.settings = dataclasses.replace(pending.settings, **{name: value})
+            pending.changes[name] = value
+            if renderer is not None:
+                pending.renderer = renderer
+
+            # Каждое нажатие откладывает сброс: серия превращается в одну запись
+            self._schedule(user_id, pending, self.delay)
+            metrics.inc("settings_mutations_total", setting=name)
+            return pending.settings
+
+    async def flush(self, user_id: int, render: bool = True):
+        """Записывает накопленные изменения одним UPDATE и один раз отрисовывает
+
+        render=False — пользователь ушел с экрана, и отложенная правка
+        сообщения уже не нужна (запись в БД выполняется все равно).
+        """
+        async with self._lock(user_id):
+            pending = self._pending.pop(user_id, None)
+            if pending is None:
+                return
+            if pending.timer is not None:
+                pending.timer.cancel()
+
+            if pending.changes:
+                try:
+                    await self.db_service.update_user_settings(user_id, pending.changes)
+                except Exception:
+                    # Новых изменений под блокировкой быть не могло: возвращаем
+                    # эти же, иначе следующее нажатие прочитает из БД старые значения
+                    logger.exception("Не удалось записать настройки пользователя %s: %s",
+                                     user_id, pending.changes)
+                    metrics.inc("settings_flush_errors_total")
+                    self._pending[user_id] = pending
+                    self._schedule(user_id, pending, RETRY_DELAY)
+                    return
+                metrics.inc("settings_flushes_total")
+
+            if render and pending.renderer is not None and pending.settings != pending.rendered:
+                try:
+                    await pending.renderer(pending.settings)
+                except Exception:
+                    logger.warning("Не удалось обновить сообщение настроек", exc_info=True)
+
+    async def flush_all(self):
+        """Записывает все отложенные изменения без отрисовки (остановка бота)"""
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for user_id in list(self._pending):
+            await self.flush(user_id, render=False)
+
+        # Остались только изменения, которые БД так и не приняла
+        for user_id, pending in self._pending.items():
+            pending.timer.cancel()
+            logger.error("Настройки пользователя %s не записаны: %s", user_id, pending.changes)
+        self._pending.clear()
+
+
+_coordinator: Optional[SettingsCoordinator] = None
+
+def get_settings_coordinator() -> SettingsCoordinator:
+    """Общий координатор процесса (блокировки по пользователю должны быть одни)"""
+    global _coordinator
+    if _coordinator is None:
+        _coordinator = SettingsCoordinator()
+    return _coordinator
@@ -0,0 +1,146 @@
+import asyncio
+from typing import AsyncGenerator, List, Optional, Tuple
+
+from config.settings import get_settings
+from services.database_service import DatabaseService
+from services.openai_service import OpenAIService, ERROR_PREFIX
+
+MAP_PROMPT = (
+    "Кратко перескажи этот фрагмент переписки: ключевые темы, решения, "
+    "вопросы без ответа. Пиши по-русски, списком."
+)
+REDUCE_PROMPT = (
+    "Объедини эти сводки последовательных частей переписки в одну краткую "
+    "сводку. Сохрани хронологию, убери повторы. Пиши по-русски, списком."
+)
+
+
+class SummaryError(Exception):
+    """Ошибка при построении сводки"""
+
+
+class SummaryService:
+    def __init__(self, openai_service: OpenAIService = None):
+        self.settings = get_settings()
+        self.db_service = DatabaseService()
+        self.openai_service = openai_service or OpenAIService()
+
+    async def summarize_chat(self, chat_id: int, model: str) -> Optional[str]:
+        """Map-reduce сводка сообщений чата с дозагрузкой только новых сообщений"""
+        cached = await self.db_service.get_latest_chat_summary(chat_id)
+        after_id = cached['last_message_id'] if cached else 0
+
+        semaphore = asyncio.Semaphore(self.settings.summary_concurrency)
+        tasks: List[asyncio.Task] = []
+        first_id = None
+        last_id = None
+
+        try:
+            async for chunk_first_id, chunk_last_id, text in self._iter_chunks(chat_id, after_id):
+                if first_id is None:
+                    first_id = chunk_first_id
+                last_id = chunk_last_id
+                # Не читаем следующую страницу, пока все слоты заняты
+                await semaphore.acquire()
+                tasks.append(asyncio.create_task(
+                    self._summarize_part(MAP_PROMPT, text, model, semaphore)
+                ))
+            partials = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        if last_id is None:
+            # Новых сообщений нет — отдаем сохраненную сводку
+            return cached['summary'] if cached else None
+
+        if cached:
+            partials = [cached['summary']] + list(partials)
+            first_id = cached['first_message_id']
+
+        summary = await self._reduce(list(partials), model)
+        await self.db_service.save_chat_summary(chat_id, first_id, last_id, summary)
+        return summary
+
+    async def _iter_chunks(self, chat_id: int,
+                           after_id: int) -> AsyncGenerator[Tuple[int, int, str], None]:
+        """Читает сообщения страницами и собирает их в фрагменты ограниченного размера"""
+        chunk_lines: List[str] = []
+        chunk_size = 0
+        chunk_first_id = None
+        last_id = after_id
+
+        while True:
+            page = await self.db_service.get_chat_messages_page(
+                chat_id, after_id=last_id, limit=self.settings.summary_page_size
+            )
+            if not page:
+                break
+
+            for message_id, role, content in page:
+                # Слишком длинное сообщение обрезается до размера фрагмента
+                line = f"{role}: {content}"[:self.settings.summary_chunk_chars]
+                # chunk_size — длина фрагмента вместе с переводами строк
+                if chunk_lines and chunk_size + 1 + len(line) > self.settings.summary_chunk_chars:
+                    yield chunk_first_id, last_id, "\n".join(chunk_lines)
+                    chunk_lines, chunk_size, chunk_first_id = [], 0, None
+                if chunk_first_id is None:
+                    chunk_first_id = message_id
+                chunk_size += len(line) + (1 if chunk_lines else 0)
+                chunk_lines.append(line)
+                last_id = message_id
+
+            if len(page) < self.settings.summary_page_size:
+                break
+
+        if chunk_lines:
+            yield chunk_first_id, last_id, "\n".join(chunk_lines)
+
+    async def _reduce(self, parts: List[str], model: str) -> str:
+        """Иерархическое объединение частичных сводок"""
+        fan_in = max(2, self.settings.summary_fan_in)
+        semaphore = asyncio.Semaphore(self.settings.summary_concurrency)
+
+        while len(parts) > 1:
+            groups = [parts[i:i + fan_in] for i in range(0, len(parts), fan_in)]
+            tasks = [
+                asyncio.create_task(self._reduce_group(group, model, semaphore)) for group in groups
+            ]
+            try:
+                parts = await asyncio.gather(*tasks)
+            except BaseException:
+                # Без одной группы сводки не будет: остальные запросы не нужны
+                for task in tasks:
+                    task.cancel()
+                raise
+        return parts[0]
+
+    async def _reduce_group(self, group: List[str], model: str, semaphore: asyncio.Semaphore) -> str:
+        """Объединяет одну группу сводок"""
+        if len(group) == 1:
+            return group[0]
+        await semaphore.acquire()
+        return await self._summarize_part(REDUCE_PROMPT, "\n\n---\n\n".join(group), model, semaphore)
+
+    async def _summarize_part(self, prompt: str, text: str, model: str,
+                              semaphore: asyncio.Semaphore) -> str:
+        """Один вызов модели; слот семафора должен быть занят вызывающим"""
+        try:
+            result = await self.openai_service.generate_text(
+                messages=[
+                    {'role': 'system', 'content': prompt},
+                    {'role': 'user', 'content': text}
+                ],
+                model=model,
+                temperature=0.3,
+                max_tokens=self.settings.summary_max_tokens,
+                # Для auto сводку делает быстрая модель: фрагменты переписки простые
+                route_messages=[]
+            )
+        finally:
+            semaphore.release()
+
+        if not result or result.startswith(ERROR_PREFIX):
+            raise SummaryError(result or "Пустой ответ модели")
+        return result
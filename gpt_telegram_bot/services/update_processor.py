@@ -0,0 +1,98 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+def chat_key(update: object) -> Optional[int]:
+    """Чат (или пользователь), внутри которого важен порядок обновлений
+
+    None — обновление обрабатывается вне очереди чата: нажатия кнопок
+    (иначе «Стоп» ждал бы конца той самой генерации, которую должен
+    прервать) и обновления без чата.
+    """
+    if not isinstance(update, Update) or update.callback_query is not None:
+        return None
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return None
+
+
+class ChatQueue:
+    """Блокировка чата и число обновлений, которые ее ждут или держат"""
+
+    __slots__ = ("lock", "waiting")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.waiting = 0
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Обновления одного чата — строго по очереди, разных чатов — параллельно
+
+    Одновременно выполняется не больше max_concurrency обработчиков. Место
+    занимается уже после очереди чата, поэтому обновления, ждущие долгий
+    ответ в своем чате, не отнимают места у остальных чатов. max_pending
+    ограничивает число принятых, но еще не обработанных обновлений
+    (в терминах PTB это max_concurrent_updates).
+
+    on_queued(chat_id, update) вызывается, когда обновление встает в очередь
+    за еще не обработанным обновлением того же чата (например, чтобы новое
+    сообщение прервало идущую генерацию).
+
+    Используется и в polling (через ApplicationBuilder.concurrent_updates),
+    и встроенным webhook-сервером.
+    """
+
+    __slots__ = ("max_concurrency", "on_queued", "_slots", "_chats")
+
+    def __init__(self, max_concurrency: int = 256, max_pending: int = 1000,
+                 on_queued: Callable[[int, Update], Any] = None):
+        super().__init__(max(max_pending, max_concurrency))
+        self.max_concurrency = max_concurrency
+        self.on_queued = on_queued
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._chats: Dict[int, ChatQueue] = {}
+
+    def active_chats(self) -> int:
+        """Число чатов, у которых есть необработанные обновления"""
+        return len(self._chats)
+
+    async def initialize(self) -> None:
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = chat_key(update)
+        try:
+            if key is None:
+                async with self._slots:
+                    await coroutine
+                return
+
+            queue = self._chats.get(key)
+            if queue is None:
+                queue = self._chats[key] = ChatQueue()
+            elif self.on_queued is not None:
+                self.on_queued(key, update)
+            queue.waiting += 1
+            try:
+                # asyncio.Lock пропускает ожидающих в порядке прихода
+                async with queue.lock:
+                    async with self._slots:
+                        await coroutine
+            finally:
+                queue.waiting -= 1
+                if not queue.waiting:
+                    del self._chats[key]
+        finally:
+            # Обновление, отмененное в очереди, так и не начало обрабатываться
+            close = getattr(coroutine, "close", None)
+            if close is not None:
+                close()
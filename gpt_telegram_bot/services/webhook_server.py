@@ -0,0 +1,257 @@
+import asyncio
+import hmac
+import json
+import logging
+import time
+from typing import Any, Optional, Set
+
+from telegram import Update
+
+from services.update_processor import ChatOrderedUpdateProcessor
+from utils.metrics import metrics
+
+try:
+    import orjson
+
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:  # orjson не установлен — используем стандартный json
+    json_loads = json.loads
+
+    def json_dumps(data: Any) -> bytes:
+        return json.dumps(data).encode()
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = b"x-telegram-bot-api-secret-token"
+
+
+def install_event_loop() -> bool:
+    """Включает uvloop, если он установлен (вызывать до asyncio.run)"""
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
+class WebhookServer:
+    """ASGI-приложение, принимающее webhook-обновления Telegram
+
+    Порядок и параллельность обработки задает ChatOrderedUpdateProcessor
+    приложения (тот же, что и в polling): обновления одного чата — по
+    очереди, разные чаты — параллельно. Сервер добавляет обратное давление:
+    принятых, но не обработанных обновлений (включая нажатия кнопок) не
+    больше queue_size, остальным отвечаем 503.
+    """
+
+    def __init__(self, application, secret_token: str, path: str = "/webhook",
+                 max_concurrency: int = 256, queue_size: int = 1000,
+                 max_body_size: int = 1024 * 1024):
+        if not secret_token:
+            raise ValueError("Для webhook-режима нужен WEBHOOK_SECRET")
+
+        self.application = application
+        self.secret_token = secret_token.encode()
+        self.path = path
+        self.queue_size = queue_size
+        self.max_body_size = max_body_size
+        # max_concurrency нужен, только если у приложения свой процессор обновлений
+        processor = getattr(application, "update_processor", None)
+        self.own_processor = not isinstance(processor, ChatOrderedUpdateProcessor)
+        if self.own_processor:
+            processor = ChatOrderedUpdateProcessor(max_concurrency, queue_size)
+        self.processor: ChatOrderedUpdateProcessor = processor
+        self.pending = 0
+        # Задачи, обрабатывающие принятые обновления
+        self.tasks: Set[asyncio.Task] = set()
+
+        metrics.gauge("webhook_queue_depth", self.queue_depth)
+        metrics.gauge("webhook_active_chats", self.processor.active_chats)
+
+    def queue_depth(self) -> int:
+        """Число принятых, но еще не обработанных обновлений"""
+        return self.pending
+
+    async def start(self):
+        """Подготовка к приему обновлений (вызывается при старте сервера)"""
+        if self.own_processor:
+            await self.processor.initialize()
+
+    async def stop(self, timeout: float = 25.0):
+        """Дожидается обработки принятых обновлений"""
+        if self.tasks:
+            _, unfinished = await asyncio.wait(self.tasks, timeout=timeout)
+            if unfinished:
+                logger.warning("Webhook: %d обновлений не обработано за %.0f с",
+                               self.pending, timeout)
+                for task in unfinished:
+                    task.cancel()
+                await asyncio.gather(*unfinished, return_exceptions=True)
+
+    def _enqueue(self, update: Update) -> bool:
+        """Принимает обновление в обработку; False, если принято слишком много"""
+        if self.pending >= self.queue_size:
+            return False
+        self.pending += 1
+        task = asyncio.create_task(self._run(update))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return True
+
+    async def _run(self, update: Update):
+        try:
+            await self.processor.process_update(update, self._process(update))
+        finally:
+            self.pending -= 1
+
+    async def _process(self, update: Update):
+        started = time.perf_counter()
+        try:
+            await self.application.process_update(update)
+            metrics.inc("webhook_updates_processed_total")
+        except Exception:
+            metrics.inc("webhook_updates_failed_total")
+            logger.exception("Ошибка при обработке обновления")
+        finally:
+            metrics.observe("webhook_update_seconds", time.perf_counter() - started)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        method = scope["method"]
+        path = scope["path"]
+
+        if method == "POST" and path == self.path:
+            await self._handle_update(scope, receive, send)
+        elif method == "GET" and path == "/healthz":
+            await self._respond(send, 200, json_dumps({
+                "status": "ok",
+                "queued": self.queue_depth(),
+                "chats": self.processor.active_chats()
+            }))
+        elif method == "GET" and path == "/metrics":
+            await self._respond(send, 200, metrics.render().encode(),
+                                content_type=b"text/plain; version=0.0.4")
+        else:
+            await self._respond(send, 404, b'{"error":"not found"}')
+
+    async def _lifespan(self, receive, send):
+        """Запуск и остановка вместе с сервером"""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _handle_update(self, scope, receive, send):
+        """Проверка секрета, разбор и постановка обновления в очередь"""
+        metrics.inc("webhook_requests_total")
+
+        token = dict(scope["headers"]).get(SECRET_HEADER, b"")
+        if not hmac.compare_digest(token, self.secret_token):
+            metrics.inc("webhook_rejected_total", reason="secret")
+            await self._respond(send, 403, b'{"error":"forbidden"}')
+            return
+
+        body = await self._read_body(receive)
+        if body is None:
+            metrics.inc("webhook_rejected_total", reason="too_large")
+            await self._respond(send, 413, b'{"error":"payload too large"}')
+            return
+
+        try:
+            data = json_loads(body)
+            update = Update.de_json(data, self.application.bot)
+        except Exception:
+            metrics.inc("webhook_rejected_total", reason="bad_json")
+            await self._respond(send, 400, b'{"error":"bad request"}')
+            return
+
+        if not self._enqueue(update):
+            # Telegram повторит доставку позже — это и есть обратное давление
+            metrics.inc("webhook_rejected_total", reason="queue_full")
+            await self._respond(send, 503, b'{"error":"busy"}', retry_after=b"1")
+            return
+
+        metrics.inc("webhook_updates_enqueued_total")
+        await self._respond(send, 200, b'{"status":"ok"}')
+
+    async def _read_body(self, receive) -> Optional[bytes]:
+        """Читает тело запроса; None, если оно больше допустимого"""
+        parts = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body_size:
+                return None
+            parts.append(chunk)
+            more_body = message.get("more_body", False)
+        return b"".join(parts)
+
+    @staticmethod
+    async def _respond(send, status: int, body: bytes,
+                       content_type: bytes = b"application/json",
+                       retry_after: bytes = None):
+        """Отправка ответа"""
+        headers = [
+            (b"content-type", content_type),
+            (b"content-length", str(len(body)).encode())
+        ]
+        if retry_after:
+            headers.append((b"retry-after", retry_after))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+async def run_webhook(application, settings):
+    """Запуск бота в режиме webhook на встроенном ASGI-сервере"""
+    import uvicorn
+
+    # Параллельность задает процессор обновлений приложения (UPDATE_CONCURRENCY)
+    server = WebhookServer(
+        application,
+        secret_token=settings.webhook_secret,
+        path=settings.webhook_path,
+        queue_size=settings.update_queue_size
+    )
+
+    async with application:
+        # run_polling вызывает post_init сам, здесь это делаем вручную
+        if application.post_init:
+            await application.post_init(application)
+
+        if settings.webhook_url:
+            await application.bot.set_webhook(
+                url=settings.webhook_url.rstrip("/") + settings.webhook_path,
+                secret_token=settings.webhook_secret,
+                max_connections=100
+            )
+
+        config = uvicorn.Config(
+            server,
+            host=settings.webhook_host,
+            port=settings.webhook_port,
+            loop="none",
+            lifespan="on",
+            access_log=False
+        )
+        print(f"🤖 Бот запущен в режиме webhook на порту {settings.webhook_port}...")
+        try:
+            await uvicorn.Server(config).serve()
+        finally:
+            # post_shutdown тоже вызываем вручную
+            if application.post_shutdown:
+                await application.post_shutdown(application)
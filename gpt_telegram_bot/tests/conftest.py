@@ -0,0 +1,74 @@
+import os
+import sys
+import tempfile
+
+# Модули проекта импортируются от корня бота, как в bot.py и benchmarks/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Настройки читаются при импорте config.settings — задаем их до импорта тестов
+_database_dir = tempfile.mkdtemp(prefix="bot-tests-")
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:TEST")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test-0000")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_database_dir, 'bot.db')}"
+os.environ["DEDUP_BACKEND"] = "memory"
+
+import itertools
+from datetime import datetime, timezone
+
+import pytest
+from telegram import Chat, Message, User
+from telegram.ext import ExtBot
+
+_message_ids = itertools.count(1000)
+
+
+class BotApi:
+    """Вызовы Bot API, сделанные настоящим ExtBot, без сети"""
+
+    def __init__(self):
+        self.calls = []
+
+    def names(self):
+        return [name for name, _, _ in self.calls]
+
+    def texts(self, name: str):
+        return [text for call_name, text, _ in self.calls if call_name == name]
+
+
+@pytest.fixture
+def bot_api(monkeypatch) -> BotApi:
+    """Подменяет методы ExtBot, которыми пользуются обработчики"""
+    api = BotApi()
+
+    async def get_me(self, *args, **kwargs):
+        # ExtBot.initialize запрашивает getMe при старте приложения
+        self._bot_user = User(1, "bot", True, username="test_bot")
+        return self._bot_user
+
+    async def send_message(self, chat_id, text, *args, **kwargs):
+        api.calls.append(("send_message", text, kwargs.get("reply_markup")))
+        message = Message(
+            next(_message_ids), datetime.now(timezone.utc), Chat(chat_id, Chat.PRIVATE),
+            from_user=User(1, "bot", True), text=text
+        )
+        message.set_bot(self)
+        return message
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, *args, **kwargs):
+        api.calls.append(("edit_message_text", text, kwargs.get("reply_markup")))
+        return True
+
+    async def edit_message_reply_markup(self, chat_id=None, message_id=None, *args, **kwargs):
+        api.calls.append(("edit_message_reply_markup", None, kwargs.get("reply_markup")))
+        return True
+
+    async def answer_callback_query(self, callback_query_id, text=None, *args, **kwargs):
+        api.calls.append(("answer_callback_query", text, None))
+        return True
+
+    for name, method in [("get_me", get_me), ("send_message", send_message),
+                         ("edit_message_text", edit_message_text),
+                         ("edit_message_reply_markup", edit_message_reply_markup),
+                         ("answer_callback_query", answer_callback_query)]:
+        monkeypatch.setattr(ExtBot, name, method)
+    return api
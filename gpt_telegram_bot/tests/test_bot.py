@@ -0,0 +1,24 @@
+import asyncio
+
+from bot import build_application
+from config.settings import get_settings
+
+
+def test_post_shutdown_closes_http_sessions():
+    async def scenario():
+        application = build_application(get_settings())
+        handlers = {
+            handler.callback.__name__: handler.callback.__self__
+            for handler in application.handlers[0] if hasattr(handler.callback, "__self__")
+        }
+        services = [
+            handlers["handle_image_message"].image_service,
+            handlers["handle_document_message"].document_service
+        ]
+        sessions = [await service._get_session() for service in services]
+
+        await application.post_shutdown(application)
+        assert all(session.closed for session in sessions)
+        assert all(service.session is None for service in services)
+
+    asyncio.run(scenario())
@@ -0,0 +1,133 @@
+import asyncio
+import os
+import tempfile
+import time
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from config.settings import get_settings
+from services.broadcast_service import BroadcastService
+from utils.rate_limiter import TokenBucket
+
+ADMIN_CHAT_ID = 1
+
+
+class FakeBot:
+    """Bot API рассылки; errors — исключения, которые получит отправка пользователю"""
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.sent = []
+        self.sent_at = []
+        self.reports = []
+
+    async def send_message(self, chat_id: int, text: str):
+        if chat_id == ADMIN_CHAT_ID:
+            self.reports.append(text)
+            return self
+        error = self.errors.get(chat_id)
+        if error is not None:
+            self.errors[chat_id] = error[1:] if isinstance(error, list) else error
+            error = error[0] if isinstance(error, list) else error
+        if error:
+            raise error
+        self.sent.append(chat_id)
+        self.sent_at.append(time.monotonic())
+
+    async def edit_text(self, text: str):
+        self.reports.append(text)
+
+
+def make_service(monkeypatch, users, rate: float = 1000) -> BroadcastService:
+    """Сервис на отдельной базе, где есть только пользователи users"""
+    path = os.path.join(tempfile.mkdtemp(prefix="bot-tests-"), "broadcast.db")
+    monkeypatch.setattr(get_settings(), "database_url", f"sqlite:///{path}")
+    monkeypatch.setattr(get_settings(), "broadcast_rate", rate)
+    monkeypatch.setattr(get_settings(), "broadcast_batch_size", 3)
+    service = BroadcastService()
+
+    async def create_users():
+        for user_id in users:
+            await service.db_service.get_or_create_user(user_id)
+    asyncio.run(create_users())
+    return service
+
+
+async def run_broadcast(service: BroadcastService, bot: FakeBot, text: str = "Новости") -> dict:
+    broadcast_id = await service.start(bot, ADMIN_CHAT_ID, text=text)
+    await asyncio.wait_for(service._tasks[broadcast_id], 5)
+    return await service.db_service.get_broadcast(broadcast_id)
+
+
+def test_token_bucket_limits_rate_and_pauses():
+    async def scenario():
+        bucket = TokenBucket(rate=50, capacity=1)
+        started = time.monotonic()
+        for _ in range(11):
+            await bucket.acquire()
+        assert 0.18 <= time.monotonic() - started < 0.5
+
+        bucket.pause(0.2)
+        started = time.monotonic()
+        await bucket.acquire()
+        assert time.monotonic() - started >= 0.2
+
+    asyncio.run(scenario())
+
+
+def test_blocked_users_are_counted_and_skipped_next_time(monkeypatch):
+    service = make_service(monkeypatch, range(10, 17))
+    bot = FakeBot({
+        11: Forbidden("bot was blocked by the user"),
+        12: BadRequest("Chat not found"),
+        13: BadRequest("Message is too long")
+    })
+
+    async def scenario():
+        broadcast = await run_broadcast(service, bot)
+        assert (broadcast['status'], broadcast['sent'], broadcast['blocked'], broadcast['failed']) \
+            == ('done', 4, 2, 1)
+        assert bot.sent == [10, 14, 15, 16]
+        assert "завершена" in bot.reports[-1]
+
+        bot.sent.clear()
+        await run_broadcast(service, bot)
+        assert bot.sent == [10, 14, 15, 16]
+
+    asyncio.run(scenario())
+
+
+def test_retry_after_pauses_the_whole_broadcast(monkeypatch):
+    service = make_service(monkeypatch, range(20, 26))
+    bot = FakeBot({22: [RetryAfter(0), None]})
+
+    async def scenario():
+        started = time.monotonic()
+        broadcast = await run_broadcast(service, bot)
+
+        assert broadcast['sent'] == 6 and broadcast['failed'] == 0
+        assert sorted(bot.sent) == list(range(20, 26))
+        # После флуд-контроля никто не получил сообщение раньше паузы
+        assert all(sent_at - started >= 0.5 for chat_id, sent_at in zip(bot.sent, bot.sent_at)
+                   if chat_id in (22, 23, 24, 25))
+
+    asyncio.run(scenario())
+
+
+def test_interrupted_broadcast_resumes_after_checkpoint(monkeypatch):
+    service = make_service(monkeypatch, range(30, 38))
+    bot = FakeBot()
+
+    async def scenario():
+        # Процесс упал после первой пачки: статус остался running
+        broadcast_id = await service.db_service.create_broadcast(ADMIN_CHAT_ID, text="Новости")
+        await service.db_service.save_broadcast_checkpoint(broadcast_id, 32, sent=3, failed=0, blocked=0)
+
+        await service.resume_unfinished(bot)
+        await asyncio.wait_for(service._tasks[broadcast_id], 5)
+
+        broadcast = await service.db_service.get_broadcast(broadcast_id)
+        assert bot.sent == list(range(33, 38))
+        assert (broadcast['status'], broadcast['sent'], broadcast['last_user_id']) == ('done', 8, 37)
+
+    asyncio.run(scenario())
@@ -0,0 +1,78 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from services import dedup_service
+from services.database_service import DatabaseService
+from services.dedup_service import UpdateDeduplicator, idempotent, update_keys
+
+
+def db_deduplicator() -> UpdateDeduplicator:
+    deduplicator = UpdateDeduplicator()
+    deduplicator.backend = "db"
+    deduplicator._db_service = DatabaseService()
+    return deduplicator
+
+
+def update(update_id: int, chat_id: int = 7, message_id: int = None):
+    message = SimpleNamespace(chat_id=chat_id, message_id=message_id or update_id)
+    return SimpleNamespace(update_id=update_id, message=message, edited_message=None)
+
+
+def test_redelivered_update_is_claimed_once():
+    async def scenario():
+        first, second = db_deduplicator(), db_deduplicator()
+        keys = update_keys(update(601))
+
+        assert await first.claim(keys)
+        # Повтор в том же процессе отсекается памятью, в другом — хранилищем
+        assert not await first.claim(keys)
+        assert not await second.claim(keys)
+        # Тот же message_id с новым update_id — тоже дубликат
+        assert not await second.claim(update_keys(update(602, message_id=601)))
+        assert await second.claim(update_keys(update(603)))
+
+    asyncio.run(scenario())
+
+
+def test_expired_keys_are_claimed_again():
+    async def scenario():
+        deduplicator = db_deduplicator()
+        keys = update_keys(update(611))
+        deduplicator.ttl = 0
+
+        assert await deduplicator.claim(keys)
+        time.sleep(0.01)
+        assert await deduplicator.claim(keys)
+        assert await db_deduplicator().claim(keys)
+
+    asyncio.run(scenario())
+
+
+def test_failed_handler_releases_its_update(monkeypatch):
+    deduplicator = db_deduplicator()
+    monkeypatch.setattr(dedup_service, "_deduplicator", deduplicator)
+
+    class Handler:
+        def __init__(self):
+            self.calls = 0
+
+        @idempotent
+        async def handle(self, update):
+            self.calls += 1
+            if self.calls == 1:
+                raise RuntimeError("Telegram недоступен")
+
+    async def scenario():
+        handler = Handler()
+        with pytest.raises(RuntimeError):
+            await handler.handle(update(621))
+        # Повторная доставка упавшего обновления обрабатывается, а дальше — нет
+        await handler.handle(update(621))
+        await handler.handle(update(621))
+        assert handler.calls == 2
+        assert not await db_deduplicator().claim(update_keys(update(621)))
+
+    asyncio.run(scenario())
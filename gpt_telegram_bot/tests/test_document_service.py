@@ -0,0 +1,80 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+
+from config.settings import get_settings
+from services.database_service import DatabaseService
+from services.document_service import DocumentService, TextChunker
+
+
+def test_chunker_splits_on_boundaries_with_overlap():
+    chunker = TextChunker(chunk_size=100, overlap=20)
+    sentences = [f"Предложение номер {number} про документы. " for number in range(20)]
+
+    chunks = []
+    for sentence in sentences:
+        chunks.extend(chunker.feed(sentence))
+    chunks.extend(chunker.flush())
+
+    assert len(chunks) > 5
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    # Фрагменты режутся по границам предложений, а не посреди слова
+    assert all(chunk.endswith(".") for chunk in chunks)
+    # Соседние фрагменты пересекаются, последний содержит конец текста
+    assert chunks[0][-10:] in chunks[1]
+    assert chunks[-1].endswith("номер 19 про документы.")
+
+
+def test_retrieval_returns_relevant_chunks_of_own_chat_only():
+    async def scenario():
+        service = DocumentService()
+        await service.ingest_text(501, 1, "\n\n".join([
+            "Отпуск сотрудника составляет двадцать восемь календарных дней.",
+            "Пропуск в офис выдает служба безопасности на первом этаже.",
+            "Зарплата перечисляется дважды в месяц на карту сотрудника."
+        ]), file_name="правила.txt")
+        await service.ingest_text(502, 2, "Отпуск в другой компании длится четырнадцать дней.")
+
+        context = await service.build_context_message(501, "Сколько дней длится отпуск?")
+        assert "двадцать восемь" in context["content"]
+        assert "четырнадцать" not in context["content"]
+
+        chunks = await service.db_service.search_document_chunks(
+            502, service.build_search_query("отпуска"), limit=4
+        )
+        assert chunks == ["Отпуск в другой компании длится четырнадцать дней."]
+        assert await service.build_context_message(503, "Сколько дней длится отпуск?") is None
+
+    asyncio.run(scenario())
+
+
+def test_question_is_taken_from_pasted_text():
+    body = "\n\n".join(["Длинный абзац документа. " * 20] * 3)
+
+    assert DocumentService.extract_question(body + "\n\nО чем этот текст?") == "О чем этот текст?"
+    assert DocumentService.extract_question("Что здесь главное?\n\n" + body) == "Что здесь главное?"
+    assert DocumentService.extract_question(body) is None
+    assert DocumentService.extract_question("Один абзац с вопросом?") is None
+
+
+def test_old_chunk_index_is_migrated_to_chat_tokens(monkeypatch):
+    """Фрагменты из индекса без chat_key переносятся и находятся поиском по чату"""
+    path = os.path.join(tempfile.mkdtemp(prefix="bot-tests-"), "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE VIRTUAL TABLE document_chunks USING fts5(
+            content, document_id UNINDEXED, chat_id UNINDEXED, chunk_index UNINDEXED,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    ''')
+    conn.execute("INSERT INTO document_chunks VALUES ('Старый фрагмент про отпуск', 1, -100, 0)")
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(get_settings(), "database_url", f"sqlite:///{path}")
+    db_service = DatabaseService()
+
+    chunks = asyncio.run(db_service.search_document_chunks(-100, '"отпуск"'))
+    assert chunks == ["Старый фрагмент про отпуск"]
+    assert asyncio.run(db_service.search_document_chunks(100, '"отпуск"')) == []
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from services.image_service import ImageService
+
+
+class FakeDownloads:
+    """Загрузка с подготовкой, которая завершается по сигналу release"""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.error = None
+
+    async def __call__(self, bot, file_id, file_size):
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return f"data:image/jpeg;base64,{file_id}"
+
+
+def make_service() -> ImageService:
+    service = ImageService()
+    service._download_and_prepare = FakeDownloads()
+    return service
+
+
+def request(service: ImageService, file_id: str = "photo"):
+    return asyncio.ensure_future(service.get_image_data_url(None, file_id, f"unique-{file_id}"))
+
+
+def test_concurrent_requests_share_one_download():
+    async def scenario():
+        service = make_service()
+        first, second = request(service), request(service)
+        await asyncio.sleep(0)
+        service._download_and_prepare.release.set()
+
+        assert await first == await second == "data:image/jpeg;base64,photo"
+        assert service._download_and_prepare.calls == 1
+        # Следующий запрос берет результат из кэша
+        assert await request(service) == "data:image/jpeg;base64,photo"
+        assert service._download_and_prepare.calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_leader_does_not_strand_waiters():
+    """Отмена первого запроса (например, «Стоп») не оставляет второй ждать вечно"""
+
+    async def scenario():
+        service = make_service()
+        leader, waiter = request(service), request(service)
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        await asyncio.sleep(0)
+        service._download_and_prepare.release.set()
+
+        assert await asyncio.wait_for(waiter, 1) == "data:image/jpeg;base64,photo"
+        assert leader.cancelled()
+        assert service._download_and_prepare.calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_failure_reaches_all_waiters_and_is_not_cached():
+    async def scenario():
+        service = make_service()
+        downloads = service._download_and_prepare
+        downloads.error = ValueError("Изображение слишком большое")
+        first, second = request(service), request(service)
+        await asyncio.sleep(0)
+        downloads.release.set()
+
+        for waiter in (first, second):
+            with pytest.raises(ValueError):
+                await waiter
+        assert downloads.calls == 1
+
+        downloads.error = None
+        assert await request(service) == "data:image/jpeg;base64,photo"
+        assert downloads.calls == 2
+        await service.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,42 @@
+from services.model_router import AUTO_MODEL, ModelRouter
+
+ENDPOINT = "https://api.example.com/v1"
+
+
+def user(text: str) -> dict:
+    return {"role": "user", "content": text}
+
+
+def test_required_tier_follows_the_request():
+    router = ModelRouter()
+    fast, middle, strong = router.tiers
+
+    assert router.resolve("gpt-4", ENDPOINT, [user("Привет")]) == "gpt-4"
+    assert router.resolve(AUTO_MODEL, ENDPOINT, [user("Привет!")]) == fast
+    assert router.resolve(AUTO_MODEL, ENDPOINT, [user("Объясни, почему небо синее")]) == middle
+    assert router.resolve(AUTO_MODEL, ENDPOINT, [user("Напиши код: " + "подробно " * 200)]) == strong
+    # Найденные фрагменты документа (system) требуют хотя бы среднего уровня
+    assert router.resolve(AUTO_MODEL, ENDPOINT, [{"role": "system", "content": "…"}, user("А дальше?")]) == middle
+
+
+def test_depth_is_taken_from_the_whole_dialog():
+    router = ModelRouter()
+    tail = [user("Хорошо"), {"role": "assistant", "content": "Ок"}] * 4 + [user("А еще что-нибудь?")]
+
+    # По хвосту истории диалог неглубокий, но пользователь пишет уже давно
+    assert router.required_tier(tail) == 0
+    assert router.required_tier(tail, depth=7) == 1
+
+
+def test_unhealthy_and_slow_models_are_skipped():
+    router = ModelRouter()
+    fast, middle, strong = router.tiers
+    messages = [user("Как дела у проекта")]
+
+    router.record_result(fast, ENDPOINT, ok=False)
+    assert router.resolve(AUTO_MODEL, ENDPOINT, messages) == middle
+    # Карантин привязан к эндпоинту: на другом быстрая модель доступна
+    assert router.resolve(AUTO_MODEL, "https://other.example.com/v1", messages) == fast
+
+    router.record_ttft(middle, ENDPOINT, router.ttft_target * 3)
+    assert router.resolve(AUTO_MODEL, ENDPOINT, messages) == strong
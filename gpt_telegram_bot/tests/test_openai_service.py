@@ -0,0 +1,149 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+
+from services.credential_pool import CredentialPool, create_client
+from services.model_router import AUTO_MODEL, ModelRouter
+from services.openai_service import OpenAIService
+
+QUOTA_HEADERS = {
+    "x-ratelimit-remaining-requests": "100",
+    "x-ratelimit-remaining-tokens": "50000",
+    "x-ratelimit-reset-requests": "1s"
+}
+
+
+class FakeRawResponse:
+    def __init__(self, content: str):
+        self.headers = QUOTA_HEADERS
+        self.content = content
+
+    def parse(self):
+        message = SimpleNamespace(content=self.content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+class FakeClient:
+    """Клиент OpenAI без сети; failures — сколько первых запросов получат 429"""
+
+    def __init__(self, api_key: str, failures: int = 0):
+        self.api_key = api_key
+        self.failures = failures
+        self.models = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            with_raw_response=SimpleNamespace(create=self.create)
+        ))
+
+    async def create(self, **params):
+        self.models.append(params["model"])
+        await asyncio.sleep(0.01)
+        if self.failures:
+            self.failures -= 1
+            request = httpx.Request("POST", "https://api.example.com/v1/chat/completions")
+            response = httpx.Response(429, headers={"retry-after": "1"}, request=request)
+            raise openai.RateLimitError("rate limited", response=response, body=None)
+        return FakeRawResponse(f"ответ {self.api_key}")
+
+
+def make_service(failures=None) -> OpenAIService:
+    failures = failures or {}
+    service = OpenAIService()
+    service.pool = CredentialPool(
+        [("sk-key-aaaa", "https://api.example.com/v1"), ("sk-key-bbbb", "https://api.example.com/v1")],
+        lambda api_key, endpoint: FakeClient(api_key, failures.get(api_key, 0))
+    )
+    return service
+
+
+def test_generate_text_releases_credentials():
+    """После обычных (не потоковых) запросов ключи не числятся занятыми"""
+
+    async def scenario():
+        service = make_service(failures={"sk-key-aaaa": 1})
+        messages = [{"role": "user", "content": "Сделай сводку"}]
+
+        results = await asyncio.gather(*(
+            service.generate_text(messages, model="gpt-3.5-turbo", temperature=0.3, max_tokens=500)
+            for _ in range(5)
+        ))
+
+        assert all(result.startswith("ответ") for result in results)
+        for credential in service.pool.credentials:
+            assert credential.in_flight == 0
+            assert credential.outstanding_tokens == 0
+
+    asyncio.run(scenario())
+
+
+def test_rate_limited_key_fails_over_without_sleeping():
+    """429 на первом ключе сразу переходит на второй, SDK не ждет retry-after"""
+    requests = []
+
+    async def api(request: httpx.Request) -> httpx.Response:
+        api_key = request.headers["authorization"].split()[-1]
+        requests.append(api_key)
+        if api_key == "sk-key-aaaa":
+            return httpx.Response(429, headers={"retry-after": "2"}, json={
+                "error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}
+            })
+        return httpx.Response(200, headers=QUOTA_HEADERS, json={
+            "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-3.5-turbo",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": f"ответ {api_key}"}}]
+        })
+
+    async def scenario():
+        service = OpenAIService()
+        service.pool = CredentialPool(
+            [("sk-key-aaaa", "https://api.example.com/v1"), ("sk-key-bbbb", "https://api.example.com/v1")],
+            lambda api_key, endpoint: create_client(
+                api_key, endpoint, http_client=httpx.AsyncClient(transport=httpx.MockTransport(api))
+            )
+        )
+        started = time.monotonic()
+        result = await service.generate_text(
+            [{"role": "user", "content": "Привет"}], model="gpt-3.5-turbo", temperature=0.3, max_tokens=100
+        )
+        elapsed = time.monotonic() - started
+
+        assert result == "ответ sk-key-bbbb"
+        assert requests == ["sk-key-aaaa", "sk-key-bbbb"]
+        assert elapsed < 1
+        assert service.pool.credentials[0].ejected_until > time.monotonic()
+
+    asyncio.run(scenario())
+
+
+def test_auto_model_is_chosen_for_the_key_that_serves_the_request():
+    """Модель выбирается по статистике эндпоинта ключа, который выполняет запрос"""
+
+    async def scenario():
+        service = OpenAIService()
+        service.router = ModelRouter()
+        fast, middle, _ = service.router.tiers
+        service.pool = CredentialPool(
+            [("sk-key-aaaa", "https://a.example.com/v1"), ("sk-key-bbbb", "https://b.example.com/v1")],
+            lambda api_key, endpoint: FakeClient(api_key, failures=1 if api_key == "sk-key-aaaa" else 0)
+        )
+        first, second = service.pool.credentials
+        # Быстрая модель в карантине только на эндпоинте второго ключа
+        service.router.record_result(fast, second.endpoint, ok=False)
+        acquired = []
+        acquire = service.pool.acquire
+        service.pool.acquire = lambda tokens: acquired.append(tokens) or acquire(tokens)
+
+        result = await service.generate_text(
+            [{"role": "user", "content": "Привет"}], model=AUTO_MODEL, temperature=0.3, max_tokens=100
+        )
+
+        assert result == "ответ sk-key-bbbb"
+        # Один захват ключа на попытку; после 429 модель выбрана заново для второго ключа
+        assert len(acquired) == 2
+        assert first.client.models == [fast]
+        assert second.client.models == [middle]
+        assert service.router.stats(middle, second.endpoint).requests == 1
+
+    asyncio.run(scenario())
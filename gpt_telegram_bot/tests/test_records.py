@@ -0,0 +1,41 @@
+import asyncio
+import dataclasses
+
+import pytest
+
+from models.records import DEFAULT_BASE_URL, DEFAULT_MODEL, HistoryTurn, UserSettings, to_openai_messages
+from services.database_service import DatabaseService
+
+
+def test_records_are_compact_and_immutable():
+    settings = UserSettings.from_row((5, None, None, None, None, 0, None))
+
+    assert (settings.model, settings.temperature, settings.openai_base_url) == (DEFAULT_MODEL, 0.7, DEFAULT_BASE_URL)
+    assert settings.use_ai_assistant is False
+    assert not hasattr(settings, "__dict__")
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        settings.model = "gpt-4"
+
+
+def test_history_is_converted_to_openai_format_only_on_send():
+    context = {'role': 'system', 'content': 'Фрагменты документа'}
+    messages = [context, HistoryTurn("user", "Привет"), HistoryTurn("assistant", "Здравствуйте")]
+
+    assert to_openai_messages(messages) == [
+        context,
+        {'role': 'user', 'content': 'Привет'},
+        {'role': 'assistant', 'content': 'Здравствуйте'}
+    ]
+
+
+def test_settings_round_trip_through_the_database():
+    async def scenario():
+        db_service = DatabaseService()
+        await db_service.update_user_settings(901, {"model": "gpt-4", "temperature": 0.2})
+
+        settings = await db_service.get_user_settings(901)
+        assert (settings.user_id, settings.model, settings.temperature) == (901, "gpt-4", 0.2)
+        with pytest.raises(ValueError):
+            await db_service.update_user_settings(901, {"user_id": 1})
+
+    asyncio.run(scenario())
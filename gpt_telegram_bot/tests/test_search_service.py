@@ -0,0 +1,87 @@
+import asyncio
+import os
+import re
+import sqlite3
+import tempfile
+
+from config.settings import get_settings
+from services.database_service import DatabaseService
+from services.search_service import SearchService
+
+CHAT_ID = 701
+
+
+def shown(page_text: str):
+    return re.findall(r"заметка(\d+)", page_text)
+
+
+def test_pages_do_not_shift_when_new_messages_arrive():
+    async def scenario():
+        service = SearchService()
+        db_service = service.db_service
+        # Чем больше повторов слова, тем выше сообщение в выдаче
+        for number in range(12):
+            text = f"заметка{number:02d} " + "отпуск " * (number % 4 + 1) + "и другие слова " * 5
+            await db_service.save_message(CHAT_ID, CHAT_ID, "user", text)
+        await db_service.save_message(CHAT_ID + 1, CHAT_ID + 1, "user", "заметка99 отпуск")
+
+        session = service.new_session(CHAT_ID, "отпуска")
+        first, has_next = await service.fetch_page(session)
+        assert has_next and len(shown(first)) == 5
+
+        # Новые, более релевантные сообщения не попадают в уже начатую выдачу
+        for number in range(50, 55):
+            await db_service.save_message(CHAT_ID, CHAT_ID, "user", f"заметка{number} отпуск отпуск")
+
+        pages = [shown(first)]
+        while has_next:
+            session.page += 1
+            text, has_next = await service.fetch_page(session)
+            pages.append(shown(text))
+
+        assert [len(page) for page in pages] == [5, 5, 2]
+        assert sorted(sum(pages, [])) == [f"{number:02d}" for number in range(12)]
+
+        fresh = service.new_session(CHAT_ID, "отпуск")
+        text, _ = await service.fetch_page(fresh)
+        assert set(shown(text)) <= {"50", "51", "52", "53", "54"}
+
+    asyncio.run(scenario())
+
+
+def test_messages_are_indexed_in_batches_after_save():
+    async def scenario():
+        db_service = DatabaseService()
+        await db_service.index_new_messages()
+        await db_service.save_message(CHAT_ID + 2, CHAT_ID + 2, "user", "черновик бюджета")
+
+        query = SearchService.build_match_query("бюджет")
+        assert await db_service.search_message_ids(CHAT_ID + 2, query) == []
+        assert await db_service.index_new_messages(batch_size=1) == 1
+        assert len(await db_service.search_message_ids(CHAT_ID + 2, query)) == 1
+        assert await db_service.index_new_messages() == 0
+
+    asyncio.run(scenario())
+
+
+def test_index_kept_by_trigger_is_not_indexed_again(monkeypatch):
+    """База, где индекс вел триггер вставки, переходит на пакетную индексацию"""
+    path = os.path.join(tempfile.mkdtemp(prefix="bot-tests-"), "old.db")
+    monkeypatch.setattr(get_settings(), "database_url", f"sqlite:///{path}")
+    DatabaseService()
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        DROP TABLE search_index_state;
+        CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, content, chat_key) VALUES (new.id, new.content, 'x');
+        END;
+        INSERT INTO messages (user_id, chat_id, role, content) VALUES (1, 1, 'user', 'старое сообщение');
+    ''')
+    conn.close()
+
+    db_service = DatabaseService()
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT last_id FROM search_index_state").fetchone() == (1,)
+    assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts_insert'").fetchone() is None
+    conn.close()
+    assert asyncio.run(db_service.index_new_messages()) == 0
@@ -0,0 +1,103 @@
+import asyncio
+import dataclasses
+from typing import Any, Dict, List
+
+from models.records import UserSettings
+from services import settings_coordinator
+from services.settings_coordinator import SettingsCoordinator
+
+
+class FakeDatabase:
+    """Настройки в памяти; fail — сколько первых записей завершатся ошибкой"""
+
+    def __init__(self, fail: int = 0):
+        self.fail = fail
+        self.rows: Dict[int, UserSettings] = {}
+        self.writes: List[Dict[str, Any]] = []
+
+    async def get_user_settings(self, user_id: int) -> UserSettings:
+        if user_id not in self.rows:
+            self.rows[user_id] = UserSettings(user_id, "gpt-3.5-turbo", 0.7, 1000,
+                                              "https://api.openai.com/v1", False, None)
+        return self.rows[user_id]
+
+    async def update_user_settings(self, user_id: int, values: Dict[str, Any]):
+        await asyncio.sleep(0)
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError("database is locked")
+        self.writes.append(dict(values))
+        self.rows[user_id] = dataclasses.replace(self.rows[user_id], **values)
+
+
+def make_coordinator(database: FakeDatabase, delay: float = 0.05) -> SettingsCoordinator:
+    coordinator = SettingsCoordinator(database)
+    coordinator.delay = delay
+    return coordinator
+
+
+def test_series_of_presses_is_one_write_and_one_render():
+    async def scenario():
+        database = FakeDatabase()
+        coordinator = make_coordinator(database)
+        rendered = []
+
+        async def render(settings):
+            rendered.append(settings.temperature)
+
+        for _ in range(5):
+            await coordinator.mutate(1, "temperature", lambda value: round(value + 0.1, 1), render)
+        await coordinator.mutate(1, "max_tokens", lambda value: 2000, render)
+        assert database.writes == []
+        assert (await coordinator.get_settings(1)).temperature == 1.2
+
+        await asyncio.sleep(0.2)
+        assert database.writes == [{"temperature": 1.2, "max_tokens": 2000}]
+        assert rendered == [1.2]
+        assert not coordinator._tasks
+
+    asyncio.run(scenario())
+
+
+def test_failed_write_is_kept_and_retried(monkeypatch):
+    monkeypatch.setattr(settings_coordinator, "RETRY_DELAY", 0.05)
+
+    async def scenario():
+        database = FakeDatabase(fail=1)
+        coordinator = make_coordinator(database)
+
+        await coordinator.mutate(2, "model", lambda value: "gpt-4")
+        await asyncio.sleep(0.08)
+        # Запись не удалась, но значение не откатилось к старому из БД
+        assert database.writes == []
+        assert (await coordinator.get_settings(2)).model == "gpt-4"
+
+        await coordinator.mutate(2, "max_tokens", lambda value: 500)
+        await asyncio.sleep(0.2)
+        assert database.writes == [{"model": "gpt-4", "max_tokens": 500}]
+        assert database.rows[2].model == "gpt-4"
+
+    asyncio.run(scenario())
+
+
+def test_flush_all_writes_pending_changes_on_shutdown():
+    async def scenario():
+        database = FakeDatabase()
+        coordinator = make_coordinator(database, delay=60)
+
+        await coordinator.mutate(3, "temperature", lambda value: 0.2)
+        await coordinator.mutate(4, "use_ai_assistant", lambda value: True)
+        await coordinator.flush_all()
+
+        assert database.rows[3].temperature == 0.2
+        assert database.rows[4].use_ai_assistant is True
+        assert not coordinator._pending
+
+        # Если БД так и не приняла запись, остановка не зависает на повторах
+        database.fail = 1
+        await coordinator.mutate(5, "temperature", lambda value: 0.9)
+        await coordinator.flush_all()
+        assert not coordinator._pending
+        assert database.rows[5].temperature == 0.7
+
+    asyncio.run(scenario())
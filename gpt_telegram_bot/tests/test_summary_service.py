@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from config.settings import get_settings
+from services.openai_service import ERROR_PREFIX
+from services.summary_service import SummaryError, SummaryService
+
+CHAT_ID = 801
+
+
+class FakeOpenAI:
+    """Модель, которая отвечает на фрагменты со словом «сбой» ошибкой, а на остальные — долго"""
+
+    def __init__(self, delay: float = 5.0):
+        self.delay = delay
+        self.started = 0
+        self.cancelled = 0
+
+    async def generate_text(self, messages, **kwargs):
+        self.started += 1
+        text = messages[-1]['content']
+        if "сбой" in text:
+            await asyncio.sleep(0.01)
+            return f"{ERROR_PREFIX}: 500"
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return f"сводка: {len(text)}"
+
+
+def test_failed_part_cancels_the_other_map_requests(monkeypatch):
+    monkeypatch.setattr(get_settings(), "summary_chunk_chars", 100)
+
+    async def scenario():
+        model = FakeOpenAI()
+        service = SummaryService(model)
+        for number in range(4):
+            text = ("сбой " if number == 1 else "обычное сообщение ") * 10
+            await service.db_service.save_message(CHAT_ID, CHAT_ID, "user", text)
+
+        with pytest.raises(SummaryError):
+            await asyncio.wait_for(service.summarize_chat(CHAT_ID, "gpt-3.5-turbo"), 2)
+        assert model.started == 4
+        assert model.cancelled == 3
+
+    asyncio.run(scenario())
+
+
+def test_failed_group_cancels_the_other_reduce_requests(monkeypatch):
+    monkeypatch.setattr(get_settings(), "summary_fan_in", 2)
+
+    async def scenario():
+        model = FakeOpenAI()
+        service = SummaryService(model)
+
+        with pytest.raises(SummaryError):
+            await asyncio.wait_for(service._reduce(["сбой", "а", "б", "в", "г", "д"], "gpt-3.5-turbo"), 2)
+        assert model.started == 3
+        assert model.cancelled == 2
+
+    asyncio.run(scenario())
+
+
+def test_chunks_fit_the_limit_with_line_breaks(monkeypatch):
+    monkeypatch.setattr(get_settings(), "summary_chunk_chars", 100)
+
+    async def scenario():
+        service = SummaryService(FakeOpenAI(delay=0))
+        for text in ["а" * 44, "б" * 44, "в" * 500, "г" * 10]:
+            await service.db_service.save_message(CHAT_ID + 1, CHAT_ID + 1, "user", text)
+
+        chunks = [text async for _, _, text in service._iter_chunks(CHAT_ID + 1, 0)]
+        # "user: " + 44 символа дважды — это 100 символов и перевод строки
+        assert [len(chunk) for chunk in chunks] == [50, 50, 100, 16]
+
+    asyncio.run(scenario())
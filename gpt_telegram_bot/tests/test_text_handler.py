@@ -0,0 +1,193 @@
+import asyncio
+import itertools
+
+from telegram import Update
+from telegram.ext import CallbackQueryHandler
+
+from bot import build_application
+from config.settings import get_settings
+
+USER_ID = 42
+_ids = itertools.count(1)
+
+
+def text_update(application, text: str) -> Update:
+    return Update.de_json({"update_id": next(_ids), "message": {
+        "message_id": next(_ids), "date": 0, "text": text,
+        "chat": {"id": USER_ID, "type": "private"},
+        "from": {"id": USER_ID, "is_bot": False, "first_name": "Тест"}
+    }}, application.bot)
+
+
+def stop_update(application, message_id: int) -> Update:
+    return Update.de_json({"update_id": next(_ids), "callback_query": {
+        "id": str(next(_ids)), "chat_instance": "1", "data": "generation_stop",
+        "from": {"id": USER_ID, "is_bot": False, "first_name": "Тест"},
+        "message": {"message_id": message_id, "date": 0,
+                    "chat": {"id": USER_ID, "type": "private"}}
+    }}, application.bot)
+
+
+async def wait_for(condition, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "условие не выполнилось вовремя"
+        await asyncio.sleep(0.01)
+
+
+async def start_application():
+    """Настоящее приложение из bot.py; обновления идут через update_queue, как в polling"""
+    application = build_application(get_settings())
+    await application.initialize()
+    await application.start()
+    text_handler = next(
+        handler.callback.__self__ for handler in application.handlers[0]
+        if isinstance(handler, CallbackQueryHandler)
+        and handler.callback.__name__ == "handle_stop_callback"
+    )
+    return application, text_handler
+
+
+def endless_stream(closed: asyncio.Event):
+    async def stream(**kwargs):
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield "слово "
+        finally:
+            closed.set()
+    return stream
+
+
+def running_generations(text_handler):
+    return list(text_handler.generations.in_chat(USER_ID))
+
+
+def test_stop_callback_cancels_running_stream(bot_api):
+    """«Стоп», пришедший во время потока, прерывает его, а не ждет конца ответа"""
+
+    async def scenario():
+        application, text_handler = await start_application()
+        stream_closed = asyncio.Event()
+        text_handler.openai_service.stream_chat_completion = endless_stream(stream_closed)
+
+        await application.update_queue.put(text_update(application, "Привет"))
+        await wait_for(lambda: "edit_message_reply_markup" in bot_api.names())
+
+        # Кнопка «Стоп» появляется только вместе с зарегистрированной генерацией
+        name, _, placeholder_markup = bot_api.calls[0]
+        assert name == "send_message" and placeholder_markup is None
+        generation, = running_generations(text_handler)
+
+        await application.update_queue.put(stop_update(application, generation.message_id))
+        await asyncio.wait_for(stream_closed.wait(), 5)
+        await wait_for(lambda: not running_generations(text_handler))
+
+        assert "Генерация остановлена" in bot_api.texts("answer_callback_query")
+        final_name, final_text, final_markup = [
+            call for call in bot_api.calls if call[0] == "edit_message_text"
+        ][-1]
+        assert final_text.endswith("⏹ Генерация остановлена")
+        assert final_markup is None
+        await application.stop()
+        await application.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_messages_of_one_chat_are_processed_in_order(bot_api, monkeypatch):
+    """Второе сообщение ждет конца первого ответа; с SUPERSEDE_GENERATIONS — прерывает идущий"""
+    monkeypatch.setattr(get_settings(), "supersede_generations", False)
+
+    async def scenario():
+        application, text_handler = await start_application()
+        first_closed = asyncio.Event()
+        text_handler.openai_service.stream_chat_completion = endless_stream(first_closed)
+
+        await application.update_queue.put(text_update(application, "Первый"))
+        await wait_for(lambda: running_generations(text_handler))
+        await application.update_queue.put(text_update(application, "Второй"))
+        await asyncio.sleep(0.2)
+
+        # Обработчик сообщений блокирующий: второе сообщение еще в очереди чата
+        assert bot_api.texts("send_message") == ["Генерирую ответ..."]
+        assert application.update_processor.current_concurrent_updates == 2
+
+        monkeypatch.setattr(get_settings(), "supersede_generations", True)
+        await application.update_queue.put(text_update(application, "Третий"))
+
+        # Третье сообщение прервало идущий ответ, второе получило свой ответ
+        await asyncio.wait_for(first_closed.wait(), 5)
+        assert any(text.endswith("⏭ Ответ прерван новым сообщением")
+                   for text in bot_api.texts("edit_message_text"))
+
+        for expected_placeholders in (2, 3):
+            await wait_for(lambda: len(bot_api.texts("send_message")) == expected_placeholders)
+            await wait_for(lambda: running_generations(text_handler))
+            generation, = running_generations(text_handler)
+            await application.update_queue.put(stop_update(application, generation.message_id))
+            await wait_for(lambda: generation.finished.is_set())
+
+        await wait_for(lambda: application.update_processor.current_concurrent_updates == 0)
+        await application.stop()
+        await application.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_pasted_text_with_question_is_answered_from_its_chunks(bot_api):
+    """Длинный текст индексируется, а вопрос в его конце получает ответ по фрагментам"""
+
+    async def scenario():
+        application, text_handler = await start_application()
+        requests = []
+
+        async def stream(messages, **kwargs):
+            requests.append(messages)
+            yield "Двадцать восемь дней"
+
+        text_handler.openai_service.stream_chat_completion = stream
+        document = "\n\n".join(
+            ["Общие положения внутреннего распорядка компании. " * 10] * 4
+            + ["Ежегодный отпуск составляет двадцать восемь календарных дней."]
+        )
+        assert len(document) >= get_settings().document_paste_threshold
+
+        await application.update_queue.put(
+            text_update(application, document + "\n\nСколько дней длится отпуск?")
+        )
+        await wait_for(lambda: requests and "Двадцать восемь дней" in bot_api.texts("edit_message_text"))
+
+        context, *_, question = requests[0]
+        assert context["role"] == "system" and "двадцать восемь" in context["content"]
+        assert question.content == "Сколько дней длится отпуск?"
+        # Сам текст не попадает в историю, вместо него — пометка о документе
+        assert all(len(turn.content) < 1000 for turn in requests[0][1:])
+        await application.stop()
+        await application.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_group_mention_is_answered_without_the_mention(bot_api):
+    async def scenario():
+        application, text_handler = await start_application()
+        requests = []
+
+        async def stream(messages, **kwargs):
+            requests.append(messages)
+            yield "Привет, группа"
+
+        text_handler.openai_service.stream_chat_completion = stream
+        await application.update_queue.put(Update.de_json({"update_id": next(_ids), "message": {
+            "message_id": next(_ids), "date": 0, "text": "@test_bot как дела?",
+            "chat": {"id": -1001, "type": "supergroup", "title": "Группа"},
+            "from": {"id": USER_ID, "is_bot": False, "first_name": "Тест"}
+        }}, application.bot))
+        await wait_for(lambda: "Привет, группа" in bot_api.texts("edit_message_text"))
+
+        assert requests[0][-1].content == "как дела?"
+        await application.stop()
+        await application.shutdown()
+
+    asyncio.run(scenario())
@@ -0,0 +1,176 @@
+import asyncio
+from typing import Dict, List
+
+from telegram.ext import CallbackQueryHandler
+
+from bot import build_application
+from config.settings import get_settings
+from services.webhook_server import WebhookServer, json_dumps
+
+SECRET = "test-secret"
+CHAT_ID = 9
+
+
+async def post(server: WebhookServer, data: dict) -> int:
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": server.path,
+        "headers": [(b"x-telegram-bot-api-secret-token", SECRET.encode())]
+    }
+    status = {}
+
+    async def receive():
+        return {"type": "http.request", "body": json_dumps(data), "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+
+    await server(scope, receive, send)
+    return status["code"]
+
+
+def message(update_id: int, chat_id: int = CHAT_ID) -> dict:
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": f"вопрос {update_id}",
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Тест"}
+    }}
+
+
+def callback(update_id: int, message_id: int, chat_id: int = CHAT_ID) -> dict:
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "chat_instance": "1", "data": "generation_stop",
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Тест"},
+        "message": {"message_id": message_id, "date": 0, "chat": {"id": chat_id, "type": "private"}}
+    }}
+
+
+class GatedModel:
+    """Поток модели, который отвечает на «вопрос N», только когда открыт gate(N)"""
+
+    def __init__(self):
+        self.started: List[int] = []
+        self.running = 0
+        self.max_running = 0
+        self.gates: Dict[int, asyncio.Event] = {}
+
+    def gate(self, update_id: int) -> asyncio.Event:
+        return self.gates.setdefault(update_id, asyncio.Event())
+
+    async def stream(self, messages, **kwargs):
+        update_id = int(messages[-1].content.split()[-1])
+        self.started.append(update_id)
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await self.gate(update_id).wait()
+            yield f"ответ {update_id}"
+        finally:
+            self.running -= 1
+
+
+async def start_server(monkeypatch, concurrency: int = 256, queue_size: int = 1000):
+    """Сервер поверх настоящего приложения из bot.py"""
+    monkeypatch.setattr(get_settings(), "update_concurrency", concurrency)
+    monkeypatch.setattr(get_settings(), "supersede_generations", False)
+    application = build_application(get_settings())
+    await application.initialize()
+    text_handler = next(
+        handler.callback.__self__ for handler in application.handlers[0]
+        if isinstance(handler, CallbackQueryHandler)
+        and handler.callback.__name__ == "handle_stop_callback"
+    )
+    model = GatedModel()
+    text_handler.openai_service.stream_chat_completion = model.stream
+
+    server = WebhookServer(application, SECRET, queue_size=queue_size)
+    await server.start()
+    return server, text_handler, model
+
+
+async def wait_for(condition, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "условие не выполнилось вовремя"
+        await asyncio.sleep(0.01)
+
+
+def test_stop_is_not_queued_behind_running_generation(bot_api, monkeypatch):
+    """Нажатие «Стоп» обрабатывается, пока сообщение того же чата еще выполняется"""
+
+    async def scenario():
+        server, text_handler, model = await start_server(monkeypatch)
+
+        assert await post(server, message(101)) == 200
+        await wait_for(lambda: text_handler.generations.in_chat(CHAT_ID))
+        generation, = text_handler.generations.in_chat(CHAT_ID)
+
+        assert await post(server, callback(102, generation.message_id)) == 200
+        await asyncio.wait_for(generation.finished.wait(), 5)
+        assert "Генерация остановлена" in bot_api.texts("answer_callback_query")
+
+        await server.stop()
+        assert server.queue_depth() == 0
+        await server.application.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_chat_order_and_concurrency_limit(bot_api, monkeypatch):
+    """Обновления чата идут по порядку, чаты — параллельно, но не больше UPDATE_CONCURRENCY"""
+
+    async def scenario():
+        server, text_handler, model = await start_server(monkeypatch, concurrency=2)
+
+        for update_id in (201, 202, 203):
+            assert await post(server, message(update_id, chat_id=CHAT_ID)) == 200
+        for update_id in range(210, 215):
+            assert await post(server, message(update_id, chat_id=update_id)) == 200
+
+        # Чат CHAT_ID занял одно место первым сообщением, второе место — другой чат;
+        # сообщения 202 и 203 ждут в очереди чата и мест не занимают
+        await wait_for(lambda: len(model.started) == 2)
+        await asyncio.sleep(0.1)
+        # Порядок между чатами не задан — только внутри чата
+        assert sorted(model.started) == [201, 210] and model.running == 2
+        assert server.queue_depth() == 8
+        assert server.processor.active_chats() == 6
+
+        for update_id in range(210, 215):
+            model.gate(update_id).set()
+        await wait_for(lambda: len(model.started) == 6)
+        assert sorted(model.started[2:]) == [211, 212, 213, 214]
+
+        for update_id in (201, 202, 203):
+            model.gate(update_id).set()
+        await server.stop()
+
+        assert model.started[6:] == [202, 203]
+        assert model.max_running == 2
+        assert server.queue_depth() == 0 and server.processor.active_chats() == 0
+        await server.application.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_overflow_is_rejected_with_retry(bot_api, monkeypatch):
+    """Нажатия кнопок учитываются в том же лимите принятых обновлений"""
+
+    async def scenario():
+        server, text_handler, model = await start_server(monkeypatch, queue_size=2)
+
+        assert await post(server, message(301)) == 200
+        await wait_for(lambda: text_handler.generations.in_chat(CHAT_ID))
+        generation, = text_handler.generations.in_chat(CHAT_ID)
+        assert await post(server, message(302)) == 200
+        assert await post(server, callback(303, generation.message_id)) == 503
+
+        model.gate(301).set()
+        model.gate(302).set()
+        await server.stop()
+        assert model.started == [301, 302]
+        await server.application.shutdown()
+
+    asyncio.run(scenario())
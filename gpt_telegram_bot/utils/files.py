@@ -0,0 +1,28 @@
+import io
+from typing import AsyncGenerator
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+async def iter_telegram_file(bot, session, file_id: str, max_bytes: int,
+                             chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> AsyncGenerator[bytes, None]:
+    """Потоковая загрузка файла из Telegram по частям"""
+    telegram_file = await bot.get_file(file_id)
+    file_path = telegram_file.file_path
+
+    # Локальный Bot API сервер отдает путь к файлу, а не URL
+    if not file_path.startswith(("http://", "https://")):
+        buffer = io.BytesIO()
+        await telegram_file.download_to_memory(out=buffer)
+        if buffer.tell() > max_bytes:
+            raise ValueError("Файл слишком большой")
+        yield buffer.getvalue()
+        return
+
+    received = 0
+    async with session.get(file_path) as response:
+        response.raise_for_status()
+        async for chunk in response.content.iter_chunked(chunk_size):
+            received += len(chunk)
+            if received > max_bytes:
+                raise ValueError("Файл слишком большой")
+            yield chunk
@@ -0,0 +1,61 @@
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+def _key(name: str, labels: Dict[str, object]) -> str:
+    """Имя метрики с метками в формате Prometheus"""
+    if not labels:
+        return name
+    rendered = ",".join(f'{label}="{value}"' for label, value in sorted(labels.items()))
+    return f"{name}{{{rendered}}}"
+
+class Metrics:
+    """Простой реестр счетчиков, gauge-метрик и таймингов для /metrics"""
+
+    def __init__(self):
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, Callable[[], float]] = {}
+        self._timings: Dict[str, List[float]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        """Увеличивает счетчик"""
+        self._counters[_key(name, labels)] += value
+
+    def gauge(self, name: str, getter: Callable[[], float], **labels):
+        """Регистрирует gauge-метрику, значение которой вычисляется при чтении"""
+        self._gauges[_key(name, labels)] = getter
+
+    def observe(self, name: str, seconds: float, **labels):
+        """Добавляет замер длительности"""
+        key = _key(name, labels)
+        timing = self._timings.get(key)
+        if timing is None:
+            self._timings[key] = [1, seconds, seconds]
+        else:
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+
+    def get(self, name: str, **labels) -> float:
+        """Текущее значение счетчика"""
+        return self._counters.get(_key(name, labels), 0.0)
+
+    def render(self) -> str:
+        """Текстовый формат экспозиции Prometheus"""
+        lines = []
+        for key, value in sorted(self._counters.items()):
+            lines.append(f"{key} {value:g}")
+        for key, getter in sorted(self._gauges.items()):
+            try:
+                lines.append(f"{key} {float(getter()):g}")
+            except Exception:
+                continue
+        for key, (count, total, maximum) in sorted(self._timings.items()):
+            name, _, labels = key.partition("{")
+            suffix = "{" + labels if labels else ""
+            lines.append(f"{name}_count{suffix} {count:g}")
+            lines.append(f"{name}_sum{suffix} {total:.6f}")
+            lines.append(f"{name}_max{suffix} {maximum:.6f}")
+        return "\n".join(lines) + "\n"
+
+# Общий реестр метрик процесса
+metrics = Metrics()
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Optional
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse_stack(frame) -> str:
+    """Стек в свернутом формате flamegraph: корень;...;лист"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """Семплирующий профайлер потока event loop с выводом в формате flamegraph"""
+
+    def __init__(self, output_dir: str, interval: float = 0.01):
+        self.output_dir = output_dir
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def sample(self, thread_id: int, seconds: float) -> Optional[str]:
+        """Снимает стеки потока thread_id в течение seconds и пишет файл (блокирующий вызов)"""
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            stacks: Counter = Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                frame = sys._current_frames().get(thread_id)
+                if frame is not None:
+                    stacks[_collapse_stack(frame)] += 1
+                    del frame
+                time.sleep(self.interval)
+            return self._write(stacks)
+        finally:
+            self._lock.release()
+
+    async def profile(self, seconds: float) -> Optional[str]:
+        """Профилирует текущий event loop; None, если профайлер уже запущен"""
+        thread_id = threading.get_ident()
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.sample, thread_id, seconds
+        )
+
+    def start_background(self, seconds: float):
+        """Запуск профилирования текущего потока в фоне (переключатель через env)"""
+        thread_id = threading.get_ident()
+
+        def run():
+            path = self.sample(thread_id, seconds)
+            if path:
+                logger.info("Профиль сохранен: %s", path)
+
+        threading.Thread(target=run, name="sampling-profiler", daemon=True).start()
+
+    def _write(self, stacks: Counter) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, time.strftime("profile-%Y%m%d-%H%M%S.folded"))
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+class LoopBlockDetector:
+    """Находит блокирующие вызовы в event loop (например, синхронный sqlite3)
+
+    Корутина-пульс обновляет отметку времени; сторожевой поток, заметив,
+    что отметка устарела дольше порога, логирует стек потока event loop.
+    """
+
+    def __init__(self, threshold: float, interval: float = 0.05):
+        self.threshold = threshold
+        self.interval = interval
+        self._heartbeat = time.monotonic()
+        self._thread_id = None
+        self._task = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Запуск из работающего event loop"""
+        self._thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._pulse())
+        threading.Thread(target=self._watch, name="loop-block-detector", daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _pulse(self):
+        while True:
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self):
+        reported = False
+        while not self._stopped.wait(self.interval):
+            lag = time.monotonic() - self._heartbeat - self.interval
+            if lag < self.threshold:
+                reported = False
+                continue
+            if reported:
+                continue
+            # Один отчет на каждую блокировку
+            reported = True
+            metrics.inc("event_loop_blocked_total")
+            frame = sys._current_frames().get(self._thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            del frame
+            logger.warning(
+                "Event loop заблокирован уже %.0f мс, текущий стек:\n%s", lag * 1000, stack
+            )
@@ -0,0 +1,95 @@
+import contextvars
+import functools
+import logging
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from config.settings import get_settings
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("update_trace", default=None)
+
+
+class UpdateTrace:
+    """Разбивка обработки одного обновления по этапам"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        # (этап, смещение от начала, длительность) в секундах
+        self.spans: List[Tuple[str, float, float]] = []
+
+    def add(self, name: str, started: float, duration: float):
+        self.spans.append((name, started - self.started, duration))
+
+    def format(self, total: float) -> str:
+        lines = [f"Медленное обновление {self.name}: {total * 1000:.0f} мс"]
+        for name, offset, duration in sorted(self.spans, key=lambda item: item[1]):
+            lines.append(f"  +{offset * 1000:7.1f} мс  {name:<28} {duration * 1000:8.1f} мс")
+        return "\n".join(lines)
+
+
+def current_trace() -> Optional[UpdateTrace]:
+    """Активная трасса обновления, если она есть"""
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str):
+    """Замер этапа внутри активной трассы (без трассы ничего не делает)"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, started, time.perf_counter() - started)
+
+
+def mark(name: str):
+    """Отметка момента времени (например, первого токена) в активной трассе"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, time.perf_counter(), 0.0)
+
+
+def traced(name: str):
+    """Декоратор корутины: замеряет ее как этап активной трассы"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_update(name: str):
+    """Декоратор обработчика: логирует разбивку по этапам, если обновление медленное"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            # Вложенный обработчик (например, группа -> текст) — просто этап
+            if _current_trace.get() is not None:
+                with span(name):
+                    return await func(*args, **kwargs)
+
+            threshold = get_settings().slow_update_ms / 1000
+            trace = UpdateTrace(name)
+            token = _current_trace.set(trace)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _current_trace.reset(token)
+                total = time.perf_counter() - trace.started
+                metrics.observe("update_seconds", total, handler=name)
+                if threshold and total >= threshold:
+                    metrics.inc("slow_updates_total", handler=name)
+                    logger.warning(trace.format(total))
+        return wrapper
+    return decorator